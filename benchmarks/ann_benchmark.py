@@ -0,0 +1,90 @@
+"""
+ann_benchmark.py
+
+Measures the recall and latency of the IVF index behind feature-based /recommend against
+exact search, which scores every song. Recall@k is the share of the exact k nearest
+songs that the index also returns, averaged over queries centred on random songs.
+
+Usage (from the repository root):
+    python -m benchmarks.ann_benchmark [rows ...]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+sys.path.append("./")
+
+from benchmarks.catalogs import synthetic_songs  # noqa: E402
+from src.ann_index import IVFIndex  # noqa: E402
+from src.catalog import SongCatalog  # noqa: E402
+from src.recommender import (  # noqa: E402
+    feature_centroid,
+    feature_matrix,
+    feature_points,
+    feature_scores,
+    nearest_rows,
+)
+
+SIZES = (100_000, 1_000_000)
+METRIC = "euclidean"
+N_PROBES = (1, 2, 4, 8, 16, 32)
+QUERIES = 50
+K = 10
+
+
+def timed(fn):
+    """Returns fn()'s result and its wall time in milliseconds."""
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1e3
+
+
+def main(sizes):
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>9} {'search':<14} {'recall@10':>10} {'latency (ms)':>13}")
+    for rows in sizes:
+        matrix = feature_matrix(SongCatalog.from_frame(synthetic_songs(rows)), METRIC)
+        index, build_ms = timed(lambda: IVFIndex.build(feature_points(matrix, METRIC)))
+        print(
+            f"{rows:>9} {'build':<14} {'':>10} {build_ms:>13.1f}   ({index.n_lists} "
+            "lists)"
+        )
+
+        centroids = [
+            feature_centroid(matrix, rng.choice(rows, 3, replace=False), METRIC)
+            for _ in range(QUERIES)
+        ]
+        exact = []
+        total_ms = 0.0
+        for centroid in centroids:
+            nearest, ms = timed(
+                lambda: nearest_rows(feature_scores(matrix, centroid, METRIC), K)
+            )
+            exact.append(set(nearest.tolist()))
+            total_ms += ms
+        print(f"{rows:>9} {'exact':<14} {1:>10.3f} {total_ms / QUERIES:>13.2f}")
+
+        for n_probe in N_PROBES:
+            found = 0
+            total_ms = 0.0
+            for centroid, truth in zip(centroids, exact):
+
+                def search():
+                    candidates = index.candidates(centroid, n_probe)
+                    scores = feature_scores(matrix[candidates], centroid, METRIC)
+                    return candidates[nearest_rows(scores, K)]
+
+                nearest, ms = timed(search)
+                found += len(truth.intersection(nearest.tolist()))
+                total_ms += ms
+            print(
+                f"{rows:>9} {f'ivf n_probe={n_probe}':<14} "
+                f"{found / (K * QUERIES):>10.3f}"
+                f" {total_ms / QUERIES:>13.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
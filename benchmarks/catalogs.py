@@ -0,0 +1,39 @@
+"""
+catalogs.py
+
+Synthetic song catalogs for the benchmarks, shaped like the datasets in ./data: a
+track_name, an artist (under both the "artist" and "artist_name" column names), a genre
+and the numeric audio features of songs.csv.
+"""
+
+import numpy as np
+import pandas as pd
+
+FEATURES = ("bpm", "nrgy", "dnce", "dB", "live", "val", "dur", "acous", "spch", "pop")
+
+
+def synthetic_songs(rows, genres=50, seed=0):
+    """Builds a synthetic catalog.
+
+    Args:
+        rows (int): How many songs to generate.
+        genres (int, optional): How many distinct genres to spread them over.
+        seed (int, optional): Seed for the random generator.
+
+    Returns:
+        DataFrame: The generated songs.
+    """
+    rng = np.random.default_rng(seed)
+    artists = max(rows // 10, 1)
+    artist_ids = rng.integers(0, artists, rows)
+    songs = pd.DataFrame(
+        {
+            "track_name": [f"Track {i}" for i in range(rows)],
+            "artist_name": [f"Artist {i}" for i in artist_ids],
+            "genre": [f"genre {i}" for i in rng.zipf(1.5, rows) % genres],
+        }
+    )
+    songs["artist"] = songs["artist_name"]
+    for feature in FEATURES:
+        songs[feature] = rng.integers(0, 100, rows)
+    return songs
@@ -0,0 +1,111 @@
+"""
+categorical_benchmark.py
+
+Measures what storing the genre and artist columns as pandas Categoricals (see
+catalog.CATEGORICAL_COLUMNS) saves, on synthetic catalogs of growing size: the memory
+those columns take as one string per row and as integer codes into a shared table of
+strings, and the time taken by the genre filter behind /recommend in three versions.
+These are the original boolean masks built by comparing strings with Series.isin, the
+row ids of the inverted indexes intersected with np.isin, and the current lookup of
+integer codes (SongCatalog.rows_by_genres).
+
+Usage (from the repository root):
+    python -m benchmarks.categorical_benchmark [rows ...]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+sys.path.append("./")
+
+from benchmarks.catalogs import synthetic_songs  # noqa: E402
+from src.catalog import CATEGORICAL_COLUMNS, SongCatalog  # noqa: E402
+from src.catalog_index import ColumnIndex  # noqa: E402
+
+SIZES = (600, 28_372, 1_000_000)
+RUNS = 20
+
+
+def string_isin_filter(songs, genres, artists, tracks):
+    """The filter of generate_recommendations before the catalog had indexes."""
+    return np.flatnonzero(
+        songs["genre"].isin(genres)
+        & ~songs["artist_name"].isin(artists)
+        & ~songs["track_name"].isin(tracks)
+    )
+
+
+def row_isin_filter(indexes, genres, artists, tracks):
+    """SongCatalog.rows_by_genres before the genre and artist columns were categorical:
+    the rows of the genres are merged by sorting, and the left out rows are searched for
+    with np.isin."""
+    rows = np.sort(np.concatenate([indexes["genre"].rows(genre) for genre in genres]))
+    excluded = np.concatenate(
+        (
+            indexes["artist_name"].rows_for(artists),
+            indexes["track_name"].rows_for(tracks),
+        )
+    )
+    return rows[~np.isin(rows, excluded)]
+
+
+def timed(fn, runs=RUNS):
+    """Returns the mean wall time of fn() in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1e3
+
+
+def column_mb(songs, columns):
+    """Returns the memory taken by the given columns, strings included, in megabytes."""
+    return songs[list(columns)].memory_usage(index=False, deep=True).sum() / 2**20
+
+
+def main(sizes):
+    print(
+        f"{'rows':>9} {'strings (MB)':>13} {'categorical (MB)':>17}"
+        f" {'str isin (ms)':>14} {'row isin (ms)':>14} {'codes (ms)':>11}"
+    )
+    for rows in sizes:
+        songs = synthetic_songs(rows)
+        columns = [column for column in CATEGORICAL_COLUMNS if column in songs.columns]
+        strings = songs.astype({column: str for column in columns})
+        catalog = SongCatalog.from_frame(songs)
+
+        # Three selected songs from the most common genres, as /poll tends to pick
+        picked = catalog.songs.iloc[[0, 1, 2]]
+        genres = set(catalog.songs["genre"].value_counts().index[:3])
+        artists = list(picked["artist_name"])
+        tracks = list(picked["track_name"])
+
+        indexes = {
+            column: ColumnIndex(strings[column].to_numpy(dtype=object))
+            for column in ("genre", "artist_name")
+        }
+        indexes["track_name"] = catalog.index("track_name")
+        # build the indexes outside the timings
+        catalog.rows_by_genres(genres, artists, tracks)
+
+        expected = string_isin_filter(strings, genres, artists, tracks)
+        assert np.array_equal(
+            row_isin_filter(indexes, genres, artists, tracks), expected
+        )
+        assert np.array_equal(catalog.rows_by_genres(genres, artists, tracks), expected)
+
+        string_isin = timed(
+            lambda: string_isin_filter(strings, genres, artists, tracks)
+        )
+        row_isin = timed(lambda: row_isin_filter(indexes, genres, artists, tracks))
+        codes = timed(lambda: catalog.rows_by_genres(genres, artists, tracks))
+        print(
+            f"{rows:>9} {column_mb(strings, columns):>13.2f} "
+            f"{column_mb(catalog.songs, columns):>17.2f}"
+            f" {string_isin:>14.2f} {row_isin:>14.2f} {codes:>11.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,506 @@
+"""
+command_benchmark.py
+
+Drives the bot's commands end to end, the way discord.py would run them
+(cog_before_invoke, the command, cog_after_invoke), against fake Discord contexts, a
+fake voice client and a stub yt_dlp, and times them. Nothing touches the network, FFmpeg
+or the datasets on disk: the catalog is synthetic (see catalogs.py) and every resolved
+song gets a made-up stream URL after an optional simulated lookup delay.
+
+Queue commands (/queue, /insert, /move, /view, /next) are swept over queue sizes while a
+song plays, and the session commands (/poll, /recommend) over catalog sizes. Buttons are
+clicked as a user would: /poll selects its songs, /recommend queues a song, asks for new
+recommendations and stops, and /view, when the queue takes more than a page, flips to
+the next page and lets its buttons expire. These commands return as soon as their
+message is sent, so their clicks are awaited as part of the run. /next is timed until
+the next song starts playing.
+
+The results are written as JSON, so that a run on one commit can be compared with a run
+on another:
+
+    python -m benchmarks.command_benchmark --output before.json
+    (check out the other commit)
+    python -m benchmarks.command_benchmark --compare before.json
+
+--compare prints the ratio of every median to the baseline's and exits with status 1 if
+any command got slower than --threshold times its baseline.
+
+Usage (from the repository root):
+    python -m benchmarks.command_benchmark [--queue-sizes N ...] [--catalog-sizes N ...]
+        [--runs N] [--resolve-ms MS] [--output PATH] [--compare PATH] [--threshold
+        RATIO]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from itertools import count
+from unittest.mock import patch
+
+sys.path.append("./")
+
+import discord  # noqa: E402
+
+import src.song_queue_cog as song_queue_cog  # noqa: E402
+from benchmarks.catalogs import synthetic_songs  # noqa: E402
+from src.bot_state import BotState  # noqa: E402
+from src.catalog import MUSIC_CSV, SONGS_CSV, SongCatalog, use_catalog  # noqa: E402
+from src.prefetch import Prefetcher  # noqa: E402
+from src.recommend_cog import RecommendCog  # noqa: E402
+from src.resolver import AudioResolver  # noqa: E402
+from src.sessions import sessions  # noqa: E402
+from src.song import Song  # noqa: E402
+from src.song_queue_cog import SongQueueCog  # noqa: E402
+
+QUEUE_SIZES = (10, 1000, 10_000)
+CATALOG_SIZES = (1000, 100_000)
+RUNS = 20
+THRESHOLD = 1.25
+GUILD_ID = 1
+
+_message_ids = count(1)
+
+
+class StubYoutubeDL:
+    """Answers extract_info like yt_dlp, after an optional delay standing in for the
+    network."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def extract_info(self, url, download=False):
+        if self.delay:
+            time.sleep(self.delay)
+        info = {
+            "id": url[-11:],
+            "url": f"https://stream.invalid/{abs(hash(url))}",
+            "title": url,
+        }
+        return {"entries": [info]} if url.startswith("ytsearch:") else info
+
+
+class FakeAudio(discord.AudioSource):
+    """Stands in for discord.FFmpegPCMAudio, without starting FFmpeg."""
+
+    def __init__(self, url, **options):
+        self.url = url
+
+    def read(self):
+        return b""
+
+
+class FakeVoiceClient:
+    """Mimics discord.VoiceClient. Stopping a track runs its "after" callback, and every
+    play() is signalled."""
+
+    def __init__(self):
+        self.after = None
+        self.started = asyncio.Event()
+
+    def is_connected(self):
+        return True
+
+    def is_paused(self):
+        return False
+
+    def is_playing(self):
+        return self.after is not None
+
+    def play(self, source, after):
+        source.read()  # the first packet
+        self.after = after
+        self.started.set()
+
+    def stop(self):
+        after, self.after = self.after, None
+        if after is not None:
+            after(None)
+
+
+class FakeMessage:
+    def __init__(self):
+        self.id = next(_message_ids)
+
+    async def edit(self, **kwargs):
+        pass
+
+
+class FakeResponse:
+    async def send_message(self, *args, **kwargs):
+        pass
+
+    async def defer(self):
+        pass
+
+    async def edit_message(self, **kwargs):
+        pass
+
+
+class FakeInteraction:
+    def __init__(self, user, message):
+        self.user = user
+        self.message = message
+        self.response = FakeResponse()
+
+
+class FakeAuthor:
+    name = "benchmark"
+    display_name = "benchmark"
+
+
+class FakeCommand:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeContext:
+    """
+    Mimics commands.Context for one guild. Messages sent with a view are handed to
+    on_view, which clicks its buttons.
+    """
+
+    def __init__(self, guild, command, on_view=None):
+        self.guild = guild
+        self.message = type("Message", (), {"guild": guild})()
+        self.voice_client = guild.voice_client
+        self.author = FakeAuthor()
+        self.command = FakeCommand(command)
+        self.command_failed = False
+        self.on_view = on_view
+        self.clicks = None  # The task clicking the buttons of the last view sent
+
+    async def send(self, *args, view=None, **kwargs):
+        message = FakeMessage()
+        if view is not None and self.on_view is not None:
+            self.clicks = asyncio.ensure_future(
+                self.on_view(view, FakeInteraction(self.author, message))
+            )
+        return message
+
+
+class FakeGuild:
+    def __init__(self, voice_client):
+        self.id = GUILD_ID
+        self.voice_client = voice_client
+
+
+async def click(view, interaction, emoji):
+    """Clicks the button of a view with the given emoji, the way discord.py dispatches
+    an interaction."""
+    button = next(item for item in view.children if str(item.emoji) == emoji)
+    await asyncio.sleep(0)  # the click arrives as a separate event
+    if await view.interaction_check(interaction):
+        await button.callback(interaction)
+
+
+async def select_poll_songs(view, interaction):
+    for emoji in ("1️⃣", "2️⃣", "3️⃣"):
+        await click(view, interaction, emoji)
+
+
+async def use_recommendations(view, interaction):
+    await click(view, interaction, "1️⃣")
+    await click(view, interaction, "🆕")
+    if not view.is_finished():
+        await click(view, interaction, "⏹️")
+
+
+async def flip_queue_page(view, interaction):
+    await click(view, interaction, "▶️")
+    # expire it now rather than after VIEW_TIMEOUT
+    sessions.unregister(interaction.message.id)
+    view.expire()
+    await view._removal
+
+
+async def invoke(cog, name, ctx, **kwargs):
+    """Runs a command like discord.py does, with the cog's hooks around it, then waits
+    for the clicks on the buttons it sent."""
+    await cog.cog_before_invoke(ctx)
+    try:
+        await getattr(cog, name).callback(cog, ctx, **kwargs)
+    finally:
+        await cog.cog_after_invoke(ctx)
+    if ctx.clicks is not None:
+        await ctx.clicks  # the buttons are clicked after the command returned
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "runs": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1e3,
+        "p50_ms": statistics.median(samples) * 1e3,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1e3,
+        "min_ms": samples[0] * 1e3,
+    }
+
+
+async def timed_runs(runs, setup, run, teardown=None):
+    """Times run() runs times, with untimed setup() before and teardown() after each
+    run. One more run comes first, untimed, to build the caches and indexes the command
+    uses."""
+    samples = []
+    for i in range(runs + 1):
+        if setup is not None:
+            await setup()
+        start = time.perf_counter()
+        await run()
+        if i > 0:
+            samples.append(time.perf_counter() - start)
+        if teardown is not None:
+            await teardown()
+    return samples
+
+
+async def bench_queue_commands(queue_cog, queue_size, runs):
+    """Times the queue commands on a queue of queue_size songs while a song plays."""
+    voice_client = FakeVoiceClient()
+    guild = FakeGuild(voice_client)
+    state = BotState.for_guild(guild)
+    state.song_queue = [
+        Song(f"Queued {i}", f"Artist {i % 97}", "Pop") for i in range(queue_size)
+    ]
+    await queue_cog.play_song(
+        FakeContext(guild, "play"), Song("Playing", "Artist", "Pop")
+    )
+
+    def ctx(name, on_view=None):
+        return FakeContext(guild, name, on_view)
+
+    async def pop_back():
+        state.song_queue.pop(len(state.song_queue) - 1)
+
+    async def pop_middle():
+        state.song_queue.pop(queue_size // 2)
+
+    async def next_song():
+        voice_client.started.clear()
+        await invoke(queue_cog, "next", ctx("next"))
+        await voice_client.started.wait()
+
+    async def refill():
+        state.song_queue.append(
+            Song(f"Refill {time.perf_counter_ns()}", "Artist", "Pop")
+        )
+
+    middle, back = queue_size // 2 + 1, queue_size
+    commands = {
+        "/queue": (
+            None,
+            lambda: invoke(queue_cog, "queue", ctx("queue"), query="Some Song"),
+            pop_back,
+        ),
+        "/insert": (
+            None,
+            lambda: invoke(
+                queue_cog, "insert", ctx("insert"), params=f"{middle} Some Song"
+            ),
+            pop_middle,
+        ),
+        "/move": (
+            None,
+            lambda: invoke(queue_cog, "move", ctx("move"), params=f"{back} 1"),
+            None,
+        ),
+        "/view": (
+            None,
+            lambda: invoke(queue_cog, "view", ctx("view", flip_queue_page)),
+            None,
+        ),
+        "/next": (None, next_song, refill),
+    }
+    results = []
+    for command, (setup, run, teardown) in commands.items():
+        samples = await timed_runs(runs, setup, run, teardown)
+        results.append(
+            {
+                "command": command,
+                "queue_size": queue_size,
+                "catalog_size": None,
+                **summarize(samples),
+            }
+        )
+    state.stop(voice_client)
+    BotState.guilds.pop(GUILD_ID, None)
+    return results
+
+
+async def bench_session_commands(recommend_cog, catalog_size, runs):
+    """Times /poll and /recommend on a synthetic catalog of catalog_size songs."""
+    songs = synthetic_songs(catalog_size)
+    catalog = SongCatalog.from_frame(songs)
+    use_catalog(catalog, MUSIC_CSV)
+    use_catalog(catalog, SONGS_CSV)
+    selected = [
+        Song(row.track_name, row.artist_name, row.genre)
+        for row in songs.head(3).itertuples()
+    ]
+    guild = FakeGuild(FakeVoiceClient())
+    state = BotState.for_guild(guild)
+
+    async def reset_queue():
+        state.song_queue = selected
+
+    results = []
+    for command, name, on_view in (
+        ("/poll", "poll", select_poll_songs),
+        ("/recommend", "recommend", use_recommendations),
+    ):
+        samples = await timed_runs(
+            runs,
+            reset_queue,
+            lambda: invoke(recommend_cog, name, FakeContext(guild, name, on_view)),
+        )
+        results.append(
+            {
+                "command": command,
+                "queue_size": None,
+                "catalog_size": catalog_size,
+                **summarize(samples),
+            }
+        )
+    BotState.guilds.pop(GUILD_ID, None)
+    return results
+
+
+async def run_benchmarks(queue_sizes, catalog_sizes, runs, resolve_delay):
+    BotState.logger = logging.getLogger("enigma.benchmark")
+    BotState.logger.setLevel(logging.WARNING)
+    song_queue_cog._ytdl = StubYoutubeDL(resolve_delay)
+
+    queue_cog = SongQueueCog(bot=None)
+    # no stream cache, so every song goes through the stub
+    queue_cog.resolver = AudioResolver()
+    queue_cog.prefetcher = Prefetcher(queue_cog.resolver)
+    recommend_cog = RecommendCog(bot=None)
+
+    results = []
+    with patch("src.song_queue_cog.discord.FFmpegPCMAudio", FakeAudio):
+        for queue_size in queue_sizes:
+            results.extend(await bench_queue_commands(queue_cog, queue_size, runs))
+        for catalog_size in catalog_sizes:
+            results.extend(
+                await bench_session_commands(recommend_cog, catalog_size, runs)
+            )
+    queue_cog.resolver.shutdown()
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return result["command"], result["queue_size"], result["catalog_size"]
+
+
+def describe(result):
+    if result["queue_size"] is not None:
+        return f"{result['command']} queue={result['queue_size']}"
+    return f"{result['command']} catalog={result['catalog_size']}"
+
+
+def compare(results, baseline, threshold):
+    """Prints every median against the baseline's and returns the descriptions of the
+    regressions."""
+    previous = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    print(f"{'benchmark':<28} {'baseline p50 (ms)':>18} {'p50 (ms)':>10} {'ratio':>7}")
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            print(
+                f"{describe(result):<28} {'-':>18} {result['p50_ms']:>10.3f} {'new':>7}"
+            )
+            continue
+        ratio = (
+            result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else float("inf")
+        )
+        flag = "  <- slower" if ratio > threshold else ""
+        print(
+            f"{describe(result):<28} {before['p50_ms']:>18.3f} "
+            f"{result['p50_ms']:>10.3f} {ratio:>6.2f}x{flag}"
+        )
+        if ratio > threshold:
+            regressions.append(describe(result))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Times the bot's commands end to end against fakes."
+    )
+    parser.add_argument("--queue-sizes", type=int, nargs="+", default=QUEUE_SIZES)
+    parser.add_argument("--catalog-sizes", type=int, nargs="+", default=CATALOG_SIZES)
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=RUNS,
+        help=f"runs per command and size (default: {RUNS})",
+    )
+    parser.add_argument(
+        "--resolve-ms", type=float, default=0.0, help="simulated yt_dlp lookup time"
+    )
+    parser.add_argument(
+        "--output", help="write the JSON results to this file instead of stdout"
+    )
+    parser.add_argument(
+        "--compare", help="JSON results of an earlier run to compare with"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help=(
+            "median ratio above which --compare reports a regression (default: "
+            f"{THRESHOLD})"
+        ),
+    )
+    args = parser.parse_args()
+
+    results = asyncio.run(
+        run_benchmarks(
+            args.queue_sizes, args.catalog_sizes, args.runs, args.resolve_ms / 1e3
+        )
+    )
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "runs": args.runs,
+        "resolve_ms": args.resolve_ms,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(
+                f"Slower than {args.threshold}x the baseline: {', '.join(regressions)}"
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+load_benchmark.py
+
+Compares loading a catalog from its CSV with loading it from the columnar conversion
+(see src/columnar.py), on synthetic datasets of growing size. Also reports the one-off
+conversion time and the size of both forms on disk.
+
+Usage (from the repository root):
+    python -m benchmarks.load_benchmark [rows ...]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append("./")
+
+from benchmarks.catalogs import synthetic_songs  # noqa: E402
+from src.catalog import SongCatalog  # noqa: E402
+from src.columnar import columnar_path, convert  # noqa: E402
+
+SIZES = (600, 28_372, 1_000_000)
+RUNS = 3
+
+
+def timed(fn, runs=RUNS):
+    """Returns the mean wall time of fn() in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1e3
+
+
+def size_mb(path):
+    """Returns the size of a file, or of every file in a directory, in megabytes."""
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 2**20
+    return (
+        sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        / 2**20
+    )
+
+
+def main(sizes):
+    print(
+        f"{'rows':>9} {'csv (ms)':>10} {'columnar (ms)':>14} {'speedup':>8}"
+        f" {'convert (ms)':>13} {'csv (MB)':>9} {'columnar (MB)':>14}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            csv_path = os.path.join(directory, f"songs_{rows}.csv")
+            synthetic_songs(rows).to_csv(csv_path, index=False)
+
+            csv = timed(lambda: SongCatalog(csv_path).songs)
+            convert_ms = timed(lambda: convert(csv_path), runs=1)
+            columnar = timed(lambda: SongCatalog(csv_path).songs)
+            print(
+                f"{rows:>9} {csv:>10.1f} {columnar:>14.1f} {csv / columnar:>7.1f}x "
+                f"{convert_ms:>13.1f}"
+                f" {size_mb(csv_path):>9.1f} {size_mb(columnar_path(csv_path)):>14.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,82 @@
+"""
+queue_benchmark.py
+
+Compares the SongQueue skip list against the plain Python list the queue used to be, for
+the operations the queue commands perform: taking the next song (/next), inserting at a
+position (/insert), removing a position (/remove), moving a song (/move) and dropping
+the front of the queue (/jumpto).
+
+Usage (from the repository root):
+    python -m benchmarks.queue_benchmark [size ...]
+"""
+
+import random
+import sys
+import time
+
+sys.path.append("./")
+
+from src.song_queue import SongQueue  # noqa: E402
+
+SIZES = (10_000, 100_000)
+OPERATIONS = 2_000
+
+
+def list_ops(queue, rng):
+    """The list versions of the queue operations, as SongQueueCog performed them before
+    SongQueue."""
+    return {
+        "pop front": lambda: queue.append(queue.pop(0)),
+        "insert": lambda: queue.insert(rng.randrange(len(queue)), "Song"),
+        "remove": lambda: queue.pop(rng.randrange(len(queue))),
+        "move": lambda: queue.insert(
+            rng.randrange(len(queue)), queue.pop(rng.randrange(len(queue)))
+        ),
+        "jumpto": lambda: queue.__setitem__(slice(None), queue[1:] + ["Song"]),
+    }
+
+
+def song_queue_ops(queue, rng):
+    """The SongQueue versions of the queue operations."""
+    return {
+        "pop front": lambda: queue.append(queue.popleft()),
+        "insert": lambda: queue.insert(rng.randrange(len(queue)), "Song"),
+        "remove": lambda: queue.pop(rng.randrange(len(queue))),
+        "move": lambda: queue.move(
+            rng.randrange(len(queue)), rng.randrange(len(queue))
+        ),
+        "jumpto": lambda: (queue.drop_front(1), queue.append("Song")),
+    }
+
+
+def measure(make_ops, queue):
+    """Times every operation OPERATIONS times and returns the mean time per operation in
+    microseconds."""
+    results = {}
+    for name, op in make_ops(queue, random.Random(0)).items():
+        start = time.perf_counter()
+        for _ in range(OPERATIONS):
+            op()
+        results[name] = (time.perf_counter() - start) / OPERATIONS * 1e6
+    return results
+
+
+def main(sizes):
+    print(
+        f"{'size':>8} {'operation':<10} {'list (us)':>10} {'SongQueue (us)':>15} "
+        f"{'speedup':>8}"
+    )
+    for size in sizes:
+        songs = [f"Song {i}" for i in range(size)]
+        list_times = measure(list_ops, list(songs))
+        skip_times = measure(song_queue_ops, SongQueue(songs))
+        for name in list_times:
+            print(
+                f"{size:>8} {name:<10} {list_times[name]:>10.2f} "
+                f"{skip_times[name]:>15.2f}"
+                f" {list_times[name] / skip_times[name]:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
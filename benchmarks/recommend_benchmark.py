@@ -0,0 +1,91 @@
+"""
+recommend_benchmark.py
+
+Times RecommendCog.generate_recommendations on synthetic catalogs from 600 to 1M songs,
+against the previous implementation that shuffled the whole matched DataFrame and walked
+it with iterrows(). The one-off cost of building the catalog's indexes is reported
+separately.
+
+Usage (from the repository root):
+    python -m benchmarks.recommend_benchmark [rows ...]
+"""
+
+import sys
+import time
+
+sys.path.append("./")
+
+from benchmarks.catalogs import synthetic_songs  # noqa: E402
+from src.catalog import SongCatalog, use_catalog  # noqa: E402
+from src.recommend_cog import RecommendCog  # noqa: E402
+from src.song import Song  # noqa: E402
+
+SIZES = (600, 10_000, 100_000, 1_000_000)
+RUNS = 5
+
+
+def legacy_generate_recommendations(all_songs, selected_songs):
+    """generate_recommendations as it was before it was vectorized."""
+    recommendations = []
+    seen_artists = {}
+    genres = {song.genre for song in selected_songs}
+    matched_songs = all_songs[
+        all_songs["genre"].isin(genres)
+        & ~all_songs["artist_name"].isin([song.artist_name for song in selected_songs])
+        & ~all_songs["track_name"].isin([song.track_name for song in selected_songs])
+    ].copy()
+    matched_songs = matched_songs.sample(frac=1).reset_index(drop=True)
+    for _, matched_song in matched_songs.iterrows():
+        song = Song(
+            track_name=matched_song["track_name"],
+            artist_name=matched_song["artist_name"],
+            genre=matched_song["genre"],
+        )
+        artist_count = seen_artists.get(song.artist_name, 0)
+        if song not in recommendations and artist_count < 2:
+            recommendations.append(song)
+            seen_artists[song.artist_name] = artist_count + 1
+        if len(recommendations) >= 10:
+            break
+    return recommendations[:10]
+
+
+def timed(fn, runs=RUNS):
+    """Returns the mean wall time of fn() in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1e3
+
+
+def main(sizes):
+    cog = RecommendCog(bot=None)
+    print(
+        f"{'rows':>9} {'legacy (ms)':>12} {'vectorized (ms)':>16} {'speedup':>8} "
+        f"{'index build (ms)':>17}"
+    )
+    for rows in sizes:
+        songs = synthetic_songs(rows)
+        catalog = SongCatalog.from_frame(songs)
+        use_catalog(catalog)
+        selected = [
+            Song(row.track_name, row.artist_name, row.genre)
+            for row in songs.head(3).itertuples()
+        ]
+        build = timed(
+            lambda: [
+                catalog.index(column)
+                for column in ("genre", "artist_name", "track_name")
+            ],
+            runs=1,
+        )
+        legacy = timed(lambda: legacy_generate_recommendations(songs, selected))
+        vectorized = timed(lambda: cog.generate_recommendations(selected))
+        print(
+            f"{rows:>9} {legacy:>12.2f} {vectorized:>16.2f} "
+            f"{legacy / vectorized:>7.1f}x {build:>17.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,95 @@
+"""
+sample_benchmark.py
+
+Times get_songs_by_genre, which draws the songs for /poll, against the previous
+implementation that sampled one row at a time from a deduplicated copy of the dataset
+and concatenated the accepted rows one by one. Then times the one-song-per-genre draw of
+utils.random_25 against its previous implementation, which shuffled the whole dataset.
+
+Usage (from the repository root):
+    python -m benchmarks.sample_benchmark [rows]
+"""
+
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append("./")
+
+from benchmarks.catalogs import synthetic_songs  # noqa: E402
+from src.catalog import SongCatalog, use_catalog  # noqa: E402
+from src.get_all import get_songs_by_genre  # noqa: E402
+from src.sampler import genre_sampler  # noqa: E402
+
+ROWS = 28_372  # the size of tcc_ceds_music.csv
+COUNTS = (10, 25, 1000)
+RUNS = 5
+
+
+def legacy_get_songs_by_genre(all_songs, n=10):
+    """get_songs_by_genre as it was before the vectorized sampler."""
+    unique_songs = all_songs.drop_duplicates(subset=["track_name", "artist_name"])
+    sampled_songs = pd.DataFrame()
+    sampled_ids = set()
+    while len(sampled_songs) < n:
+        song = unique_songs.sample(1)
+        song_id = (song["track_name"].iloc[0], song["artist_name"].iloc[0])
+        if song_id not in sampled_ids:
+            sampled_ids.add(song_id)
+            sampled_songs = pd.concat([sampled_songs, song])
+    return sampled_songs
+
+
+def legacy_random_25(all_songs):
+    """The one-song-per-genre draw of utils.random_25 as it was before the
+    GenreSampler."""
+    return (all_songs.sample(frac=1).groupby("genre").head(1)).sample(25)
+
+
+def timed(fn, runs=RUNS):
+    """Returns the mean wall time of fn() in milliseconds."""
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs * 1e3
+
+
+def main(rows):
+    songs = synthetic_songs(rows)
+    use_catalog(SongCatalog.from_frame(songs))
+    get_songs_by_genre(1, one_per_genre=True)  # build the indexes outside the timings
+
+    print(
+        f"{'n':>5} {'legacy (ms)':>12} {'sampler (ms)':>13} {'speedup':>8} "
+        f"{'one per genre (ms)':>19}"
+    )
+    for n in COUNTS:
+        legacy = timed(
+            lambda: legacy_get_songs_by_genre(songs, n), runs=1 if n > 100 else RUNS
+        )
+        sampler = timed(lambda: get_songs_by_genre(n))
+        stratified = timed(lambda: get_songs_by_genre(n, one_per_genre=True))
+        print(
+            f"{n:>5} {legacy:>12.2f} {sampler:>13.2f} {legacy / sampler:>7.1f}x "
+            f"{stratified:>19.2f}"
+        )
+
+    catalog = SongCatalog.from_frame(songs)
+    uniform = genre_sampler(catalog)
+    weighted = genre_sampler(catalog, weight_column="pop")
+    legacy = timed(lambda: legacy_random_25(songs))
+    sampler = timed(lambda: uniform.sample(25))
+    weighted_sampler = timed(lambda: weighted.sample(25))
+    print(
+        f"\n{'random_25':<10} {'legacy (ms)':>12} {'sampler (ms)':>13} {'speedup':>8} "
+        f"{'pop-weighted (ms)':>18}"
+    )
+    print(
+        f"{'':<10} {legacy:>12.2f} {sampler:>13.3f} {legacy / sampler:>7.0f}x "
+        f"{weighted_sampler:>18.3f}"
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS)
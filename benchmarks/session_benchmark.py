@@ -0,0 +1,85 @@
+"""
+session_benchmark.py
+
+Measures the cost of routing one event to its session with many sessions open: the
+previous bot.wait_for loops ran the check predicate of every waiting session on every
+reaction, while the session registry looks the session up by message id and restarts its
+timeout in the shared timer wheel.
+
+Usage (from the repository root):
+    python -m benchmarks.session_benchmark [sessions ...]
+"""
+
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append("./")
+
+from src.sessions import SessionRegistry  # noqa: E402
+
+SIZES = (10, 1000, 100_000)
+EVENTS = 10_000
+NUMBER_EMOJIS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
+
+
+def legacy_checks(count):
+    """The check predicates the wait_for loops registered, one per session."""
+
+    def check_for(message_id, author):
+        def check(reaction, user):
+            return (
+                user == author
+                and reaction.message.id == message_id
+                and str(reaction.emoji) in NUMBER_EMOJIS
+            )
+
+        return check
+
+    return [check_for(message_id, f"user{message_id}") for message_id in range(count)]
+
+
+def timed(fn, events=EVENTS):
+    """Returns the mean wall time of fn(i) per event in microseconds."""
+    start = time.perf_counter()
+    for i in range(events):
+        fn(i)
+    return (time.perf_counter() - start) / events * 1e6
+
+
+def main(sizes):
+    print(f"{'sessions':>9} {'wait_for checks (us)':>21} {'registry (us)':>14}")
+    for count in sizes:
+        checks = legacy_checks(count)
+        reactions = [
+            SimpleNamespace(message=SimpleNamespace(id=i * 7919 % count), emoji="1️⃣")
+            for i in range(100)
+        ]
+
+        def dispatch_legacy(i):
+            reaction = reactions[i % len(reactions)]
+            user = f"user{reaction.message.id}"
+            # discord.py runs the check of every listener waiting for the event
+            for check in checks:
+                check(reaction, user)
+
+        registry = SessionRegistry()
+        for message_id in range(count):
+            registry.register(
+                message_id, SimpleNamespace(expire=lambda: None), 60.0, kind="poll"
+            )
+
+        def dispatch_registry(i):
+            reaction = reactions[i % len(reactions)]
+            registry.get(reaction.message.id)
+            registry.touch(reaction.message.id)
+
+        events = max(min(EVENTS, 10_000_000 // count), 10)
+        print(
+            f"{count:>9} {timed(dispatch_legacy, events):>21.2f} "
+            f"{timed(dispatch_registry):>14.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
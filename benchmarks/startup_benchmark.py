@@ -0,0 +1,59 @@
+"""
+startup_benchmark.py
+
+Measures how long the bot's modules take to import in a fresh interpreter, i.e. what
+every start of the bot and of the test suite pays before any command runs. Each import
+runs in its own subprocess, so nothing is cached between measurements. The cost of the
+--eager warm-up, which does the deferred work up front, is measured the same way.
+
+Usage (from the repository root):
+    python -m benchmarks.startup_benchmark [module ...]
+"""
+
+import statistics
+import subprocess
+import sys
+
+MODULES = ("src.utils", "src.recommend_cog", "src.song_queue_cog", "bot")
+RUNS = 5
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, ".")
+# third-party imports every bot module shares, kept out of the timing
+import discord, pandas, numpy
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+WARM_UP_SCRIPT = """
+import sys, time
+sys.path.insert(0, ".")
+import bot
+start = time.perf_counter()
+bot.warm_up()
+print(time.perf_counter() - start)
+"""
+
+
+def run(script):
+    """Runs a script in a fresh interpreter and returns the number it prints, in
+    milliseconds."""
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1]) * 1e3
+
+
+def main(modules):
+    print(f"{'module':<20} {'cold import (ms)':>17}")
+    for module in modules:
+        times = [run(IMPORT_SCRIPT.format(module=module)) for _ in range(RUNS)]
+        print(f"{module:<20} {statistics.median(times):>17.1f}")
+    times = [run(WARM_UP_SCRIPT) for _ in range(RUNS)]
+    print(f"{'bot.warm_up()':<20} {statistics.median(times):>17.1f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or MODULES)
@@ -0,0 +1,80 @@
+"""
+state_store_benchmark.py
+
+Measures what saving guild states costs: the latency a queue command pays to mark its
+guild dirty, compared with writing the guild's snapshot synchronously on every command,
+the time of one batched flush of many guilds, and the time to restore every guild at
+startup.
+
+Usage (from the repository root):
+    python -m benchmarks.state_store_benchmark [guilds] [queue length]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append("./")
+
+from src.bot_state import GuildState  # noqa: E402
+from src.song import Song  # noqa: E402
+from src.state_store import StateStore  # noqa: E402
+
+GUILDS = 1000
+QUEUE_LENGTH = 50
+COMMANDS = 2000
+
+
+def make_states(guilds, queue_length):
+    states = []
+    for guild_id in range(guilds):
+        state = GuildState(guild_id)
+        state.song_queue = [
+            Song(f"Track{i}", f"Artist{i % 7}", "Pop") for i in range(queue_length)
+        ]
+        states.append(state)
+    return states
+
+
+def main(guilds, queue_length):
+    states = make_states(guilds, queue_length)
+    with tempfile.TemporaryDirectory() as directory:
+        store = StateStore(os.path.join(directory, "state.sqlite3"))
+        # keep the flush pending, as the debounce timer would
+        store._schedule = lambda: None
+
+        start = time.perf_counter()
+        for i in range(COMMANDS):
+            store.mark_dirty(states[i % guilds])
+        marked = (time.perf_counter() - start) / COMMANDS * 1e6
+        store.flush()
+
+        start = time.perf_counter()
+        for i in range(COMMANDS):
+            store.mark_dirty(states[i % guilds])
+            store.flush()
+        synchronous = (time.perf_counter() - start) / COMMANDS * 1e6
+
+        for state in states:
+            store.mark_dirty(state)
+        start = time.perf_counter()
+        store.flush()
+        flushed = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        restored = store.load_all()
+        loaded = (time.perf_counter() - start) * 1e3
+        assert len(restored) == guilds
+        store.close()
+
+    print(f"{guilds} guilds, {queue_length} songs each")
+    print(f"  mark dirty per command:        {marked:7.2f} us")
+    print(f"  synchronous write per command: {synchronous:7.2f} us")
+    print(f"  batched flush of every guild:  {flushed:7.2f} ms")
+    print(f"  restore every guild:           {loaded:7.2f} ms")
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [GUILDS, QUEUE_LENGTH][len(args) :]))
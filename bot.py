@@ -1,22 +1,40 @@
 """
 bot.py
 
-This module initializes and runs a Discord bot with multiple cogs, handling song recommendations, song queueing,
-and voice state updates. It configures the bot’s command prefix, loads essential cogs, and defines event handlers
-for bot readiness, incoming messages, and voice state changes.
+This module initializes and runs a Discord bot with multiple cogs, handling song
+recommendations, song queueing, and voice state updates. It configures the bot’s command
+prefix, loads essential cogs, and defines event handlers for bot readiness, incoming
+messages, and voice state changes.
 
 Environment Variables:
-    - DISCORD_TOKEN: The bot token used to authenticate with Discord, loaded from a .env file.
+    - DISCORD_TOKEN: The bot token used to authenticate with Discord, loaded from a .env
+        file.
+
+Command Line Options:
+    - --eager: Load the song datasets and yt_dlp before connecting, instead of on the
+        first command that needs them.
+    - --state PATH: Where the guilds' queues are saved across restarts (see
+        state_store.py). Defaults to STATE_DB.
+    - --metrics-port PORT: Serve command counters and latency histograms in the
+      Prometheus text format on http://127.0.0.1:PORT/metrics (see metrics.py). Not
+      served by default.
+    - --log-file PATH: Where command and playback records are written as JSON lines,
+      from a background thread (see log_pipeline.py). Defaults to LOG_FILE.
+    - --log-sample EVENT=RATE: Keep only this share of the records of an event, e.g.
+        song_end=0.1. Repeatable.
 
 Modules:
-    - BotState: Manages the state of the bot, including logging and audio playback control.
+    - BotState: Manages the per-guild state of the bot, including logging and audio
+        playback control.
     - RecommendCog: A cog that provides song recommendation and polling commands.
     - SongQueueCog: A cog that handles song queueing operations.
     - searchSong: Utility function for song search.
 """
 
 from multiprocessing.util import debug
+import argparse
 import logging
+import time
 from src.bot_state import BotState
 import discord
 import os
@@ -26,9 +44,14 @@
 from dotenv import load_dotenv
 from discord.ext import commands
 
+from src.catalog import get_catalog, MUSIC_CSV, SONGS_CSV
+from src.log_pipeline import LOG_FILE, parse_sample_rates, start_logging, stop_logging
+from src.metrics import start_exporter
 from src.recommend_cog import RecommendCog
+from src.sampler import genre_sampler
 from src.utils import searchSong
-from src.song_queue_cog import SongQueueCog
+from src.song_queue_cog import SongQueueCog, get_ytdl
+from src.state_store import STATE_DB, StateStore
 
 # Load environment variables from .env file
 load_dotenv(".env")
@@ -42,25 +65,26 @@
 @client.event
 async def on_ready():
     """
-        Triggered when the bot is ready and connected to Discord.
+    Triggered when the bot is ready and connected to Discord.
 
-        Loads necessary cogs and initializes the bot's logger for state tracking and error reporting.
+    Loads necessary cogs. BotState logs through the pipeline the main block starts
+    (see log_pipeline.py).
     """
     await SongQueueCog.setup(client)  # Initialize the song queue cog
     await RecommendCog.setup(client)  # Initialize the recommendation cog
-    BotState.logger = logging.getLogger("discord")  # Set up bot state logging
 
 
 @client.event
 async def on_message(message):
     """
-        Processes incoming messages in Discord.
+    Processes incoming messages in Discord.
 
-        Ignores messages from the bot itself and allows command processing for messages in the "general" channel.
+    Ignores messages from the bot itself and allows command processing for messages
+    in the "general" channel.
 
-        Args:
-            message (discord.Message): The incoming message from Discord.
-        """
+    Args:
+        message (discord.Message): The incoming message from Discord.
+    """
     if message.author == client.user:
         return  # Ignore messages sent by the bot itself
     options = set()
@@ -74,24 +98,112 @@ async def on_message(message):
 @client.event
 async def on_voice_state_update(member, before, after):
     """
-        Handles voice state changes to manage bot audio playback.
+    Handles voice state changes to manage bot audio playback.
 
-        Pauses or stops playback when the bot moves between voice channels or disconnects.
+    Pauses or stops playback when the bot moves between voice channels or
+    disconnects.
 
-        Args:
-            member (discord.Member): The member whose voice state changed.
-            before (discord.VoiceState): The member's previous voice state.
-            after (discord.VoiceState): The member's current voice state.
-        """
+    Args:
+        member (discord.Member): The member whose voice state changed.
+        before (discord.VoiceState): The member's previous voice state.
+        after (discord.VoiceState): The member's current voice state.
+    """
 
     # Check if the member joining/leaving is the bot
     if member is member.guild.me:
         voice_client = member.guild.voice_client
+        state = BotState.for_guild(member.guild)
         if after.channel is None or before.channel is None:
-            BotState.stop(voice_client)  # Stop playback if bot leaves a voice channel
+            state.stop(voice_client)  # Stop playback if bot leaves a voice channel
         elif before.channel is not after.channel:
-            BotState.pause(voice_client)  # Pause playback if bot switches channels
+            state.pause(voice_client)  # Pause playback if bot switches channels
 
 
-# Start the bot using the provided token from environment variables
-client.run(TOKEN)
+def warm_up():
+    """
+    Does the work that is otherwise deferred to the first command that needs it:
+    parses the song datasets, builds the indexes and samplers /poll and /recommend
+    query, and initializes yt_dlp.
+    """
+    logger = logging.getLogger("discord")
+    start = time.perf_counter()
+    for path, artist_column in ((MUSIC_CSV, "artist_name"), (SONGS_CSV, "artist")):
+        catalog = get_catalog(path)
+        try:
+            catalog.songs
+        except FileNotFoundError:
+            logger.warning("Song dataset %s not found, it will not be warmed up", path)
+            continue
+        for column in ("genre", artist_column, "track_name"):
+            catalog.index(column)
+        genre_sampler(catalog, artist_column=artist_column)
+    get_ytdl()
+    logger.info("Warmed up in %.2f s", time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the Enigma Discord bot.")
+    parser.add_argument(
+        "--eager",
+        action="store_true",
+        help=(
+            "load the song datasets and yt_dlp before connecting instead of on first "
+            "use"
+        ),
+    )
+    parser.add_argument(
+        "--state",
+        default=STATE_DB,
+        help=(
+            "the database the guilds' queues are saved to across restarts (default: "
+            f"{STATE_DB})"
+        ),
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help=(
+            "serve metrics in the Prometheus text format on this local port "
+            "(default: not served)"
+        ),
+    )
+    parser.add_argument(
+        "--log-file",
+        default=LOG_FILE,
+        help=(
+            "where command and playback records are written as JSON lines (default: "
+            f"{LOG_FILE})"
+        ),
+    )
+    parser.add_argument(
+        "--log-sample",
+        action="append",
+        default=[],
+        metavar="EVENT=RATE",
+        help=(
+            "keep only this share of an event's records, e.g. song_end=0.1 "
+            "(repeatable)"
+        ),
+    )
+    args = parser.parse_args()
+    log_listener = start_logging(args.log_file, parse_sample_rates(args.log_sample))
+    if args.eager:
+        warm_up()
+
+    if args.metrics_port is not None:
+        start_exporter(args.metrics_port)
+        logging.getLogger("discord").info(
+            "Serving metrics on port %d", args.metrics_port
+        )
+
+    # Bring back the queues saved before the last restart, in one read
+    store = StateStore(args.state)
+    restored = BotState.restore(store)
+    logging.getLogger("discord").info("Restored the state of %d guilds", restored)
+
+    # Start the bot using the provided token from environment variables
+    try:
+        client.run(TOKEN)
+    finally:
+        store.close()  # save what changed since the last flush
+        stop_logging(log_listener)  # write the records still queued
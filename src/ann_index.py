@@ -0,0 +1,243 @@
+"""
+ann_index.py
+
+This module defines the IVFIndex class, an approximate nearest neighbour index over the
+audio-feature matrix of a catalog. The songs are split into clusters with k-means, and a
+query only scores the songs of the few clusters whose centres are closest to it, instead
+of every song in the catalog.
+
+The index is saved next to the dataset it was built for (e.g.
+./data/songs.csv.cosine.ivf.npz), together with a checksum of the feature matrix, so it
+is only rebuilt when the dataset changes.
+
+Attributes:
+    - N_PROBE (int): How many clusters a query visits by default.
+    - KMEANS_ITERATIONS (int): How many rounds of k-means refine the cluster centres.
+    - TRAINING_POINTS_PER_LIST (int): How many sampled songs per cluster k-means is
+        trained on.
+    - CHUNK_ROWS (int): How many songs are assigned to clusters at once, which bounds
+        the size of the distance matrix.
+"""
+
+import os
+import zlib
+
+import numpy as np
+
+N_PROBE = 16
+KMEANS_ITERATIONS = 10
+TRAINING_POINTS_PER_LIST = 64
+CHUNK_ROWS = 8192
+
+
+def matrix_checksum(points):
+    """Returns a checksum of a float32 matrix, used to tell whether a saved index still
+    matches its data.
+
+    Args:
+        points (ndarray): The matrix.
+
+    Returns:
+        int: The checksum.
+    """
+    return (
+        zlib.crc32(np.ascontiguousarray(points, dtype=np.float32).tobytes())
+        ^ points.shape[0]
+    )
+
+
+def _nearest_centroids(points, centroids):
+    """Returns the index of the closest centroid for every point, computed in chunks."""
+    centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+    nearest = np.empty(len(points), dtype=np.intp)
+    for start in range(0, len(points), CHUNK_ROWS):
+        chunk = points[start : start + CHUNK_ROWS]
+        # |x - c|^2 without the |x|^2 term, which does not change which centroid is
+        # closest
+        distances = centroid_norms - 2 * (chunk @ centroids.T)
+        nearest[start : start + CHUNK_ROWS] = distances.argmin(axis=1)
+    return nearest
+
+
+class IVFIndex:
+    """
+    An inverted file index: k-means centroids, and for each centroid the rows of the
+    points closest to it.
+
+    The rows are stored grouped by cluster in one array (order), with offsets[list]
+    marking where each cluster starts, the same layout ColumnIndex uses.
+    """
+
+    def __init__(self, centroids, order, offsets, checksum=None):
+        """Initializes an index from its parts. Use build() or load() to create one.
+
+        Args:
+            centroids (ndarray): The cluster centres, one row per cluster.
+            order (ndarray): The rows of the indexed points, grouped by cluster.
+            offsets (ndarray): Where each cluster's rows start in order, plus the total
+                at the end.
+            checksum (int, optional): The checksum of the points the index was built
+                over.
+        """
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.checksum = checksum
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.order)
+
+    @classmethod
+    def build(cls, points, n_lists=None, iterations=KMEANS_ITERATIONS, seed=0):
+        """Clusters the points with k-means and builds the index.
+
+        Args:
+            points (ndarray): The float32 points to index, one row per song.
+            n_lists (int, optional): How many clusters to make. Defaults to about
+                sqrt(len(points)).
+            iterations (int, optional): How many rounds of k-means to run.
+            seed (int, optional): Seed for picking the training sample and initial
+                centres.
+
+        Returns:
+            IVFIndex: The index.
+        """
+        points = np.ascontiguousarray(points, dtype=np.float32)
+        n_lists = max(1, min(n_lists or int(np.sqrt(len(points))), len(points)))
+        rng = np.random.default_rng(seed)
+
+        # Train on a sample, which is enough to place the centres, then assign every
+        # point once
+        sample_size = min(len(points), n_lists * TRAINING_POINTS_PER_LIST)
+        sample = points[rng.choice(len(points), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            nearest = _nearest_centroids(sample, centroids)
+            counts = np.bincount(nearest, minlength=n_lists)
+            sums = np.stack(
+                [
+                    np.bincount(nearest, weights=sample[:, dim], minlength=n_lists)
+                    for dim in range(sample.shape[1])
+                ],
+                axis=1,
+            )
+            filled = counts > 0  # an empty cluster keeps its old centre
+            centroids[filled] = (sums[filled] / counts[filled, None]).astype(np.float32)
+
+        nearest = _nearest_centroids(points, centroids)
+        order = np.argsort(nearest, kind="stable")
+        offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(nearest, minlength=n_lists)))
+        )
+        return cls(centroids, order, offsets, matrix_checksum(points))
+
+    def probe(self, point, n_probe=N_PROBE):
+        """Returns the clusters whose centres are closest to a point.
+
+        Args:
+            point (ndarray): The query point.
+            n_probe (int, optional): How many clusters to return.
+
+        Returns:
+            ndarray: The cluster numbers, closest first.
+        """
+        n_probe = min(n_probe, self.n_lists)
+        distances = np.einsum("ij,ij->i", self.centroids, self.centroids) - 2 * (
+            self.centroids @ point
+        )
+        if n_probe < self.n_lists:
+            lists = np.argpartition(distances, n_probe - 1)[:n_probe]
+        else:
+            lists = np.arange(self.n_lists)
+        return lists[np.argsort(distances[lists], kind="stable")]
+
+    def candidates(self, point, n_probe=N_PROBE):
+        """Returns the rows of every point in the clusters closest to a point.
+
+        Args:
+            point (ndarray): The query point.
+            n_probe (int, optional): How many clusters to visit.
+
+        Returns:
+            ndarray: The candidate rows.
+        """
+        lists = self.probe(point, n_probe)
+        return np.concatenate(
+            [self.order[self.offsets[i] : self.offsets[i + 1]] for i in lists]
+        )
+
+    def save(self, path):
+        """Writes the index to a file, replacing it atomically.
+
+        Args:
+            path (str): The path of the file, which should end in .npz.
+        """
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            order=self.order,
+            offsets=self.offsets,
+            checksum=np.array(
+                self.checksum if self.checksum is not None else -1, dtype=np.int64
+            ),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Reads an index written by save().
+
+        Args:
+            path (str): The path of the file.
+
+        Returns:
+            IVFIndex: The index.
+        """
+        with np.load(path) as data:
+            checksum = int(data["checksum"])
+            return cls(
+                data["centroids"],
+                data["order"],
+                data["offsets"],
+                None if checksum < 0 else checksum,
+            )
+
+    @classmethod
+    def load_or_build(cls, points, path=None, **kwargs):
+        """Loads the index saved at a path if it was built over the same points, and
+        otherwise builds a new one and saves it there.
+
+        Args:
+            points (ndarray): The points to index.
+            path (str, optional): The sidecar file. Nothing is read or written if it is
+                None.
+            kwargs: Passed on to build().
+
+        Returns:
+            IVFIndex: The index.
+        """
+        checksum = matrix_checksum(points)
+        if path is not None and os.path.exists(path):
+            try:
+                index = cls.load(path)
+            except (OSError, KeyError, ValueError):
+                index = None  # unreadable; rebuild it below
+            if (
+                index is not None
+                and index.checksum == checksum
+                and len(index) == len(points)
+            ):
+                return index
+
+        index = cls.build(points, **kwargs)
+        if path is not None:
+            try:
+                index.save(path)
+            except OSError:
+                pass  # the index still works, it just has to be rebuilt next time
+        return index
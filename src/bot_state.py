@@ -1,126 +1,330 @@
 """
 bot_state.py
 
-This module defines the BotState class, which manages the shared state of the Discord bot's music playback, including
-the song queue, playback status, and logging.
+This module defines the GuildState class, which holds the music playback state of a
+single Discord server (guild), including the song queue and playback status, and the
+BotState class, which keeps one GuildState per guild and handles logging.
 
 Attributes:
-    - song_queue (list): A queue of songs selected by the user.
-    - current_song_playing (Song): The currently playing song.
-    - _is_paused (bool): Indicates whether the bot is currently paused.
-    - _is_looping (bool): Indicates whether the bot is in looping mode.
-    - logger (logging.Logger): Logger instance for tracking bot commands and actions.
+    - IDLE_TIMEOUT (float): Seconds after which the state of a guild with nothing
+        playing or queued is evicted.
+    - SWEEP_INTERVAL (float): Minimum number of seconds between two sweeps for idle
+        guild states.
 """
 
+import logging
+import time
 
-class BotState:
-    song_queue = []  # Queue of songs selected by the user
-    current_song_playing = None  # Currently playing song, if any
-    _is_paused = False  # Indicates if playback is paused
-    _is_looping = False  # Indicates if looping is enabled for the current song
-    logger = None  # Logger for tracking bot commands and actions
+from src.log_pipeline import LOGGER_NAME
+from src.metrics import metrics, stage
+from src.playback import Playback
+from src.song_queue import SongQueue
 
-    @classmethod
-    def log_command(cls, ctx, msg):
-        """Logs a command action with the specified message.
+IDLE_TIMEOUT = 3600.0
+SWEEP_INTERVAL = 60.0
 
-            Args:
-                ctx (Context): The context of the command, used to access author and command name.
-                msg (str): The message to log, providing additional details.
+
+class GuildState:
+    """
+    The playback state of one guild.
+
+    Memory footprint: a GuildState uses __slots__, so the object itself is about 100
+    bytes. On top of that come its Playback (about 1 KB, most of it the asyncio.Event)
+    and its SongQueue, whose skip list costs about 700 bytes empty and about 230 bytes
+    per queued song (a node and its link lists), plus the Song itself. An idle guild
+    with an empty queue therefore costs about 2 KB, and a thousand such guilds stay
+    around 2 MB.
+
+    Attributes:
+        - song_queue (SongQueue): A queue of songs selected by the user. Assigning a
+            list converts it.
+        - current_song_playing (Song): The currently playing song.
+        - playback (Playback): The playback state machine of the guild's voice client.
+        - last_used (float): When the state was last accessed, used for idle eviction.
+    """
+
+    __slots__ = (
+        "guild_id",
+        "_song_queue",
+        "current_song_playing",
+        "_is_paused",
+        "_is_looping",
+        "playback",
+        "last_used",
+    )
+
+    def __init__(self, guild_id):
+        """Initializes an empty state for a guild.
+
+        Args:
+            guild_id (int): The id of the guild this state belongs to.
         """
-        cls.logger.info(f"ENIGMA ({ctx.author.name} /{ctx.command.name}) {msg}")
+        self.guild_id = guild_id
+        self._song_queue = SongQueue()  # Queue of songs selected by the user
+        self.current_song_playing = None  # Currently playing song, if any
+        self._is_paused = False  # Indicates if playback is paused
+        self._is_looping = False  # Indicates if looping is enabled for the current song
+        self.playback = Playback()  # Playback state machine of the guild's voice client
+        self.last_used = time.monotonic()  # When the state was last accessed
 
-    @classmethod
-    async def log_and_send(cls, ctx, msg):
-        """Sends a message to the user and logs the command action.
+    @property
+    def song_queue(self):
+        """The queue of songs selected by the user.
 
-            Args:
-                ctx (Context): The context of the command, used for logging and sending messages.
-                msg (str): The message to send and log.
+        Returns:
+            SongQueue: The guild's queue.
         """
-        await ctx.send(msg)  # Send message to the Discord channel
-        cls.log_command(ctx, msg)  # Log the command action
+        return self._song_queue
 
-    @classmethod
-    def is_in_use(cls):
+    @song_queue.setter
+    def song_queue(self, songs):
+        """Replaces the queue of songs.
+
+        Args:
+            songs (iterable[Song]): The new queue, front first.
+        """
+        self._song_queue = songs if isinstance(songs, SongQueue) else SongQueue(songs)
+
+    def is_in_use(self):
         """Checks if a song is currently playing.
 
-            Returns:
-                bool: True if a song is playing, False otherwise.
+        Returns:
+            bool: True if a song is playing, False otherwise.
         """
-        return cls.current_song_playing is not None
+        return self.current_song_playing is not None
 
-    @classmethod
-    def is_paused(cls):
+    def is_paused(self):
         """Checks if playback is paused.
 
-            Returns:
-                bool: True if playback is paused, False otherwise.
+        Returns:
+            bool: True if playback is paused, False otherwise.
         """
-        return cls._is_paused
+        return self._is_paused
 
-    @classmethod
-    def is_in_voice_channel(cls, voice_client):
-        """Checks if the bot is connected to a voice channel.
+    def pause(self, voice_client):
+        """Pauses playback if a song is currently playing and the bot is connected to a
+        voice channel.
 
             Args:
                 voice_client (VoiceClient): The Discord voice client instance.
+        """
+        if not self._is_paused and self.is_in_use():
+            if voice_client is not None and not voice_client.is_paused():
+                voice_client.pause()  # Pause playback on the voice client
+            self._is_paused = True  # Update the pause state
+
+    def unpause(self, voice_client):
+        """Resumes playback if paused and the bot is connected to a voice channel.
+
+        Args:
+            voice_client (VoiceClient): The Discord voice client instance.
+        """
+        if self._is_paused and self.is_in_use():
+            if voice_client is not None and voice_client.is_paused():
+                voice_client.resume()  # Resume playback on the voice client
+            self._is_paused = False  # Update the pause state
+
+    def stop(self, voice_client):
+        """Stops playback and resets playback-related attributes.
+
+        Args:
+            voice_client (VoiceClient): The Discord voice client instance.
+        """
+        if voice_client is not None and self.is_in_use():
+            voice_client.stop()  # Stop playback on the voice client
+        self.current_song_playing = None  # Reset the current song
+        self._is_paused = False  # Reset the pause state
+
+    def is_looping(self):
+        """Checks if the bot is in looping mode.
+
+        Returns:
+            bool: True if looping is enabled, False otherwise.
+        """
+        return self._is_looping
+
+    def set_is_looping(self, is_looping):
+        """Sets the looping state of the bot.
+
+        Args:
+            is_looping (bool): The new looping state to set.
+        """
+        self._is_looping = is_looping  # Update the looping state
+
+    def is_idle(self, now, max_idle):
+        """Checks if the state can be evicted because nothing is playing or queued and
+        it has not been used for a while.
+
+            Args:
+                now (float): The current time.monotonic() value.
+                max_idle (float): Seconds without access after which the state counts as
+                    idle.
 
             Returns:
-                bool: True if the bot is connected to a voice channel, False otherwise.
+                bool: True if the state can be evicted, False otherwise.
         """
-        return voice_client is not None and voice_client.is_connected()
+        return (
+            not self.is_in_use()
+            and not self.playback.is_playing()
+            and not self.song_queue
+            and now - self.last_used >= max_idle
+        )
+
+
+class BotState:
+    guilds = {}  # State of every guild the bot is active in, keyed by guild id
+    # Logger for tracking bot commands and actions, see log_pipeline.py
+    logger = logging.getLogger(LOGGER_NAME)
+    # StateStore the guild states are saved to, if any (see state_store.py)
+    store = None
+    _last_sweep = 0.0  # When idle guild states were last evicted
 
     @classmethod
-    def pause(cls, voice_client):
-        """Pauses playback if a song is currently playing and the bot is connected to a voice channel.
+    def for_guild(cls, guild):
+        """Returns the state of a guild, creating it on first use.
 
-            Args:
-                voice_client (VoiceClient): The Discord voice client instance.
+        Args:
+            guild (Guild): The Discord guild, or anything with an id attribute.
+
+        Returns:
+            GuildState: The state of that guild.
         """
-        if not cls._is_paused and cls.is_in_use():
-            if voice_client is not None and not voice_client.is_paused():
-                voice_client.pause()  # Pause playback on the voice client
-            cls._is_paused = True  # Update the pause state
+        now = time.monotonic()
+        if now - cls._last_sweep >= SWEEP_INTERVAL:
+            cls.evict_idle(now=now)
+
+        state = cls.guilds.get(guild.id)
+        if state is None:
+            state = cls.guilds[guild.id] = GuildState(guild.id)
+        state.last_used = now
+        return state
 
     @classmethod
-    def unpause(cls, voice_client):
-        """Resumes playback if paused and the bot is connected to a voice channel.
+    def evict_idle(cls, max_idle=IDLE_TIMEOUT, now=None):
+        """Forgets the state of every guild with nothing playing or queued that has not
+        been used for a while.
 
             Args:
-                voice_client (VoiceClient): The Discord voice client instance.
+                max_idle (float, optional): Seconds without access after which a state
+                    counts as idle.
+                now (float, optional): The current time.monotonic() value.
+
+            Returns:
+                int: The number of evicted guild states.
         """
-        if cls._is_paused and cls.is_in_use():
-            if voice_client is not None and voice_client.is_paused():
-                voice_client.resume()  # Resume playback on the voice client
-            cls._is_paused = False  # Update the pause state
+        now = time.monotonic() if now is None else now
+        cls._last_sweep = now
+        idle = [
+            guild_id
+            for guild_id, state in cls.guilds.items()
+            if state.is_idle(now, max_idle)
+        ]
+        for guild_id in idle:
+            state = cls.guilds.pop(guild_id)
+            # Only unload the state; its snapshot is dropped only if there is nothing in
+            # it worth restoring
+            if cls.store is not None and not state.song_queue and not state.is_in_use():
+                cls.store.forget(guild_id)
+        return len(idle)
 
     @classmethod
-    def stop(cls, voice_client):
-        """Stops playback and resets playback-related attributes.
+    def persist(cls, state):
+        """Schedules a snapshot of a guild's state to be saved, after its queue, current
+        song or loop flag changed. Does nothing unless a state store is in use.
 
             Args:
-                voice_client (VoiceClient): The Discord voice client instance.
+                state (GuildState): The state that changed.
         """
-        if voice_client is not None and cls.is_in_use():
-            voice_client.stop()  # Stop playback on the voice client
-        cls.current_song_playing = None  # Reset the current song
-        cls._is_paused = False  # Reset the pause state
+        if cls.store is not None:
+            cls.store.mark_dirty(state)
 
     @classmethod
-    def is_looping(cls):
-        """Checks if the bot is in looping mode.
+    def restore(cls, store):
+        """Loads every guild state saved in a state store, and saves changes to it from
+        now on.
+
+            Args:
+                store (StateStore): The store.
 
             Returns:
-                bool: True if looping is enabled, False otherwise.
+                int: The number of restored guild states.
         """
-        return cls._is_looping
+        states = store.load_all()
+        cls.guilds.update(states)
+        cls.store = store
+        return len(states)
 
     @classmethod
-    def set_is_looping(cls, is_looping):
-        """Sets the looping state of the bot.
+    def log_command(cls, ctx, msg, event="command", **fields):
+        """Logs a command action with the specified message. The guild, user and command
+        are attached to the record as structured fields (see log_pipeline.py), where
+        they only cost an enqueue on the event loop.
 
             Args:
-                is_looping (bool): The new looping state to set.
+                ctx (Context): The context of the command, used to access author and
+                    command name.
+                msg (str): The message to log, providing additional details.
+                event (str, optional): What the record describes, e.g. "song_end", so
+                    that frequent events can be sampled.
+                **fields: More structured fields, e.g. latency_ms.
+        """
+        cls.logger.info(
+            f"ENIGMA ({ctx.author.name} /{ctx.command.name}) {msg}",
+            extra={
+                "event": event,
+                "guild": getattr(ctx.guild, "id", None),
+                "user": ctx.author.name,
+                "command": ctx.command.name,
+                **fields,
+            },
+        )
+
+    @classmethod
+    def log_outcome(cls, ctx, seconds):
+        """Logs that a command finished, with how long it took and whether it raised.
+
+        Args:
+            ctx (Context): The context of the command.
+            seconds (float | None): How long the command took, if known.
         """
-        cls._is_looping = is_looping  # Update the looping state
+        outcome = "error" if ctx.command_failed else "ok"
+        cls.log_command(
+            ctx,
+            f"Finished ({outcome})",
+            event="command_end",
+            latency_ms=None if seconds is None else round(seconds * 1e3, 3),
+            outcome=outcome,
+        )
+
+    @classmethod
+    async def log_and_send(cls, ctx, msg):
+        """Sends a message to the user and logs the command action.
+
+        Args:
+            ctx (Context): The context of the command, used for logging and sending
+                messages.
+            msg (str): The message to send and log.
+        """
+        with stage("discord_send"):
+            await ctx.send(msg)  # Send message to the Discord channel
+        # Log the command action, which only queues the record
+        cls.log_command(ctx, msg)
+
+    @classmethod
+    def is_in_voice_channel(cls, voice_client):
+        """Checks if the bot is connected to a voice channel.
+
+        Args:
+            voice_client (VoiceClient): The Discord voice client instance.
+
+        Returns:
+            bool: True if the bot is connected to a voice channel, False otherwise.
+        """
+        return voice_client is not None and voice_client.is_connected()
+
+
+metrics.gauge(
+    "enigma_guild_states",
+    "Guilds the bot keeps a state for.",
+    lambda: len(BotState.guilds),
+)
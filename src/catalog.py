@@ -0,0 +1,347 @@
+"""
+catalog.py
+
+This module defines the SongCatalog class, an in-memory copy of a song dataset that is
+parsed from disk once per process and then queried by the bot's commands, instead of
+every /poll and /recommend re-reading the CSV.
+
+Attributes:
+    - SONGS_CSV (str): Path of the Kaggle 1950-2019 dataset with audio features
+        (track_name, artist, genre, ...).
+    - MUSIC_CSV (str): Path of the larger dataset used for polls and recommendations
+        (track_name, artist_name, ...).
+    - STRING_COLUMNS (tuple): Columns that are normalized to plain strings when a
+        catalog is loaded.
+    - CATEGORICAL_COLUMNS (tuple): String columns with few distinct values, stored as a
+      pandas Categorical (integer codes into a shared table of strings) so that each
+      distinct value is held once and rows compare as integers.
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.catalog_index import ColumnIndex, song_key, song_keys
+from src.columnar import columnar_path, is_fresh, read_columnar
+
+SONGS_CSV = "./data/songs.csv"
+MUSIC_CSV = "./data/tcc_ceds_music.csv"
+
+STRING_COLUMNS = ("track_name", "artist_name", "artist", "genre")
+CATEGORICAL_COLUMNS = ("artist_name", "artist", "genre")
+
+_catalogs = {}  # Process-wide catalogs, keyed by the path they were loaded from
+_catalogs_lock = threading.Lock()
+
+
+class SongCatalog:
+    """
+    A song dataset held in memory. The CSV is parsed on first access and every query
+    afterwards runs against the cached DataFrame.
+
+    Loading and building views or indexes happen under a lock, so threads that need the
+    catalog at the same time wait for a single load instead of each parsing the CSV.
+    Reads of what is already built take no lock.
+    """
+
+    def __init__(self, path):
+        """Initializes a catalog for the given dataset. Nothing is read until the songs
+        are first requested.
+
+        Args:
+            path (str): The path of the CSV file backing this catalog.
+        """
+        self.path = path
+        self._songs = None  # The parsed dataset, once loaded
+        # Cached column projections and deduplicated copies of the dataset
+        self._views = {}
+        # Inverted indexes built so far, kept up to date across reloads
+        self._indexes = {}
+        # Held while loading and while building views and indexes
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_frame(cls, songs, path=None):
+        """Creates a catalog that serves an existing DataFrame instead of reading a
+        file.
+
+        Args:
+            songs (DataFrame): The songs to serve.
+            path (str, optional): The path reload() should read from, if any.
+
+        Returns:
+            SongCatalog: The catalog.
+        """
+        catalog = cls(path)
+        catalog._set_songs(songs)
+        return catalog
+
+    @property
+    def songs(self):
+        """The full dataset. Callers share this DataFrame and must not modify it in
+        place.
+
+        Returns:
+            DataFrame: Every song in the catalog.
+        """
+        if self._songs is None:
+            with self._lock:
+                if self._songs is None:
+                    self.load()
+        return self._songs
+
+    def load(self):
+        """Reads the dataset backing this catalog and normalizes the string columns. A
+        columnar conversion of the CSV (see columnar.py) is memory-mapped instead of
+        parsing the CSV, as long as it is up to date.
+
+        Returns:
+            DataFrame: The freshly loaded dataset.
+        """
+        if is_fresh(self.path):
+            return self._set_songs(
+                read_columnar(columnar_path(self.path), categorical=CATEGORICAL_COLUMNS)
+            )
+        return self._set_songs(pd.read_csv(self.path))
+
+    def _set_songs(self, songs):
+        """Normalizes the string columns of a dataset and makes it the catalog's
+        contents."""
+        songs = songs.reset_index(drop=True)
+        for column in STRING_COLUMNS:
+            if column not in songs.columns:
+                continue
+            values = songs[column]
+            if column not in CATEGORICAL_COLUMNS:
+                songs[column] = values.astype(str)
+            elif not isinstance(values.dtype, pd.CategoricalDtype):
+                songs[column] = values.astype(str).astype("category")
+        with self._lock:
+            self._songs = songs
+            self._views = {}
+            for name, index in self._indexes.items():
+                index.update(self._index_values(name))
+        return songs
+
+    def reload(self):
+        """Drops everything that was cached and reads the dataset from disk again.
+
+        Returns:
+            DataFrame: The freshly loaded dataset.
+        """
+        return self.load()
+
+    def __len__(self):
+        return len(self.songs)
+
+    def view(self, key, build):
+        """Returns a value derived from the dataset, computed once per load and dropped
+        when the catalog is reloaded.
+
+        Args:
+            key (hashable): Identifies the view.
+            build (callable): Computes the view from the songs DataFrame when it is not
+                cached yet.
+
+        Returns:
+            The view.
+        """
+        view = self._views.get(key)
+        if view is None:
+            with self._lock:
+                view = self._views.get(key)
+                if view is None:
+                    view = self._views[key] = build(self.songs)
+        return view
+
+    def columns(self, *names):
+        """Returns a projection of the catalog onto the given columns, computed once per
+        set of columns.
+
+        Args:
+            names (str): The columns to keep, in order.
+
+        Returns:
+            DataFrame: The catalog restricted to the given columns.
+        """
+        return self.view(("columns", names), lambda songs: songs.filter(list(names)))
+
+    def unique(self, *subset):
+        """Returns the catalog with duplicate songs removed, computed once per subset of
+        identifying columns.
+
+        Args:
+            subset (str): The columns that identify a song, e.g. "track_name",
+                "artist_name".
+
+        Returns:
+            DataFrame: The deduplicated catalog.
+        """
+        return self.view(
+            ("unique", subset), lambda songs: songs.drop_duplicates(subset=list(subset))
+        )
+
+    def _index_values(self, name):
+        """Returns the values an index is built over: a column, or the song keys for
+        ("song", artist_column). Categorical columns are passed as they are, so that the
+        index reuses their codes."""
+        if isinstance(name, tuple):
+            return song_keys(self._songs["track_name"], self._songs[name[1]])
+        values = self._songs[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return values.array
+        return values.to_numpy(dtype=object)
+
+    def _index(self, name):
+        """Returns an inverted index, building it the first time it is needed."""
+        index = self._indexes.get(name)
+        if index is None:
+            with self._lock:
+                self.songs  # make sure the dataset is loaded
+                index = self._indexes.get(name)
+                if index is None:
+                    index = self._indexes[name] = ColumnIndex(self._index_values(name))
+        return index
+
+    def index(self, column):
+        """Returns the inverted index of a column, e.g. genre -> rows. It is built on
+        first use and updated incrementally whenever the catalog is reloaded.
+
+        Args:
+            column (str): The column to index.
+
+        Returns:
+            ColumnIndex: The index.
+        """
+        return self._index(column)
+
+    def song_index(self, artist_column="artist_name"):
+        """Returns the index from normalized (track, artist) song keys (see
+        catalog_index.song_key) to rows.
+
+        Args:
+            artist_column (str, optional): The name of the artist column in this
+                dataset.
+
+        Returns:
+            ColumnIndex: The index.
+        """
+        return self._index(("song", artist_column))
+
+    def row_of(self, track_name, artist_name, artist_column="artist_name"):
+        """Finds a song by its track and artist, ignoring capitalization and spacing.
+
+        Args:
+            track_name (str): The name of the track.
+            artist_name (str): The name of the artist.
+            artist_column (str, optional): The name of the artist column in this
+                dataset.
+
+        Returns:
+            int | None: The row of the song's first occurrence, or None if it is not in
+            the catalog.
+        """
+        return self.song_index(artist_column).first(song_key(track_name, artist_name))
+
+    def unique_rows(self, artist_column="artist_name"):
+        """Returns the rows that are not repeats of an earlier song with the same
+        normalized track and artist.
+
+        Args:
+            artist_column (str, optional): The name of the artist column in this
+                dataset.
+
+        Returns:
+            ndarray: The row positions, in catalog order.
+        """
+        return self.song_index(artist_column).first_rows()
+
+    def rows_by_genres(
+        self, genres, exclude_artists=(), exclude_tracks=(), artist_column="artist_name"
+    ):
+        """Finds the songs whose genre is one of the given genres, leaving out the given
+        artists and tracks.
+
+        Every lookup goes through the integer codes of the genre, artist and track name
+        indexes, so no strings are compared. The indexes are built from the codes of the
+        Categorical columns, but keep their own codes across reloads (see
+        ColumnIndex.update), so their codes are only meaningful to the index. The rows
+        of the left out artists and tracks are few and are dropped through a table of
+        rows to keep, rather than by searching them.
+
+        Args:
+            genres (iterable[str]): The genres to match.
+            exclude_artists (iterable[str], optional): Artists whose songs should be
+                left out.
+            exclude_tracks (iterable[str], optional): Track names that should be left
+                out.
+            artist_column (str, optional): The name of the artist column in this
+                dataset.
+
+        Returns:
+            ndarray: The row positions of the matching songs, in catalog order.
+        """
+        rows = self.index("genre").rows_for(genres)
+        excluded = np.concatenate(
+            (
+                self.index(artist_column).rows_for(exclude_artists),
+                self.index("track_name").rows_for(exclude_tracks),
+            )
+        )
+        if len(rows) and len(excluded):
+            keep = np.ones(len(self._songs), dtype=bool)
+            keep[excluded] = False
+            rows = rows[keep[rows]]
+        return rows
+
+    def by_genres(
+        self, genres, exclude_artists=(), exclude_tracks=(), artist_column="artist_name"
+    ):
+        """Returns the songs whose genre is one of the given genres, leaving out the
+        given artists and tracks.
+
+        Takes the same arguments as rows_by_genres().
+
+        Returns:
+            DataFrame: The matching songs.
+        """
+        rows = self.rows_by_genres(
+            genres, exclude_artists, exclude_tracks, artist_column
+        )
+        return self.songs.iloc[rows]
+
+
+def get_catalog(path=MUSIC_CSV):
+    """Returns the process-wide catalog for a dataset, creating it on first use.
+
+    Args:
+        path (str, optional): The path of the dataset. Defaults to MUSIC_CSV.
+
+    Returns:
+        SongCatalog: The shared catalog for that path.
+    """
+    catalog = _catalogs.get(path)
+    if catalog is None:
+        with _catalogs_lock:
+            catalog = _catalogs.get(path)
+            if catalog is None:
+                catalog = _catalogs[path] = SongCatalog(path)
+    return catalog
+
+
+def use_catalog(catalog, path=MUSIC_CSV):
+    """Installs a catalog as the process-wide catalog for a dataset, e.g. one created
+    with SongCatalog.from_frame.
+
+    Args:
+        catalog (SongCatalog): The catalog to install.
+        path (str, optional): The dataset it stands in for. Defaults to MUSIC_CSV.
+    """
+    _catalogs[path] = catalog
+
+
+def reset_catalogs():
+    """Forgets every loaded catalog so that the next query reads the datasets from disk
+    again."""
+    _catalogs.clear()
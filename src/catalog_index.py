@@ -0,0 +1,296 @@
+"""
+catalog_index.py
+
+This module defines the ColumnIndex class, an inverted index from the values of one
+catalog column to the rows that hold them. It lets the catalog answer "which rows have
+genre X" by looking up a small array of row ids instead of scanning the whole column.
+
+Attributes:
+    - SONG_KEY_SEPARATOR (str): Joins the normalized track name and artist of a song
+        key.
+"""
+
+import numpy as np
+import pandas as pd
+
+SONG_KEY_SEPARATOR = "\x1f"  # ASCII unit separator
+
+_EMPTY = np.zeros(0, dtype=np.intp)
+
+
+def normalize_name(name):
+    """Normalizes a track or artist name for comparison: case-folded, with runs of
+    whitespace collapsed. A missing name, None or NaN, normalizes to "".
+
+    Args:
+        name (str | None): The name.
+
+    Returns:
+        str: The normalized name.
+    """
+    if name is None or name != name:  # NaN is the only value not equal to itself
+        return ""
+    return " ".join(str(name).casefold().split())
+
+
+def song_key(track_name, artist_name):
+    """Returns the key that identifies a song regardless of capitalization and spacing.
+
+    Args:
+        track_name (str): The name of the track.
+        artist_name (str | None): The name of the artist, None if unknown.
+
+    Returns:
+        str: The song's key.
+    """
+    return normalize_name(track_name) + SONG_KEY_SEPARATOR + normalize_name(artist_name)
+
+
+def song_keys(track_names, artist_names):
+    """The vectorized version of song_key().
+
+    Args:
+        track_names (Series): The names of the tracks.
+        artist_names (Series): The names of their artists, aligned with track_names.
+
+    Returns:
+        ndarray: One key per song.
+    """
+
+    def normalized(names):
+        # normalize each distinct name once; names repeat a lot, artists especially
+        codes, uniques = pd.factorize(names)
+        # inlined normalize_name(); missing names get code -1, i.e. the trailing ""
+        normalized_uniques = [
+            " ".join(str(name).casefold().split()) for name in uniques
+        ]
+        return np.array(normalized_uniques + [""], dtype=object)[codes]
+
+    return normalized(track_names) + SONG_KEY_SEPARATOR + normalized(artist_names)
+
+
+class ColumnIndex:
+    """
+    Maps every distinct value of a column to the rows holding it, in ascending row
+    order.
+
+    The rows are stored grouped by value in one array (order), with offsets[code]
+    marking where the rows of each value start, so the index costs two integer arrays
+    rather than one array object per value.
+    """
+
+    def __init__(self, values):
+        """Builds the index.
+
+        Args:
+            values (ndarray | Categorical): The column's value for every row. The codes
+                of a Categorical are used as they are, without hashing the values, but
+                they are this index's own from then on: see update().
+        """
+        if isinstance(values, pd.Categorical):
+            codes, keys = values.codes, values.categories
+        else:
+            codes, keys = pd.factorize(values)
+        self._values = values
+        self._keys = list(keys)
+        self._code_of = {key: code for code, key in enumerate(self._keys)}
+        self._codes = self._with_missing(codes)
+        self._group()
+
+    def _with_missing(self, codes):
+        """Gives missing values (code -1) a code of their own, so that every row can be
+        grouped."""
+        codes = codes.astype(np.intp)
+        missing = codes < 0
+        if missing.any():
+            if None not in self._code_of:
+                self._code_of[None] = len(self._keys)
+                self._keys.append(None)
+            codes[missing] = self._code_of[None]
+        return codes
+
+    def _group(self):
+        """Groups the row ids by value, after the codes have changed."""
+        self._order = np.argsort(self._codes, kind="stable")
+        counts = np.bincount(self._codes, minlength=len(self._keys))
+        self._offsets = np.concatenate(([0], np.cumsum(counts)))
+        self._first_rows = None
+
+    def __len__(self):
+        return len(self._values)
+
+    @property
+    def keys(self):
+        """list: The distinct values, indexed by their code. Values no row holds any
+        more may still be listed."""
+        return self._keys
+
+    @property
+    def codes(self):
+        """ndarray: An integer code per row, equal for rows with the same value. Cheaper
+        to compare than the values."""
+        return self._codes
+
+    def __contains__(self, key):
+        return self._count(self._code_of.get(key)) > 0
+
+    def _count(self, code):
+        if code is None:
+            return 0
+        return self._offsets[code + 1] - self._offsets[code]
+
+    def mask_for(self, keys):
+        """Returns a lookup table that is True at the code of every given value.
+        Indexing it with codes filters rows by comparing integers instead of values.
+
+        Args:
+            keys (iterable): The values.
+
+        Returns:
+            ndarray: One bool per code.
+        """
+        mask = np.zeros(len(self._keys), dtype=bool)
+        codes = [self._code_of[key] for key in set(keys) if key in self._code_of]
+        mask[codes] = True
+        return mask
+
+    def matches(self, keys, rows):
+        """Checks which of the given rows hold one of the given values.
+
+        Args:
+            keys (iterable): The values.
+            rows (ndarray): The row ids to check.
+
+        Returns:
+            ndarray: One bool per row, aligned with rows.
+        """
+        return self.mask_for(keys)[self._codes[rows]]
+
+    def rows(self, key):
+        """Returns the rows holding a value.
+
+        Args:
+            key: The value.
+
+        Returns:
+            ndarray: The row ids, ascending. Empty if no row holds the value.
+        """
+        code = self._code_of.get(key)
+        if code is None:
+            return _EMPTY
+        return self._order[self._offsets[code] : self._offsets[code + 1]]
+
+    def rows_for(self, keys):
+        """Returns the rows holding any of the given values.
+
+        Args:
+            keys (iterable): The values.
+
+        Returns:
+            ndarray: The row ids, ascending.
+        """
+        keys = set(keys)
+        groups = [self.rows(key) for key in keys]
+        groups = [rows for rows in groups if len(rows)]
+        if not groups:
+            return _EMPTY
+        if len(groups) == 1:
+            return groups[0]
+        # Merging the groups costs a sort of the matching rows, and one pass over the
+        # codes is cheaper once they are a sizeable share of the column
+        if sum(len(rows) for rows in groups) > len(self._codes) // 8:
+            return np.flatnonzero(self.mask_for(keys)[self._codes])
+        return np.sort(np.concatenate(groups))
+
+    def first(self, key):
+        """Returns the first row holding a value.
+
+        Args:
+            key: The value.
+
+        Returns:
+            int | None: The row id, or None if no row holds the value.
+        """
+        rows = self.rows(key)
+        return int(rows[0]) if len(rows) else None
+
+    def first_rows(self):
+        """Returns the first row of every distinct value, i.e. the rows that are not
+        repeats of an earlier row.
+
+        Returns:
+            ndarray: The row ids, ascending.
+        """
+        if self._first_rows is None:
+            starts = self._offsets[:-1][np.diff(self._offsets) > 0]
+            self._first_rows = np.sort(self._order[starts])
+        return self._first_rows
+
+    def update(self, values):
+        """Brings the index in line with a new version of the column, re-hashing only
+        the rows whose value changed.
+
+        Args:
+            values (ndarray | Categorical): The column's new value for every row.
+
+        Returns:
+            int: How many rows changed.
+        """
+        if isinstance(values, pd.Categorical):
+            return self._update_codes(values)
+
+        old, new = self._values, values
+        common = min(len(old), len(new))
+        changed = np.flatnonzero(old[:common] != new[:common])
+        added = np.arange(common, len(new))
+        if not len(changed) and not len(added) and len(old) == len(new):
+            self._values = values
+            return 0
+
+        dirty = np.concatenate((changed, added))
+        if len(dirty) > len(new) // 2:
+            self.__init__(values)  # cheaper to start over
+            return len(dirty) + max(len(old) - len(new), 0)
+
+        codes = np.empty(len(new), dtype=np.intp)
+        codes[:common] = self._codes[:common]
+        dirty_codes, dirty_keys = pd.factorize(new[dirty])
+        for key in dirty_keys:
+            if key not in self._code_of:
+                self._code_of[key] = len(self._keys)
+                self._keys.append(key)
+        codes[dirty] = np.array(
+            [self._code_of[key] for key in dirty_keys], dtype=np.intp
+        )[dirty_codes]
+
+        self._values = values
+        self._codes = codes
+        self._group()
+        return len(dirty) + max(len(old) - len(new), 0)
+
+    def _update_codes(self, values):
+        """update() for a Categorical: its codes are translated into the codes of this
+        index, so that the rows that changed are found by comparing integers. The index
+        keeps its codes, so they stop matching the Categorical's codes once the new
+        column orders its categories differently."""
+        lookup = np.empty(len(values.categories), dtype=np.intp)
+        for code, key in enumerate(values.categories):
+            if key not in self._code_of:
+                self._code_of[key] = len(self._keys)
+                self._keys.append(key)
+            lookup[code] = self._code_of[key]
+        codes = values.codes
+        new = lookup[codes] if len(lookup) else np.zeros(len(codes), dtype=np.intp)
+        missing = codes < 0
+        if missing.any():
+            new[missing] = self._with_missing(codes[missing])
+
+        common = min(len(self._codes), len(new))
+        dirty = np.count_nonzero(self._codes[:common] != new[:common]) + abs(
+            len(self._codes) - len(new)
+        )
+        self._values = values
+        if dirty:
+            self._codes = new
+            self._group()
+        return dirty
@@ -0,0 +1,202 @@
+"""
+columnar.py
+
+This module converts a song dataset from CSV into a compact columnar layout that the
+catalog can memory-map instead of parsing, and reads it back. A converted dataset is a
+directory next to the CSV (e.g. ./data/songs.csv.columnar):
+
+    meta.json                 the row count, the columns and the size and modification
+    time of the source CSV <n>.npy                   a numeric column, as a fixed-width
+    NumPy array <n>.codes.npy             a string column, as int32 codes into its
+    dictionary (-1 for missing values) <n>.dict.bin / .dict.npy  the dictionary of a
+    string column: its distinct values as UTF-8, and their offsets
+
+The arrays are opened with mmap_mode="r", so loading costs little more than decoding the
+dictionaries, and several bot processes on one host share the pages of the numeric
+columns and codes.
+
+Convert a dataset once, and again whenever the CSV changes (a stale conversion is
+ignored):
+    python -m src.columnar ./data/songs.csv [more.csv ...]
+
+Attributes:
+    - FORMAT_VERSION (int): The version of the layout, stored in meta.json.
+    - SUFFIX (str): Appended to the path of a CSV to get the path of its converted
+        directory.
+"""
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+SUFFIX = ".columnar"
+
+
+def columnar_path(csv_path):
+    """Returns where the converted form of a CSV is stored.
+
+    Args:
+        csv_path (str): The path of the CSV.
+
+    Returns:
+        str: The path of the converted directory.
+    """
+    return f"{csv_path}{SUFFIX}"
+
+
+def _source_stamp(csv_path):
+    """Identifies a version of the source CSV by its size and modification time."""
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_meta(directory):
+    with open(os.path.join(directory, "meta.json"), encoding="utf-8") as file:
+        return json.load(file)
+
+
+def is_fresh(csv_path):
+    """Checks if a CSV has a converted form that was made from its current contents.
+
+    Args:
+        csv_path (str): The path of the CSV.
+
+    Returns:
+        bool: True if the converted form can be loaded instead of the CSV.
+    """
+    try:
+        meta = _read_meta(columnar_path(csv_path))
+        return meta["version"] == FORMAT_VERSION and meta["source"] == _source_stamp(
+            csv_path
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+
+
+def write_columnar(songs, directory, source=None):
+    """Writes a dataset in the columnar layout, replacing any previous conversion
+    atomically.
+
+    Args:
+        songs (DataFrame): The dataset.
+        directory (str): The directory to write.
+        source (dict, optional): The stamp of the CSV the dataset was read from.
+    """
+    tmp_directory = f"{directory}.tmp"
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    os.makedirs(tmp_directory)
+
+    columns = []
+    for number, name in enumerate(songs.columns):
+        values = songs[name]
+        prefix = os.path.join(tmp_directory, str(number))
+        if pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(
+            values.dtype
+        ):
+            np.save(f"{prefix}.npy", values.to_numpy())
+            columns.append({"name": name, "kind": "numeric"})
+            continue
+
+        codes, uniques = pd.factorize(values)
+        encoded = [str(value).encode("utf-8") for value in uniques]
+        np.save(f"{prefix}.codes.npy", codes.astype(np.int32))
+        np.save(
+            f"{prefix}.dict.npy",
+            np.cumsum([0] + [len(value) for value in encoded], dtype=np.int64),
+        )
+        with open(f"{prefix}.dict.bin", "wb") as file:
+            file.write(b"".join(encoded))
+        columns.append({"name": name, "kind": "string"})
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "rows": len(songs),
+        "source": source,
+        "columns": columns,
+    }
+    with open(os.path.join(tmp_directory, "meta.json"), "w", encoding="utf-8") as file:
+        json.dump(meta, file)
+
+    old_directory = f"{directory}.old"
+    shutil.rmtree(old_directory, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, old_directory)
+    os.replace(tmp_directory, directory)
+    shutil.rmtree(old_directory, ignore_errors=True)
+
+
+def read_columnar(directory, categorical=()):
+    """Loads a dataset written by write_columnar(). Numeric columns stay memory-mapped,
+    string columns are rebuilt from their dictionaries.
+
+    Args:
+        directory (str): The converted directory.
+        categorical (iterable[str], optional): String columns to return as a pandas
+            Categorical built straight from the stored codes and dictionary, instead of
+            as one string object per row.
+
+    Returns:
+        DataFrame: The dataset.
+    """
+    meta = _read_meta(directory)
+    categorical = set(categorical)
+    data = {}
+    for number, column in enumerate(meta["columns"]):
+        prefix = os.path.join(directory, str(number))
+        if column["kind"] == "numeric":
+            # a plain ndarray view, so that results computed from the column are not
+            # np.memmap instances
+            data[column["name"]] = np.load(f"{prefix}.npy", mmap_mode="r").view(
+                np.ndarray
+            )
+            continue
+
+        offsets = np.load(f"{prefix}.dict.npy").tolist()
+        with open(f"{prefix}.dict.bin", "rb") as file:
+            blob = file.read()
+        dictionary = [
+            blob[start:end].decode("utf-8")
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+        codes = np.load(f"{prefix}.codes.npy", mmap_mode="r")
+        if column["name"] in categorical:
+            data[column["name"]] = pd.Categorical.from_codes(
+                np.asarray(codes), dictionary, validate=False
+            )
+            continue
+        dictionary.append(None)  # what the -1 code of a missing value picks
+        data[column["name"]] = np.array(dictionary, dtype=object)[codes]
+    return pd.DataFrame(data, copy=False)
+
+
+def convert(csv_path):
+    """Converts a CSV into the columnar layout next to it.
+
+    Args:
+        csv_path (str): The path of the CSV.
+
+    Returns:
+        str: The path of the converted directory.
+    """
+    directory = columnar_path(csv_path)
+    write_columnar(pd.read_csv(csv_path), directory, _source_stamp(csv_path))
+    return directory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Converts song datasets into the catalog's columnar layout."
+    )
+    parser.add_argument("csv", nargs="+", help="the CSV files to convert")
+    for csv_path in parser.parse_args(argv).csv:
+        directory = convert(csv_path)
+        print(f"{csv_path} -> {directory} ({_read_meta(directory)['rows']} songs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,10 @@
 """
-This file is responsible for handling all data operations such as showing songs that the user can select.
-Recommendation of songs filtering operations etc.
+This file is responsible for handling all data operations such as showing songs that the
+user can select. Recommendation of songs filtering operations etc.
 """
 
-import pandas as pd
-import random
+from src.catalog import get_catalog, SONGS_CSV, MUSIC_CSV
+from src.sampler import genre_sampler, sample_rows
 
 """
 This function returns songs and their track_name, artist, year and genre.
@@ -12,9 +12,7 @@
 
 
 def filtered_songs():
-    all_songs = pd.read_csv("./data/songs.csv")
-    all_songs = all_songs.filter(["track_name", "artist", "year", "genre"])
-    return all_songs
+    return get_catalog(SONGS_CSV).columns("track_name", "artist", "year", "genre")
 
 
 """
@@ -23,31 +21,23 @@ def filtered_songs():
 
 
 def get_all_songs():
-    all_songs = pd.read_csv("./data/tcc_ceds_music.csv")
-    return all_songs
+    return get_catalog(MUSIC_CSV).songs
 
 
 """
-This function returns 10 songs within different genre for generating the poll for the user
+This function returns n random songs for generating the poll for the user, without
+repeats of the same track and artist. With one_per_genre, no two of the songs share a
+genre.
 """
 
 
-def get_songs_by_genre(n=10):
-    all_songs = pd.read_csv("./data/tcc_ceds_music.csv")
-    unique_songs = all_songs.drop_duplicates(subset=["track_name", "artist_name"])
-    sampled_songs = pd.DataFrame()  # use a DataFrame to collect samples
+def get_songs_by_genre(n=10, one_per_genre=False):
+    catalog = get_catalog(MUSIC_CSV)
 
-    # to keep track of what has been added
-    sampled_ids = set()
+    if one_per_genre:
+        sampled_rows = genre_sampler(catalog).sample(n)
+    else:
+        # rows that are not repeats of the same track and artist
+        sampled_rows = sample_rows(catalog.unique_rows(), n)
 
-    while len(sampled_songs) < n:
-        song = unique_songs.sample(1)
-        # creating a tuple identifier
-        song_id = (song["track_name"].iloc[0], song["artist_name"].iloc[0])
-
-        if song_id not in sampled_ids:
-            sampled_ids.add(song_id)
-            # safely concatenate without duplication
-            sampled_songs = pd.concat([sampled_songs, song])
-
-    return sampled_songs
+    return catalog.songs.iloc[sampled_rows]
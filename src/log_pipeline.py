@@ -0,0 +1,220 @@
+"""
+log_pipeline.py
+
+This module moves the bot's log output off the event loop. A command logging something
+only puts the record on a queue (logging.handlers.QueueHandler); a QueueListener thread
+formats it as one JSON object per line and writes it to a rotating file, and to the
+console, so a slow disk or terminal never holds up a command or a song transition.
+
+Records carry structured fields next to their message: the guild, the user, the command,
+the event they describe (see BotState.log_command), and for finished commands their
+latency and outcome. Events that can be frequent can be
+sampled: with a rate of 0.1 for an event, one record in ten is kept. Warnings and errors
+    are always kept.
+
+Attributes:
+    - LOGGER_NAME (str): The logger the bot's own records go to.
+    - LOG_FILE (str): Where the JSON records are written by default.
+    - MAX_BYTES (int): The size at which the log file is rotated.
+    - BACKUP_COUNT (int): How many rotated files are kept.
+    - FIELDS (tuple[str]): The structured fields copied from a record into its JSON
+        object, when set.
+"""
+
+import copy
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOGGER_NAME = "enigma"
+LOG_FILE = "./logs/enigma.jsonl"
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+FIELDS = ("event", "guild", "user", "command", "latency_ms", "outcome")
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single line of JSON, with its time, level, logger and message,
+    the structured FIELDS it has, and the traceback of its exception if there is one.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        elif record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fixed share of the records of each sampled event: with a rate of 0.25, every
+    fourth one. Counting rather than drawing random numbers keeps the share exact over
+    short bursts. Records of events without a rate, and records at WARNING or above, are
+    always kept.
+    """
+
+    def __init__(self, rates=None):
+        """Initializes the filter.
+
+        Args:
+            rates (dict[str, float], optional): The share of records to keep, between 0
+                and 1, by event.
+        """
+        super().__init__()
+        self._every = {}  # event -> keep one record in this many, 0 to keep none
+        self._seen = {}  # event -> records of that event seen so far
+        for event, rate in (rates or {}).items():
+            self.set_rate(event, rate)
+
+    def set_rate(self, event, rate):
+        """Changes the share of records kept for an event.
+
+        Args:
+            event (str): The event.
+            rate (float): The share of records to keep, between 0 (none) and 1 (all).
+        """
+        if not 0 <= rate <= 1:
+            raise ValueError(
+                f"Sample rate of {event} must be between 0 and 1, got {rate}"
+            )
+        if rate == 1:
+            self._every.pop(event, None)
+        else:
+            self._every[event] = round(1 / rate) if rate else 0
+
+    def filter(self, record):
+        every = self._every.get(getattr(record, "event", None))
+        if every is None or record.levelno >= logging.WARNING:
+            return True
+        if every == 0:
+            return False
+        seen = self._seen.get(record.event, 0)
+        self._seen[record.event] = seen + 1
+        return seen % every == 0
+
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    Queues records with their message merged with its arguments, since those may not be
+    safe to read from another thread later. Unlike QueueHandler, it keeps a traceback as
+    exc_text instead of folding it into the message.
+    """
+
+    def prepare(self, record):
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+def start_logging(
+    path=LOG_FILE,
+    sample_rates=None,
+    console=True,
+    max_bytes=MAX_BYTES,
+    backup_count=BACKUP_COUNT,
+):
+    """Routes the bot's logger through a queue to a thread that writes JSON lines to a
+    rotating file.
+
+    The logger stops propagating to the root logger, whose handlers write synchronously,
+    so with console set the listener writes to the console as well.
+
+    Args:
+        path (str, optional): The log file. Its directory is created if needed.
+        sample_rates (dict[str, float], optional): The share of records to keep by
+            event, see SamplingFilter.
+        console (bool, optional): Whether to also write the records to stderr.
+        max_bytes (int, optional): The size at which the log file is rotated.
+        backup_count (int, optional): How many rotated files are kept.
+
+    Returns:
+        QueueListener: The running listener. Pass it to stop_logging() on shutdown.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    file_handler = RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)-8s %(name)s %(message)s")
+        )
+        handlers.append(console_handler)
+
+    records = queue.SimpleQueue()
+    queue_handler = _RecordQueueHandler(records)
+    # dropped records never reach the queue
+    queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_logging(listener):
+    """Writes the records still queued, stops the listener thread and detaches the queue
+    from the bot's logger.
+
+    Args:
+        listener (QueueListener): The listener returned by start_logging().
+    """
+    listener.stop()
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        if isinstance(handler, QueueHandler) and handler.queue is listener.queue:
+            logger.removeHandler(handler)
+    logger.propagate = True
+    for handler in listener.handlers:
+        handler.close()
+
+
+def parse_sample_rates(specs):
+    """Parses sample rates given as EVENT=RATE strings, e.g. from the command line.
+
+    Args:
+        specs (iterable[str]): The specifications, e.g. ["song_end=0.1"].
+
+    Returns:
+        dict[str, float]: The rates by event.
+
+    Raises:
+        ValueError: If a specification is not of the form EVENT=RATE.
+    """
+    rates = {}
+    for spec in specs:
+        event, separator, rate = spec.partition("=")
+        if not separator or not event:
+            raise ValueError(f"Expected EVENT=RATE, got {spec!r}")
+        rates[event] = float(rate)
+    return rates
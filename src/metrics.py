@@ -0,0 +1,394 @@
+"""
+metrics.py
+
+This module defines the counters, gauges and latency histograms the bot keeps about
+itself, and an optional HTTP exporter that serves them in the Prometheus text exposition
+format, so that a local Prometheus (or curl) can see where command latency goes.
+
+Recording a value is meant to be cheap enough for the hot path: a labelled child is
+looked up once per label combination and cached, and a histogram observation is a bisect
+into its bucket bounds plus two additions under a lock, so values can be recorded from
+the voice client's player thread as well as from the event loop. Buckets are only made
+cumulative when the metrics are rendered.
+
+Attributes:
+    - LATENCY_BUCKETS (tuple[float]): The default histogram bucket bounds, in seconds.
+    - METRICS_HOST (str): The address the exporter listens on by default; only local
+        clients can reach it.
+    - metrics (Registry): The process-wide registry the cogs record to.
+    - commands_total (Counter): Commands run, by command and outcome.
+    - command_seconds (Histogram): How long commands took, by command.
+    - stage_seconds (Histogram): How long the stages commands wait on took, by stage.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+)
+METRICS_HOST = "127.0.0.1"
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    What every metric has in common: a name, a help text, label names and one child per
+    combination of label values.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}  # label values -> child
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        """Returns the child of a combination of label values, creating it on first use.
+
+        Args:
+            *values: One value per label name, in order.
+
+        Returns:
+            The child, with the same recording methods as an unlabelled metric.
+        """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(
+                    f"{self.name} expects labels {self.labelnames}, got {values}"
+                )
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        """Yields the samples of the metric as (suffix, label values, extra label,
+        value) tuples."""
+        raise NotImplementedError
+
+    def render(self):
+        """Renders the metric in the Prometheus text format.
+
+        Returns:
+            list[str]: The lines of the metric, starting with its HELP and TYPE lines.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for suffix, values, extra, value in self.samples():
+            labels = _format_labels(self.labelnames, values, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock):
+        self.value = 0
+        self._lock = lock
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, such as the number of commands run.
+    """
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._lock)
+
+    def inc(self, amount=1):
+        """Increments the unlabelled counter.
+
+        Args:
+            amount (float, optional): How much to add.
+        """
+        self._children[()].inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield "", values, "", child.value
+
+
+class Gauge(_Metric):
+    """
+    A value read when the metrics are rendered, such as the number of open sessions. Its
+    function returns either a number, or a dict from label values (a tuple, or a single
+    value for one label) to numbers.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, fn, labelnames=()):
+        self.fn = fn
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return None
+
+    def samples(self):
+        value = self.fn()
+        if not isinstance(value, dict):
+            yield "", (), "", value
+            return
+        for values, number in value.items():
+            yield "", values if isinstance(values, tuple) else (values,), "", number
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds, lock):
+        self.bounds = bounds
+        # per bucket, not cumulative; the last one is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = lock
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values, such as latencies, counted into buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets, self._lock)
+
+    def observe(self, value):
+        """Records a value in the unlabelled histogram.
+
+        Args:
+            value (float): The value, e.g. seconds.
+        """
+        self._children[()].observe(value)
+
+    def time(self):
+        """Returns a context manager that records how many seconds its block took."""
+        return self._children[()].time()
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            with self._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", values, f'le="{_format_value(bound)}"', cumulative
+            yield "_sum", values, "", total
+            yield "_count", values, "", cumulative
+
+
+class Registry:
+    """
+    A set of metrics, rendered together.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Registers a Counter. See Counter."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """Registers a Histogram. See Histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, fn, labelnames=()):
+        """Registers a Gauge. See Gauge."""
+        return self._register(Gauge(name, documentation, fn, labelnames))
+
+    def get(self, name):
+        """Returns the metric registered under a name, or None."""
+        return self._metrics.get(name)
+
+    def render(self):
+        """Renders every metric in the Prometheus text format.
+
+        Returns:
+            str: The exposition, ending with a newline.
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would drown the bot's own log
+
+
+def start_exporter(port, host=METRICS_HOST, registry=None):
+    """Serves the metrics on http://host:port/metrics from a daemon thread, so scrapes
+    never run on the event loop.
+
+    Args:
+        port (int): The port to listen on, or 0 for any free port.
+        host (str, optional): The address to listen on.
+        registry (Registry, optional): The metrics to serve. Defaults to the
+            process-wide registry.
+
+    Returns:
+        ThreadingHTTPServer: The running server; call shutdown() on it to stop it.
+    """
+    handler = type(
+        "MetricsHandler", (_MetricsHandler,), {"registry": registry or metrics}
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="enigma-metrics", daemon=True
+    ).start()
+    return server
+
+
+metrics = Registry()
+
+commands_total = metrics.counter(
+    "enigma_commands_total",
+    "Commands run, by command and outcome.",
+    ("command", "status"),
+)
+command_seconds = metrics.histogram(
+    "enigma_command_seconds",
+    "How long commands took, including waits for user clicks.",
+    ("command",),
+)
+stage_seconds = metrics.histogram(
+    "enigma_stage_seconds",
+    "How long the stages commands wait on took: catalog_query, "
+    "generate_recommendations, resolve, "
+    "ffmpeg_first_packet, discord_send and song_transition.",
+    ("stage",),
+)
+
+
+def command_started(ctx):
+    """Notes when a command started, for command_finished(). Called from the cogs'
+    cog_before_invoke.
+
+    Args:
+        ctx (Context): The context of the command.
+    """
+    ctx.started_at = time.perf_counter()
+
+
+def command_finished(ctx):
+    """Counts a finished command, by whether it raised, and records how long it took.
+    Called from the cogs' cog_after_invoke, which discord.py runs whether or not the
+    command raised.
+
+    Args:
+        ctx (Context): The context of the command.
+
+    Returns:
+        float | None: How long the command took, or None if command_started() was not
+        called for it.
+    """
+    name = ctx.command.name
+    commands_total.labels(name, "error" if ctx.command_failed else "ok").inc()
+    started_at = getattr(ctx, "started_at", None)
+    if started_at is None:
+        return None
+    seconds = time.perf_counter() - started_at
+    command_seconds.labels(name).observe(seconds)
+    return seconds
+
+
+def stage(name):
+    """Returns a context manager that records how long its block took as a stage.
+
+    Args:
+        name (str): The stage, e.g. "resolve".
+    """
+    return stage_seconds.labels(name).time()
@@ -0,0 +1,103 @@
+"""
+playback.py
+
+This module defines the Playback class, the playback state machine of one voice client.
+It replaces busy-waiting on BotState with an asyncio.Event that the voice client's
+"after" callback sets once a track has really ended, and it tells apart a track that
+ended on its own (or was skipped) from one that was stopped to hand over to another
+song.
+
+Attributes:
+    - STOP_TIMEOUT (float): Seconds to wait for a stopped track to end before starting
+        the next one anyway.
+"""
+
+import asyncio
+import time
+
+STOP_TIMEOUT = 5.0
+
+
+class Playback:
+    """
+    Tracks which track a voice client is playing. Every started track gets a generation
+    number, so the "after" callback of an old track can never affect the one that
+    replaced it.
+    """
+
+    def __init__(self):
+        """Initializes an idle playback."""
+        self.generation = 0  # Incremented every time a track starts
+        # Set when the current track is stopped to make room for another song
+        self._handing_off = False
+        self._idle = asyncio.Event()  # Set while no track is playing
+        self._idle.set()
+        # time.perf_counter() when the last track ended and the queue was to advance
+        self.ended_at = None
+
+    def is_playing(self):
+        """Checks if a track has started and not ended yet.
+
+        Returns:
+            bool: True if a track is playing, False otherwise.
+        """
+        return not self._idle.is_set()
+
+    def begin(self):
+        """Marks the start of a new track.
+
+        Returns:
+            int: The generation of the new track, to be passed back to end() by its
+                "after" callback.
+        """
+        self.generation += 1
+        self._handing_off = False
+        self._idle.clear()
+        return self.generation
+
+    def end(self, generation):
+        """Marks the end of a track. Must be called on the event loop. If the queue
+        should advance, the time is kept in ended_at, so that the gap until the next
+        track starts can be measured.
+
+        Args:
+            generation (int): The generation returned by begin() when the track started.
+
+        Returns:
+            bool: True if the queue should advance, False if the track was replaced or
+                the callback is stale.
+        """
+        if generation != self.generation or self._idle.is_set():
+            return False
+        self._idle.set()
+        if self._handing_off:
+            return False
+        self.ended_at = time.perf_counter()
+        return True
+
+    def hand_off(self):
+        """Marks the current track as being stopped to make room for another song, so
+        that its end does not advance the queue."""
+        if self.is_playing():
+            self._handing_off = True
+
+    async def wait_idle(self, timeout=None):
+        """Waits until the current track has ended.
+
+        Args:
+            timeout (float, optional): Seconds to wait, STOP_TIMEOUT by default. If the
+                track has not ended by then it is treated as ended, and its late "after"
+                callback is ignored.
+
+        Returns:
+            bool: True if the track ended in time, False if the wait timed out.
+        """
+        try:
+            await asyncio.wait_for(
+                self._idle.wait(), STOP_TIMEOUT if timeout is None else timeout
+            )
+            return True
+        except asyncio.TimeoutError:
+            self.generation += 1  # outdates the callback of the track that did not end
+            self._idle.set()
+            return False
@@ -0,0 +1,125 @@
+"""
+prefetch.py
+
+This module defines the Prefetcher class, which resolves the songs at the head of a
+queue in the background while the current song is still playing, so that the next song
+can start as soon as the current one ends.
+
+Attributes:
+    - PREFETCH_DEPTH (int): How many songs at the head of the queue are resolved ahead
+        of time.
+"""
+
+import asyncio
+from itertools import islice
+
+from src.resolver import LookupCancelled
+from src.stream_cache import normalize_query
+
+PREFETCH_DEPTH = 1
+
+
+def _consume_error(task):
+    """Marks the error of a finished prefetch as retrieved; the song is simply resolved
+    again when played."""
+    if not task.cancelled():
+        task.exception()
+
+
+class Prefetcher:
+    """
+    Keeps background lookups running for the first few songs of each owner's queue.
+    """
+
+    def __init__(self, resolver, depth=PREFETCH_DEPTH):
+        """Initializes the prefetcher.
+
+        Args:
+            resolver (AudioResolver): The resolver the lookups run on. Its stream cache
+                keeps the results.
+            depth (int, optional): How many songs at the head of a queue are resolved
+                ahead of time.
+        """
+        self.resolver = resolver
+        self.depth = depth
+        self._tasks = {}  # owner -> {normalized query: prefetch task}
+        # Songs that were already resolved, or being resolved, when they started playing
+        self.hits = 0
+
+    def sync(self, ytdl, owner, queue):
+        """Makes the running prefetches match the current head of a queue.
+
+        Songs that entered the head are prefetched, and prefetches of songs that left it
+        (because the queue was moved, shuffled, cut or emptied) are cancelled.
+
+        Args:
+            ytdl (YoutubeDL): The yt_dlp instance to extract with.
+            owner (hashable): Whose queue this is, e.g. a guild id.
+            queue (iterable[Song]): The queue, head first.
+        """
+        wanted = {normalize_query(song): song for song in islice(queue, self.depth)}
+        tasks = self._tasks.setdefault(owner, {})
+
+        for key in list(tasks):
+            if key not in wanted:
+                tasks.pop(key).cancel()
+
+        for key, song in wanted.items():
+            if key not in tasks:
+                task = asyncio.ensure_future(self.resolver.search(ytdl, song))
+                task.add_done_callback(_consume_error)
+                tasks[key] = task
+
+        if not tasks:
+            del self._tasks[owner]
+
+    def invalidate(self, owner):
+        """Cancels every prefetch of an owner.
+
+        Args:
+            owner (hashable): Whose prefetches should be cancelled.
+        """
+        for task in self._tasks.pop(owner, {}).values():
+            task.cancel()
+
+    def pending(self, owner):
+        """Lists the songs of an owner that are being, or have been, prefetched.
+
+        Args:
+            owner (hashable): The owner to check.
+
+        Returns:
+            list[str]: The normalized queries of the prefetched songs.
+        """
+        return list(self._tasks.get(owner, {}))
+
+    async def resolve(self, ytdl, song, owner=None):
+        """Resolves a song that is about to play, reusing its prefetch if there is one.
+
+        Args:
+            ytdl (YoutubeDL): The yt_dlp instance to extract with.
+            song (Song): The song to resolve.
+            owner (hashable, optional): Whose queue the song came from.
+
+        Returns:
+            dict: The yt_dlp information of the song, including the stream "url".
+
+        Raises:
+            LookupCancelled: If the owner's lookup was cancelled, e.g. by /next.
+        """
+        tasks = self._tasks.get(owner, {})
+        task = tasks.pop(normalize_query(song), None)
+        if not tasks:
+            self._tasks.pop(owner, None)
+
+        if task is not None and not task.cancelled():
+            try:
+                # Waited on as the owner's lookup, so that /next can skip the song
+                info = await self.resolver.wait(task, owner)
+                self.hits += 1
+                return info
+            except LookupCancelled:
+                raise
+            except Exception:
+                pass  # the prefetch failed, so try again in the foreground
+        return await self.resolver.search(ytdl, song, owner=owner)
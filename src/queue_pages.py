@@ -0,0 +1,217 @@
+"""
+queue_pages.py
+
+This module defines how /view shows a guild's queue: one page of songs at a time in an
+embed, with buttons that flip through the pages by editing the message in place. A page
+is rendered from the queue's skip list in O(log n + page size), however long the queue
+is, and rendered pages are cached until the queue changes.
+
+Attributes:
+    - PAGE_SIZE (int): How many songs a page lists.
+    - VIEW_TIMEOUT (float): Seconds without a click after which the page buttons are
+        removed.
+"""
+
+import asyncio
+import contextlib
+from itertools import islice
+
+import discord
+
+from src.sessions import sessions
+
+PAGE_SIZE = 10
+VIEW_TIMEOUT = 120.0
+
+# Characters per line, so that a full page stays within an embed description's 4096
+_LINE_LIMIT = 370
+_EMPTY_QUEUE = "No songs in queue. Try /queue <query> to get started"
+
+
+def _shorten(line):
+    return line if len(line) <= _LINE_LIMIT else line[: _LINE_LIMIT - 1] + "…"
+
+
+def page_count(queue, page_size=PAGE_SIZE):
+    """Counts the pages a queue takes up. An empty queue still has one, empty, page.
+
+    Args:
+        queue (SongQueue): The queue.
+        page_size (int, optional): How many songs a page lists.
+
+    Returns:
+        int: The number of pages.
+    """
+    return max(1, -(-len(queue) // page_size))
+
+
+def render_page(queue, page, page_size=PAGE_SIZE):
+    """Lists the songs of one page, numbered by their track number, visiting only the
+    songs on that page.
+
+    Args:
+        queue (SongQueue): The queue.
+        page (int): The page, starting at 0.
+        page_size (int, optional): How many songs a page lists.
+
+    Returns:
+        str: One line per song, e.g. "11. Song by Artist".
+    """
+    start = page * page_size
+    songs = islice(queue.iter_from(start), page_size)
+    return "\n".join(
+        _shorten(f"{number}. {song}")
+        for number, song in enumerate(songs, start=start + 1)
+    )
+
+
+class PageCache:
+    """
+    The rendered pages of a queue. They stay valid while the queue is the same object at
+    the same version; any change to it, or a new queue assigned to the guild, discards
+    them.
+    """
+
+    def __init__(self, page_size=PAGE_SIZE):
+        """Initializes an empty cache.
+
+        Args:
+            page_size (int, optional): How many songs a page lists.
+        """
+        self.page_size = page_size
+        self._queue = None  # The queue the pages were rendered from
+        self._version = None  # Its version when they were rendered
+        self._pages = {}  # page -> rendered text
+
+    def get(self, queue, page):
+        """Returns a rendered page, rendering it if it is not cached.
+
+        Args:
+            queue (SongQueue): The queue.
+            page (int): The page, starting at 0.
+
+        Returns:
+            str: The page, see render_page().
+        """
+        if queue is not self._queue or queue.version != self._version:
+            self._queue, self._version, self._pages = queue, queue.version, {}
+        text = self._pages.get(page)
+        if text is None:
+            text = self._pages[page] = render_page(queue, page, self.page_size)
+        return text
+
+
+def queue_embed(state, page=0, cache=None):
+    """Builds the embed that shows the playing song and one page of a guild's queue.
+
+    Args:
+        state (GuildState): The state of the guild.
+        page (int, optional): The page, starting at 0. Clamped to the pages the queue
+            has.
+        cache (PageCache, optional): Where rendered pages are kept. Pages are rendered
+            afresh without one.
+
+    Returns:
+        tuple[discord.Embed, int]: The embed, and the page it shows.
+    """
+    if state.is_in_use():
+        status = f"Now playing: {state.current_song_playing}"
+        if state.is_paused():
+            status += " **[PAUSED]**"
+        if state.is_looping():
+            status += " **[LOOPING]**"
+    else:
+        status = "Currently not playing anything"
+
+    queue = state.song_queue
+    pages = page_count(queue, cache.page_size if cache is not None else PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    if not queue:
+        body = _EMPTY_QUEUE
+    elif cache is not None:
+        body = cache.get(queue, page)
+    else:
+        body = render_page(queue, page)
+
+    embed = discord.Embed(
+        title="Current Queue",
+        description=f"{_shorten(status)}\n\n{body}",
+        color=0x31FF00,
+    )
+    embed.set_footer(text=f"Page {page + 1}/{pages} · {len(queue)} songs")
+    return embed, page
+
+
+class QueuePages(discord.ui.View):
+    """
+    Previous and next buttons under a /view embed, which anyone in the channel can use
+    to flip through the queue.
+
+    Like SongPicker, its timeout is left to the session registry (see sessions.py).
+    """
+
+    def __init__(self, state, page_size=PAGE_SIZE, timeout=None):
+        """Creates the buttons, on the first page.
+
+        Args:
+            state (GuildState): The state of the guild whose queue is shown.
+            page_size (int, optional): How many songs a page lists.
+            timeout (float, optional): Seconds without a click after which discord.py
+                stops the view. Leave it unset when the view is registered in the
+                session registry.
+        """
+        super().__init__(timeout=timeout)
+        self.state = state
+        self.page = 0
+        self.cache = PageCache(page_size)
+        self.timed_out = False  # Whether the view stopped because it went unused
+        self.message = None  # The message the buttons are under, set once it is sent
+        self._removal = None  # The task removing the buttons from it
+        for emoji, step in (("◀️", -1), ("▶️", 1)):
+            button = discord.ui.Button(emoji=emoji)
+            button.callback = self._flipper(step)
+            self.add_item(button)
+
+    def embed(self):
+        """Builds the embed of the current page.
+
+        Returns:
+            discord.Embed: The embed.
+        """
+        embed, self.page = queue_embed(self.state, self.page, self.cache)
+        return embed
+
+    def _flipper(self, step):
+        """Returns the callback of the button that moves step pages, wrapping around at
+        either end."""
+
+        async def callback(interaction):
+            self.page = (self.page + step) % page_count(
+                self.state.song_queue, self.cache.page_size
+            )
+            await interaction.response.edit_message(embed=self.embed(), view=self)
+
+        return callback
+
+    async def remove_buttons(self):
+        """Removes the buttons from the message, unless the message is gone or cannot be
+        edited anymore."""
+        if self.message is not None:
+            with contextlib.suppress(discord.HTTPException):
+                await self.message.edit(view=None)
+
+    def expire(self):
+        """Stops the view because it went unused and removes its buttons. Called by the
+        session registry."""
+        self.timed_out = True
+        self.stop()
+        self._removal = asyncio.ensure_future(self.remove_buttons())
+
+    async def on_timeout(self):
+        self.timed_out = True
+        await self.remove_buttons()
+
+    async def interaction_check(self, interaction):
+        """Restarts the session's timeout on every click."""
+        sessions.touch(interaction.message.id)
+        return True
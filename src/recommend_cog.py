@@ -1,24 +1,35 @@
 """
 recommend_cog.py
 
-This module contains the RecommendCog class, a Discord bot cog for handling song recommendations
-and polling based on user preferences. The cog includes two main commands:
-- /poll: Allows users to select songs by reacting to a list of randomly chosen tracks from different genres.
-- /recommend: Provides personalized song recommendations based on the user’s previous selections.
+This module contains the RecommendCog class, a Discord bot cog for handling song
+recommendations and polling based on user preferences. The cog includes two main
+commands:
+- /poll: Allows users to select songs by clicking the buttons under a list of randomly
+    chosen tracks from different genres.
+- /recommend: Provides personalized song recommendations based on the user’s previous
+  selections, either by genre or, with "/recommend cosine" or "/recommend euclidean", by
+  how similar the songs sound.
 
 Classes:
-    RecommendCog(commands.Cog): A cog that encapsulates song recommendation and polling commands.
+    RecommendCog(commands.Cog): A cog that encapsulates song recommendation and polling
+        commands.
 
 Functions:
-    - poll(ctx): Presents a list of 10 songs to the user, allowing them to choose up to 3 for recommendations.
-    - recommend(ctx): Provides song recommendations based on selected songs, with options to save or request new suggestions.
-    - generate_recommendations(selected_songs): Generates up to 10 song recommendations based on the genres of selected songs.
+    - poll(ctx): Presents a list of 10 songs to the user, allowing them to choose up to
+        3 for recommendations.
+    - recommend(ctx, mode): Provides song recommendations based on selected songs, with
+        options to save or request new suggestions.
+    - generate_recommendations(selected_songs, mode, exclude_songs): Generates up to 10
+      song recommendations based on the genres or the audio features of selected songs.
 
 Dependencies:
     - discord.py: For creating and managing bot commands and message interactions.
-    - asyncio: For handling asynchronous events like reactions.
+    - song_picker: The buttons under the poll and recommendation embeds, sent with the
+        embeds themselves.
     - pandas: For managing song data in DataFrames.
-    - BotState: A module to maintain the current state of selected songs across bot sessions.
+    - catalog: The process-wide, in-memory song catalog queried for recommendations.
+    - BotState: A module to maintain the current state of selected songs of each guild
+        across bot sessions.
     - utils: Helper functions, including random_25 for selecting random recommendations.
 
 Usage:
@@ -27,141 +38,183 @@
         bot.add_cog(RecommendCog(bot))
 
 Notes:
-    This module assumes the presence of a "Song" class, which encapsulates track metadata (track name, artist, genre),
-    and the "get_all_songs" and "get_songs_by_genre" functions to fetch songs.
+    This module assumes the presence of a "Song" class, which encapsulates track
+    metadata (track name, artist, genre), and the shared song catalog (see catalog.py)
+    plus the "get_songs_by_genre" function to fetch songs.
 """
 
 import discord
 from discord.ext import commands
 
 import random
-import asyncio
 from src.bot_state import BotState
-from src.get_all import get_all_songs
+from src.metrics import command_finished, command_started, stage
+from src.catalog import get_catalog, SONGS_CSV
+from src.recommender import (
+    METRICS,
+    ann_index,
+    recommend_by_features,
+    select_rows,
+    shuffled,
+    song_mask,
+    to_songs,
+)
 from src.utils import random_25
 from src.get_all import get_songs_by_genre
 import pandas as pd
 from src.song import Song
+from src.sessions import sessions
+from src.song_picker import SongPicker, numbered
+
+POLL_SELECTIONS = 3  # How many songs a poll lets the user select
+POLL_TIMEOUT = 60.0  # Seconds a poll waits for the next click
+RECOMMEND_TIMEOUT = 300.0  # Seconds a recommendation session waits for the next click
 
 
 class RecommendCog(commands.Cog):
     """
-        A Discord bot cog for song recommendation and polling features.
-        Provides commands for polling songs by genre and recommending songs
-        based on user-selected tracks.
+    A Discord bot cog for song recommendation and polling features.
+    Provides commands for polling songs by genre and recommending songs
+    based on user-selected tracks.
     """
 
     def __init__(self, bot):
         self.bot = bot  # Storing the bot instance in the cog
 
+    async def cog_before_invoke(self, ctx):
+        """
+        Runs before every command of this cog, to time it.
+
+        Parameters:
+        - ctx (commands.Context): The context of the command invocation.
+        """
+        command_started(ctx)
+
+    async def cog_after_invoke(self, ctx):
+        """
+        Runs after every command of this cog, to count it, record how long it took
+        and log its outcome.
+
+        Parameters:
+        - ctx (commands.Context): The context of the command invocation.
+        """
+        BotState.log_outcome(ctx, command_finished(ctx))
+
     @commands.command(name="poll", help="Poll for recommendation")
     async def poll(self, ctx):
         """
-            Poll command to display a list of 10 randomly selected songs from different genres.
-            Allows the user to select up to 3 songs by reacting to message emojis.
+        Poll command to display a list of 10 randomly selected songs from different
+        genres. Allows the user to select up to 3 songs with the buttons under the
+        list.
 
-            Parameters:
-            - ctx (commands.Context): The context of the command invocation.
+        Parameters:
+        - ctx (commands.Context): The context of the command invocation.
         """
-
-        number_emojis = ["1️⃣", "2️⃣", "3️⃣", "4️⃣",
-                         "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
+        state = BotState.for_guild(ctx.guild)
         selected_songs = []
-        bot_message = "React with the numbers to the songs you like. You can select up to 3 songs."
-        await ctx.send(bot_message)
+        selected = set()  # The same songs, for constant-time duplicate checks
 
         # Fetch 10 random songs by genre
-        ten_random_songs = get_songs_by_genre(10)
+        with stage("catalog_query"):
+            ten_random_songs = get_songs_by_genre(10)
 
-        # Create and display a list of song names with corresponding emojis
-        song_list_message = ""
-        for index, (track_name, artist, genre) in enumerate(
-            zip(
+        poll_songs = [
+            Song(track_name=track_name, artist_name=artist, genre=genre)
+            for track_name, artist, genre in zip(
                 ten_random_songs["track_name"],
                 ten_random_songs["artist_name"],
                 ten_random_songs["genre"],
-            ),
-            start=1,
-        ):
-            song_list_message += (
-                f"{number_emojis[index-1]} - {track_name} by {artist} ({genre})\n"
             )
+        ]
+
+        async def on_pick(interaction, song):
+            # Ignore songs that are already selected, to avoid duplicates
+            if song in selected or len(selected_songs) >= POLL_SELECTIONS:
+                await interaction.response.defer()
+                return
+            selected.add(song)
+            selected_songs.append(song)
+
+            # Confirm addition with an embedded message
+            favorite_embed = discord.Embed(
+                title="Added to Favorites",
+                description=f"{song} ({song.genre})",
+                color=0x00FF00,
+            )
+            await interaction.response.send_message(embed=favorite_embed)
+            # Update the song queue in BotState
+            state.song_queue = selected_songs.copy()
+            BotState.persist(state)
+            if len(selected_songs) >= POLL_SELECTIONS:
+                await view.close()
+
+        async def on_close():
+            # Send a summary of selected songs or notify if none were selected
+            if selected_songs:
+                summary_embed = discord.Embed(
+                    title="Selected Songs",
+                    description=" , ".join(
+                        [song.track_name for song in selected_songs]
+                    ),
+                    color=0x31FF00,
+                )
+                await ctx.send(embed=summary_embed)
+            else:
+                await ctx.send("No songs were selected.")
 
+        # Send the list of songs and its buttons in a single message
+        view = SongPicker(ctx.author, poll_songs, on_pick, on_close=on_close)
         poll_embed = discord.Embed(
-            title="Song Selection", description=song_list_message, color=0x31FF00
+            title="Song Selection", description=numbered(poll_songs), color=0x31FF00
         )
-        react_message = await ctx.send(embed=poll_embed)
-
-        # Add reaction emojis for each song
-        for emoji in number_emojis[: len(ten_random_songs)]:
-            await react_message.add_reaction(emoji)
-
-        # Check function to validate reactions
-        def check(reaction, user):
-            return (
-                user == ctx.author
-                and reaction.message.id == react_message.id
-                and str(reaction.emoji) in number_emojis
+        with stage("discord_send"):
+            poll_message = await ctx.send(
+                "Click the numbers of the songs you like. You can select up to "
+                f"{POLL_SELECTIONS} songs.",
+                embed=poll_embed,
+                view=view,
             )
 
-        # Collect up to 3 song selections from user reactions
-        while len(selected_songs) < 3:
-            try:
-                reaction, user = await self.bot.wait_for(
-                    "reaction_add", timeout=60.0, check=check
-                )
-                emoji_index = number_emojis.index(str(reaction.emoji))
-
-                # Check if song is already selected, to avoid duplicates
-                if emoji_index < len(ten_random_songs) and ten_random_songs.iloc[
-                    emoji_index
-                ]["track_name"] not in [song.track_name for song in selected_songs]:
-                    song = Song(
-                        track_name=ten_random_songs.iloc[emoji_index]["track_name"],
-                        artist_name=ten_random_songs.iloc[emoji_index]["artist_name"],
-                        genre=ten_random_songs.iloc[emoji_index]["genre"],
-                    )
-                selected_songs.append(song)
-
-                # Confirm addition with an embedded message
-                favorite_embed = discord.Embed(
-                    title="Added to Favorites",
-                    description=f"{song.track_name} by {song.artist_name} ({song.genre})",
-                    color=0x00FF00,
-                )
-                await ctx.send(embed=favorite_embed)
-                # Update the song queue in BotState
-                BotState.song_queue = selected_songs.copy()
-            except asyncio.TimeoutError:
-                break  # End poll if user times out
-
-        # Send a summary of selected songs or notify if none were selected
-        if selected_songs:
-            summary_embed = discord.Embed(
-                title="Selected Songs",
-                description=" , ".join([song.track_name for song in selected_songs]),
-                color=0x31FF00,
-            )
-            await ctx.send(embed=summary_embed)
-        else:
-            await ctx.send("No songs were selected.")
+        # Collect up to 3 song selections, ending the poll if the user stops clicking.
+        # The command returns now; the view sends the summary once it closes
+        view.message = poll_message
+        sessions.register(poll_message.id, view, POLL_TIMEOUT, kind="poll")
 
     """
-    This function displays a recommended song list, and allows user to queue recommended songs or get new recommendations
+    This function displays a recommended song list, and allows user to queue recommended
+    songs or get new recommendations
     """
 
     @commands.command(
-        name="recommend", help="Handle recommendations based on selected songs"
+        name="recommend",
+        help="Handle recommendations based on selected songs. "
+        "Add cosine or euclidean to match on how the songs sound instead of their "
+        "genre",
     )
-    async def recommend(self, ctx):
+    async def recommend(self, ctx, mode="genre"):
         """
-            Recommend command to suggest songs based on previously selected tracks.
-            Users can react to add songs to their queue, or get a new set of recommendations.
+        Recommend command to suggest songs based on previously selected tracks.
+        Users can click the buttons to add songs to their queue, or get a new set of
+        recommendations.
 
-            Parameters:
-            - ctx (commands.Context): The context of the command invocation.
+        Parameters:
+        - ctx (commands.Context): The context of the command invocation.
+        - mode (str): "genre" to match on genre, or one of METRICS to match on audio
+            features.
         """
-        if not BotState.song_queue:
+        mode = mode.lower()
+        if mode != "genre" and mode not in METRICS:
+            await ctx.send(
+                embed=discord.Embed(
+                    title="Unknown Recommendation Mode",
+                    description=f"Use one of: genre, {', '.join(METRICS)}.",
+                    color=0xFF0000,
+                )
+            )
+            return
+
+        state = BotState.for_guild(ctx.guild)
+        if not state.song_queue:
             await ctx.send(
                 embed=discord.Embed(
                     title="No Songs Selected",
@@ -171,12 +224,12 @@ async def recommend(self, ctx):
             )
             return
 
-        number_emojis = ["1️⃣", "2️⃣", "3️⃣", "4️⃣",
-                         "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
-        control_emojis = {"🆕": "new", "⏹️": "stop"}
-
         # Generate initial recommendations
-        recommended_songs = self.generate_recommendations(BotState.song_queue)
+        with stage("generate_recommendations"):
+            recommended_songs = self.generate_recommendations(state.song_queue, mode)
+        shown_songs = set(recommended_songs)
+        # Songs added to the queue in this session, to add each once
+        queued_songs = set()
         if not recommended_songs:
             await ctx.send(
                 embed=discord.Embed(
@@ -187,153 +240,136 @@ async def recommend(self, ctx):
             )
             return
 
-        # Display recommended songs
-        description = "\n".join(
-            f"{number_emojis[i]} {song.track_name} by {song.artist_name} ({song.genre})"
-            for i, song in enumerate(recommended_songs)
-        )
-        embed = discord.Embed(
-            title="Recommended Songs", description=description, color=0x00FF00
-        )
-        msg = await ctx.send(embed=embed)
-
-        # Add reactions for songs and controls (new recommendations or stop)
-        for emoji in number_emojis[: len(recommended_songs)] + list(
-            control_emojis.keys()
-        ):
-            await msg.add_reaction(emoji)
-
-        # Reaction-based interaction loop
-        while True:
-
-            # Check function to validate reactions
-            def check(reaction, user):
-                return (
-                    user == ctx.author
-                    and reaction.message.id == msg.id
-                    and (
-                        str(reaction.emoji)
-                        in number_emojis[: len(recommended_songs)]
-                        + list(control_emojis.keys())
-                    )
+        async def on_pick(interaction, song):
+            # Add selected song to the queue
+            if song in queued_songs:
+                await interaction.response.defer()
+                return
+            queued_songs.add(song)
+            state.song_queue.append(song)
+            BotState.persist(state)
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    title="Song Added",
+                    description=f"Added {song}",
+                    color=0x00FF00,
                 )
+            )
 
-            try:
-                reaction, user = await self.bot.wait_for(
-                    "reaction_add", timeout=300.0, check=check
+        async def on_new(interaction):
+            # Get a fresh set of recommendations, shown in the same message with the
+            # same buttons
+            with stage("generate_recommendations"):
+                new_songs = self.generate_recommendations(
+                    state.song_queue, mode, exclude_songs=shown_songs
                 )
-                if str(reaction.emoji) in control_emojis:
-                    action = control_emojis[str(reaction.emoji)]
-                    # Handle control actions: new recommendation or stop
-                    if action == "new":
-                        # Get a fresh set of recommendations
-                        await msg.clear_reactions()
-                        recommended_songs = self.generate_recommendations(
-                            BotState.song_queue
-                        )
-                        if not recommended_songs:
-                            await ctx.send("No further recommendations found.")
-                            break
-                        description = "\n".join(
-                            f"{number_emojis[i]} {song}"
-                            for i, song in enumerate(recommended_songs)
-                        )
-                        embed = discord.Embed(
-                            title="New Recommended Songs",
-                            description=description,
-                            color=0x00FF00,
-                        )
-                        await msg.edit(embed=embed)
-                        for emoji in number_emojis[: len(recommended_songs)] + list(
-                            control_emojis.keys()
-                        ):
-                            await msg.add_reaction(emoji)
-                    elif action == "stop":
-                        # Stop the recommendation session
-                        await ctx.send(
-                            embed=discord.Embed(
-                                title="Ending recommendation session",
-                                description="Use /recommend command for music recommendation",
-                                color=0xFF0000,
-                            )
-                        )
-                        break
-                else:
-                    # Add selected song to the queue
-                    index = number_emojis.index(str(reaction.emoji))
-                    song = recommended_songs[index]
-                    BotState.song_queue.append(song)
-                    await ctx.send(
-                        embed=discord.Embed(
-                            title="Song Added",
-                            description=f"Added {recommended_songs[index]}",
-                            color=0x00FF00,
-                        )
-                    )
-
-            except asyncio.TimeoutError:
+            shown_songs.update(new_songs)
+            if not new_songs:
+                await interaction.response.send_message(
+                    "No further recommendations found."
+                )
+                await view.close()
+                return
+            view.show(new_songs)
+            embed = discord.Embed(
+                title="New Recommended Songs",
+                description=numbered(new_songs, details=False),
+                color=0x00FF00,
+            )
+            await interaction.response.edit_message(embed=embed, view=view)
+
+        async def on_stop(interaction):
+            # Stop the recommendation session
+            await interaction.response.send_message(
+                embed=discord.Embed(
+                    title="Ending recommendation session",
+                    description="Use /recommend command for music recommendation",
+                    color=0xFF0000,
+                )
+            )
+            await view.close()
+
+        async def on_close():
+            if view.timed_out:
                 await ctx.send("Timeout occurred. No response received.")
-                break
 
-    def generate_recommendations(self, selected_songs):
-        """
-            Helper function that generates up to 10 recommended songs based on the genres of selected songs.
+        # Display recommended songs, with buttons for songs and controls (new
+        # recommendations or stop)
+        view = SongPicker(
+            ctx.author,
+            recommended_songs,
+            on_pick,
+            controls=[("🆕", on_new), ("⏹️", on_stop)],
+            on_close=on_close,
+        )
+        embed = discord.Embed(
+            title="Recommended Songs",
+            description=numbered(recommended_songs),
+            color=0x00FF00,
+        )
+        with stage("discord_send"):
+            msg = await ctx.send(embed=embed, view=view)
+
+        # The command returns now; the view cleans up once it closes
+        view.message = msg
+        sessions.register(msg.id, view, RECOMMEND_TIMEOUT, kind="recommend")
 
-            Parameters:
-            - selected_songs (list[Song]): A list of songs selected by the user.
+    def generate_recommendations(self, selected_songs, mode="genre", exclude_songs=()):
+        """
+        Helper function that generates up to 10 recommended songs based on the
+        genres or the audio features of selected songs.
 
-            Returns:
-            - list[Song]: A list of recommended Song objects.
+        Parameters:
+        - selected_songs (list[Song]): A list of songs selected by the user.
+        - mode (str): "genre" to match on genre, or one of METRICS to rank songs.csv
+          by audio features, through its approximate nearest neighbour index once it
+          is large enough to have one. If none of the selected songs are in
+          songs.csv, the genre is used instead.
+        - exclude_songs (iterable[Song]): Songs that must not be recommended, e.g.
+            ones recommended before.
+
+        Returns:
+        - list[Song]: A list of recommended Song objects.
         """
-        recommendations = []
-        seen_artists = (
-            {}
-        )  # Dictionary to track the number of songs recommended per artist
+        if mode in METRICS:
+            feature_catalog = get_catalog(SONGS_CSV)
+            with stage("catalog_query"):
+                recommendations = recommend_by_features(
+                    feature_catalog,
+                    selected_songs,
+                    mode,
+                    exclude_songs,
+                    index=ann_index(feature_catalog, mode),
+                )
+            if recommendations is not None:
+                return recommendations
 
-        # Fetch all songs dynamically
-        all_songs = get_all_songs()
+        catalog = get_catalog()
 
         # Aggregate genres from all selected songs
         genres = {song.genre for song in selected_songs}
 
-        # Set a limit on how many times an artist can appear in the recommendations
-        artist_limit = 2
-
-        # Filter songs that match the genres collected and are not by the same artists as the input songs
-        matched_songs = all_songs[
-            all_songs["genre"].isin(genres)
-            & (
-                ~all_songs["artist_name"].isin(
-                    [song.artist_name for song in selected_songs]
-                )
+        # Find songs that match the genres collected and are not by the same artists as
+        # the input songs
+        with stage("catalog_query"):
+            matched_rows = catalog.rows_by_genres(
+                genres,
+                exclude_artists=[song.artist_name for song in selected_songs],
+                exclude_tracks=[song.track_name for song in selected_songs],
             )
-            & (
-                ~all_songs["track_name"].isin(
-                    [song.track_name for song in selected_songs]
-                )
-            )
-        ].copy()
-
-        # Shuffle the matched songs to prevent bias
-        matched_songs = matched_songs.sample(frac=1).reset_index(drop=True)
-
-        # Iterate through the matched songs and add them to recommendations if they meet the criteria
-        for _, matched_song in matched_songs.iterrows():
-            song = Song(
-                track_name=matched_song["track_name"],
-                artist_name=matched_song["artist_name"],
-                genre=matched_song["genre"],
-            )
-            artist_count = seen_artists.get(song.artist_name, 0)
-
-            if song not in recommendations and artist_count < artist_limit:
-                recommendations.append(song)
-                seen_artists[song.artist_name] = artist_count + 1
-
-            if len(recommendations) >= 10:
-                break
+            if exclude_songs:
+                matched_rows = matched_rows[
+                    ~song_mask(catalog, exclude_songs, matched_rows)
+                ]
+
+        # Visit the matches in random order to prevent bias, keeping at most
+        # ARTIST_LIMIT songs per artist and telling repeated songs apart by their
+        # normalized key
+        picked_rows = select_rows(
+            catalog.songs, shuffled(matched_rows), song_codes=catalog.song_index().codes
+        )
 
-        return recommendations[:10]  # Limit to 10 recommendations
+        return to_songs(catalog.songs, picked_rows)
 
     @staticmethod
     async def setup(client):
@@ -0,0 +1,416 @@
+"""
+recommender.py
+
+This module holds the vectorized selection logic behind /recommend. Candidate songs are
+handled as arrays of catalog row positions, and only the handful of rows that end up
+being recommended are turned into Song objects.
+
+Besides matching on genre, songs can be recommended by how close their audio features
+(tempo, energy, danceability, ...) are to those of the selected songs. The features are
+normalized into a dense float32 matrix once per catalog load, and every candidate is
+scored with one matrix-vector product.
+
+Attributes:
+    - RECOMMENDATION_LIMIT (int): How many songs a single recommendation contains.
+    - ARTIST_LIMIT (int): How many times the same artist may appear in a single
+        recommendation.
+    - FEATURE_COLUMNS (tuple): The numeric columns of songs.csv that describe how a song
+        sounds.
+    - METRICS (tuple): The distances songs can be compared by.
+    - ANN_MIN_ROWS (int): Catalogs with at least this many songs are searched with an
+      approximate index (see ann_index.py) instead of scoring every song.
+"""
+
+import numpy as np
+import pandas as pd
+
+from src.ann_index import IVFIndex, N_PROBE
+from src.song import Song
+
+RECOMMENDATION_LIMIT = 10
+ARTIST_LIMIT = 2
+FEATURE_COLUMNS = (
+    "bpm",
+    "nrgy",
+    "dnce",
+    "dB",
+    "live",
+    "val",
+    "dur",
+    "acous",
+    "spch",
+    "pop",
+)
+METRICS = ("cosine", "euclidean")
+ANN_MIN_ROWS = 50_000
+
+_rng = np.random.default_rng()
+
+
+def select_rows(
+    songs,
+    candidates,
+    artist_column="artist_name",
+    limit=RECOMMENDATION_LIMIT,
+    artist_limit=ARTIST_LIMIT,
+    song_codes=None,
+):
+    """Picks the first candidates that are not duplicates of an earlier pick and whose
+    artist has not been picked artist_limit times yet.
+
+    The duplicate check and the per-artist count (a groupby-cumcount) are done with
+    NumPy on integer codes of the tracks and artists of a prefix of the candidates,
+    which is grown geometrically until enough songs are found, so the cost depends on
+    how many songs are recommended rather than on how many songs matched.
+
+    Args:
+        songs (DataFrame): The catalog the candidates index into.
+        candidates (ndarray): Row positions of the candidates, in order of preference.
+        artist_column (str, optional): The name of the artist column in the catalog.
+        limit (int, optional): How many rows to pick.
+        artist_limit (int, optional): How many rows per artist to pick at most.
+        song_codes (ndarray, optional): An integer per catalog row that is equal for
+            rows holding the same song, e.g. SongCatalog.song_index().codes, which tells
+            songs apart by their normalized key like Song does. Without it, rows are
+            duplicates only if their track names and artists are exactly equal.
+
+    Returns:
+        ndarray: The picked row positions, in order of preference.
+    """
+    total = len(candidates)
+    size = min(total, max(4 * limit, 32))
+    while True:
+        prefix = np.asarray(candidates[:size], dtype=np.intp)
+        artists = _codes(songs[artist_column].iloc[prefix])
+        if song_codes is None:
+            tracks = _codes(songs["track_name"].iloc[prefix])
+            unique = _first_occurrences(tracks * (artists.max(initial=0) + 1) + artists)
+        else:
+            unique = _first_occurrences(song_codes[prefix])
+        kept_artists = artists[unique]
+        under_limit = _cumcount(kept_artists) < artist_limit
+        picked = prefix[unique][under_limit][:limit]
+        if len(picked) >= limit or size >= total:
+            return picked
+        size = min(total, size * 4)
+
+
+def _codes(values):
+    """Returns non-negative integer codes that are equal where the values are, reusing
+    those of a Categorical."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy().astype(np.intp) + 1  # missing values are -1
+    return pd.factorize(values, use_na_sentinel=False)[0].astype(np.intp, copy=False)
+
+
+def _first_occurrences(keys):
+    """Returns a mask that is True at the first occurrence of every distinct key."""
+    mask = np.zeros(len(keys), dtype=bool)
+    if len(keys):
+        _, first = np.unique(keys, return_index=True)
+        mask[first] = True
+    return mask
+
+
+def _cumcount(keys):
+    """Numbers the occurrences of every distinct key 0, 1, 2, ... in order, like pandas'
+    groupby().cumcount()."""
+    if not len(keys):
+        return np.zeros(0, dtype=np.intp)
+    _, codes = np.unique(keys, return_inverse=True)
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(keys)]))
+    counts = np.empty(len(keys), dtype=np.intp)
+    counts[order] = np.arange(len(keys)) - group_start
+    return counts
+
+
+def shuffled(rows, rng=None):
+    """Returns the given row positions in a uniformly random order.
+
+    Args:
+        rows (ndarray): The row positions.
+        rng (Generator, optional): The random generator to use.
+
+    Returns:
+        ndarray: The shuffled row positions.
+    """
+    return (rng or _rng).permutation(rows)
+
+
+def to_songs(songs, rows, artist_column="artist_name"):
+    """Builds Song objects for the given catalog rows. The songs only hold their row and
+    read their details from the catalog when they are first needed.
+
+    Args:
+        songs (DataFrame): The catalog.
+        rows (ndarray): The row positions to convert.
+        artist_column (str, optional): The name of the artist column in the catalog.
+
+    Returns:
+        list[Song]: One Song per row, in the same order.
+    """
+    return [Song.from_row(songs, row, artist_column) for row in rows]
+
+
+def song_rows(catalog, songs, artist_column="artist_name"):
+    """Finds the catalog rows of the given songs by their normalized track and artist.
+
+    Args:
+        catalog (SongCatalog): The catalog to search.
+        songs (iterable[Song]): The songs to find.
+        artist_column (str, optional): The name of the artist column in the catalog.
+
+    Returns:
+        ndarray: The rows of every song found, ascending. Songs that are not in the
+            catalog are skipped.
+    """
+    return catalog.song_index(artist_column).rows_for(song.key for song in songs)
+
+
+def song_mask(catalog, songs, rows, artist_column="artist_name"):
+    """Checks which of the given rows hold one of the given songs, by comparing the
+    integer codes of their normalized track and artist rather than the names.
+
+    Args:
+        catalog (SongCatalog): The catalog the rows index into.
+        songs (iterable[Song]): The songs to look for.
+        rows (ndarray): The row positions to check.
+        artist_column (str, optional): The name of the artist column in the catalog.
+
+    Returns:
+        ndarray: One bool per row, aligned with rows.
+    """
+    return catalog.song_index(artist_column).matches((song.key for song in songs), rows)
+
+
+def feature_matrix(catalog, metric="cosine", columns=FEATURE_COLUMNS):
+    """Returns the audio features of every song as a float32 matrix laid out for the
+    given metric. It is computed once per catalog load.
+
+    Every column is standardized to zero mean and unit variance, so that no feature
+    dominates because of its unit. For "cosine" the rows are then scaled to unit length.
+    For "euclidean" a last column holding each row's squared length is appended, so that
+    the squared distance to a point can be ranked with a single product (see
+    feature_scores).
+
+    Args:
+        catalog (SongCatalog): The catalog holding the feature columns.
+        metric (str, optional): One of METRICS.
+        columns (tuple[str], optional): The feature columns.
+
+    Returns:
+        ndarray: One row per song.
+    """
+    return catalog.view(
+        ("features", metric, columns),
+        lambda songs: _feature_matrix(songs, metric, columns),
+    )
+
+
+def _feature_matrix(songs, metric, columns):
+    values = songs[list(columns)].to_numpy(dtype=np.float32)
+    means = np.nanmean(values, axis=0)
+    # a missing feature counts as average
+    values = np.where(np.isnan(values), means, values)
+    spread = values.std(axis=0)
+    spread[spread == 0] = 1
+    values = (values - means) / spread
+
+    if metric == "cosine":
+        lengths = np.linalg.norm(values, axis=1, keepdims=True)
+        lengths[lengths == 0] = 1
+        return values / lengths
+    squared_lengths = np.einsum("ij,ij->i", values, values)
+    return np.hstack((values, squared_lengths[:, None])).astype(np.float32, copy=False)
+
+
+def feature_points(matrix, metric="cosine"):
+    """Returns the songs' positions in feature space, i.e. the matrix without the
+    squared-length column "euclidean" adds.
+
+    Args:
+        matrix (ndarray): The matrix returned by feature_matrix() for the same metric.
+        metric (str, optional): One of METRICS.
+
+    Returns:
+        ndarray: One row per song.
+    """
+    return matrix if metric == "cosine" else matrix[:, :-1]
+
+
+def feature_centroid(matrix, query_rows, metric="cosine"):
+    """Returns the point in feature space that recommendations are ranked by closeness
+    to: the mean of the query songs, scaled to unit length for "cosine".
+
+    Args:
+        matrix (ndarray): The matrix returned by feature_matrix() for the same metric.
+        query_rows (ndarray): The rows of the query songs.
+        metric (str, optional): One of METRICS.
+
+    Returns:
+        ndarray: The point.
+    """
+    centroid = feature_points(matrix, metric)[query_rows].mean(axis=0)
+    if metric == "cosine":
+        length = np.linalg.norm(centroid)
+        return centroid / length if length else centroid
+    return centroid
+
+
+def feature_scores(matrix, centroid, metric="cosine"):
+    """Scores songs by their distance to a point, lower meaning closer.
+
+    For "cosine" the score is the negated cosine similarity. For "euclidean" it is |x|^2
+    - 2 x.c, which differs from the squared distance |x - c|^2 only by the constant
+    |c|^2 and so ranks the songs the same way.
+
+    Args:
+        matrix (ndarray): The matrix returned by feature_matrix() for the same metric,
+            or some of its rows.
+        centroid (ndarray): The point, see feature_centroid().
+        metric (str, optional): One of METRICS.
+
+    Returns:
+        ndarray: One float32 score per row of the matrix.
+    """
+    if metric == "cosine":
+        return -(matrix @ centroid)
+    return matrix @ np.append(-2 * centroid, 1).astype(np.float32)
+
+
+def ann_index(catalog, metric="cosine"):
+    """Returns the approximate nearest neighbour index over a catalog's features, or
+    None if the catalog is small enough to score every song. The index is loaded from,
+    or saved to, a sidecar file next to the dataset.
+
+    Args:
+        catalog (SongCatalog): The catalog holding the feature columns.
+        metric (str, optional): One of METRICS.
+
+    Returns:
+        IVFIndex | None: The index.
+    """
+    if len(catalog) < ANN_MIN_ROWS:
+        return None
+
+    def build(songs):
+        path = f"{catalog.path}.{metric}.ivf.npz" if catalog.path else None
+        return IVFIndex.load_or_build(
+            feature_points(feature_matrix(catalog, metric), metric), path
+        )
+
+    return catalog.view(("ann", metric), build)
+
+
+def nearest_rows(scores, count):
+    """Returns the rows with the lowest scores, best first, without sorting every score.
+
+    Args:
+        scores (ndarray): One score per row.
+        count (int): How many rows to return.
+
+    Returns:
+        ndarray: The row positions.
+    """
+    count = min(count, len(scores))
+    if count < len(scores):
+        rows = np.argpartition(scores, count - 1)[:count]
+    else:
+        rows = np.arange(len(scores))
+    return rows[np.argsort(scores[rows], kind="stable")]
+
+
+def recommend_by_features(
+    catalog,
+    selected_songs,
+    metric="cosine",
+    exclude_songs=(),
+    index=None,
+    artist_column="artist",
+    limit=RECOMMENDATION_LIMIT,
+    artist_limit=ARTIST_LIMIT,
+):
+    """Recommends the songs that sound most like the selected ones, leaving out the
+    selected artists and tracks.
+
+    Args:
+        catalog (SongCatalog): A catalog with the FEATURE_COLUMNS, e.g. the one of
+            songs.csv.
+        selected_songs (list[Song]): The songs to find similar songs to.
+        metric (str, optional): One of METRICS.
+        exclude_songs (iterable[Song], optional): Further songs to leave out, e.g. ones
+            recommended before.
+        index (IVFIndex, optional): An index from ann_index() to only score the songs
+            near the selection. Without one, every song is scored.
+        artist_column (str, optional): The name of the artist column in the catalog.
+        limit (int, optional): How many songs to recommend.
+        artist_limit (int, optional): How many songs per artist to recommend at most.
+
+    Returns:
+        list[Song] | None: The recommendations, or None if none of the selected songs
+        are in the catalog.
+    """
+    query_rows = song_rows(catalog, selected_songs, artist_column)
+    if not len(query_rows):
+        return None
+
+    matrix = feature_matrix(catalog, metric)
+    centroid = feature_centroid(matrix, query_rows, metric)
+    # Lookup tables over the codes of the artist, track name and song indexes, gathered
+    # for the scored rows
+    indexes = (
+        catalog.index(artist_column),
+        catalog.index("track_name"),
+        catalog.song_index(artist_column),
+    )
+    masks = (
+        indexes[0].mask_for(song.artist_name for song in selected_songs),
+        indexes[1].mask_for(song.track_name for song in selected_songs),
+        indexes[2].mask_for(song.key for song in exclude_songs),
+    )
+
+    def excluded(rows):
+        return np.logical_or.reduce(
+            [mask[index.codes[rows]] for index, mask in zip(indexes, masks)]
+        )
+
+    if index is None:
+        scores = feature_scores(matrix, centroid, metric)
+        scores[excluded(np.arange(len(scores)))] = np.inf
+        picked = _pick_closest(
+            catalog, scores, np.arange(len(scores)), artist_column, limit, artist_limit
+        )
+        return to_songs(catalog.songs, picked, artist_column)
+
+    # Visit the clusters nearest the selection, and more of them only if too few songs
+    # survived the filters
+    n_probe = N_PROBE
+    while True:
+        rows = index.candidates(centroid, n_probe)
+        scores = feature_scores(matrix[rows], centroid, metric)
+        scores[excluded(rows)] = np.inf
+        picked = _pick_closest(
+            catalog, scores, rows, artist_column, limit, artist_limit
+        )
+        if len(picked) >= limit or n_probe >= index.n_lists:
+            return to_songs(catalog.songs, picked, artist_column)
+        n_probe *= 2
+
+
+def _pick_closest(catalog, scores, rows, artist_column, limit, artist_limit):
+    """Runs select_rows() over the rows with the lowest finite scores, ranking a pool of
+    the closest rows and widening it only if the artist cap left too few."""
+    song_codes = catalog.song_index(artist_column).codes
+    pool = max(4 * limit, 32)
+    while True:
+        ranked = nearest_rows(scores, pool)
+        ranked = ranked[np.isfinite(scores[ranked])]
+        picked = select_rows(
+            catalog.songs, rows[ranked], artist_column, limit, artist_limit, song_codes
+        )
+        if len(picked) >= limit or pool >= len(scores):
+            return picked
+        pool *= 4
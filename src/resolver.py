@@ -0,0 +1,321 @@
+"""
+resolver.py
+
+This module defines the AudioResolver class, which runs blocking lookups such as
+yt_dlp's extract_info or a YouTube search on a bounded thread pool, so that resolving a
+song never stalls the discord.py event loop. Resolved streams are kept in a StreamCache,
+so replaying a song does not search YouTube again.
+
+Attributes:
+    - MAX_WORKERS (int): The number of lookups that may run at the same time.
+    - RESOLVE_TIMEOUT (float): Seconds to wait for a single lookup before giving up.
+    - STREAM_CACHE_PATH (str): Where the shared resolver persists resolved video ids,
+      read from the ENIGMA_STREAM_CACHE environment variable. Nothing is persisted if it
+      is unset.
+"""
+
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.metrics import metrics
+from src.stream_cache import StreamCache
+
+MAX_WORKERS = 4
+RESOLVE_TIMEOUT = 30.0
+STREAM_CACHE_PATH = os.getenv("ENIGMA_STREAM_CACHE")
+
+_resolver = None  # The process-wide resolver, created on first use
+
+
+class LookupCancelled(Exception):
+    """
+    Raised to whoever awaits a lookup that was abandoned with AudioResolver.cancel(), or
+    superseded by a newer lookup of the same owner.
+    """
+
+
+class AudioResolver:
+    """
+    Runs blocking lookups off the event loop, with a timeout per lookup, cancellation of
+    superseded lookups and counters describing what the pool is doing.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, timeout=RESOLVE_TIMEOUT, cache=None):
+        """Initializes the resolver and its thread pool.
+
+        Args:
+            max_workers (int, optional): The number of lookups that may run at the same
+                time.
+            timeout (float, optional): Seconds to wait for a lookup before raising
+                asyncio.TimeoutError.
+            cache (StreamCache, optional): Where resolved streams are cached. Nothing is
+                cached if omitted.
+        """
+        self.timeout = timeout
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="enigma-resolver"
+        )
+        self._pending = {}  # The latest lookup started by each owner, e.g. a guild id
+        self._abandoned = set()  # Lookups that cancel() abandoned
+        # Background refreshes of cached streams, keyed by video id
+        self._refreshing = {}
+        self.in_flight = 0  # Lookups that have been started and have not finished yet
+        self.completed = 0  # Lookups that returned a result
+        self.failed = 0  # Lookups that raised an error
+        self.timed_out = 0  # Lookups abandoned because they took too long
+        self.cancelled = 0  # Lookups abandoned because they were superseded or skipped
+        self.cache_hits = 0  # Searches answered from the stream cache
+
+    async def run(self, fn, *args, owner=None, timeout=None, **kwargs):
+        """Runs a blocking function on the thread pool and waits for its result without
+        blocking the event loop.
+
+        Args:
+            fn (callable): The blocking function to run.
+            *args: Positional arguments for fn.
+            owner (hashable, optional): Who the lookup is for. Starting a new lookup for
+                the same owner cancels the previous one, and cancel(owner) abandons it.
+            timeout (float, optional): Overrides the resolver's default timeout.
+            **kwargs: Keyword arguments for fn.
+
+        Returns:
+            The value returned by fn.
+
+        Raises:
+            asyncio.TimeoutError: If fn does not finish in time.
+            LookupCancelled: If the lookup was abandoned with cancel(owner) or
+                superseded. Cancelling the caller itself raises asyncio.CancelledError
+                as usual.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+        task = asyncio.ensure_future(
+            asyncio.wait_for(future, timeout if timeout is not None else self.timeout)
+        )
+
+        self.in_flight += 1
+        try:
+            result = await self._wait_pending(task, owner)
+            self.completed += 1
+            return result
+        except (asyncio.CancelledError, LookupCancelled):
+            self.cancelled += 1
+            raise
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def wait(self, lookup, owner):
+        """Waits for a lookup that is already running, such as a prefetch, as the
+        owner's pending lookup, so that cancel(owner) releases the wait. The lookup
+        itself keeps running, and its result is still cached.
+
+        Args:
+            lookup (asyncio.Future): The running lookup.
+            owner (hashable): Who is waiting for it, see run().
+
+        Returns:
+            The result of the lookup.
+
+        Raises:
+            LookupCancelled: If the wait was abandoned with cancel(owner) or superseded.
+        """
+        return await self._wait_pending(asyncio.shield(lookup), owner)
+
+    async def _wait_pending(self, task, owner):
+        """Awaits a lookup as the owner's pending one, replacing any it had before."""
+        if owner is not None:
+            self.cancel(owner)
+            self._pending[owner] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task in self._abandoned:
+                raise LookupCancelled(f"Lookup for {owner} was cancelled") from None
+            raise
+        finally:
+            self._abandoned.discard(task)
+            if owner is not None and self._pending.get(owner) is task:
+                del self._pending[owner]
+
+    async def search(self, ytdl, query, owner=None, timeout=None):
+        """Searches YouTube for a query and extracts the stream information of the first
+        result.
+
+        A cached stream is returned straight away while its URL is valid, and refreshed
+        in the background once it gets close to expiring. A query whose URL has expired
+        is re-extracted from its known video id, skipping the search.
+
+        Args:
+            ytdl (YoutubeDL): The yt_dlp instance to extract with.
+            query (str): The search query, typically str(song).
+            owner (hashable, optional): Who the lookup is for, see run().
+            timeout (float, optional): Overrides the resolver's default timeout.
+
+        Returns:
+            dict: The yt_dlp information of the first search result, including the
+                stream "url".
+        """
+        video_id = None
+        if self.cache is not None:
+            entry = self.cache.lookup(query)
+            if entry is not None:
+                now = time.time()
+                if entry.is_playable(now):
+                    if not entry.is_fresh(now, self.cache.refresh_margin):
+                        self._refresh_later(ytdl, query, entry.video_id)
+                    self.cache_hits += 1
+                    return entry.info()
+                video_id = entry.video_id
+
+        info = await self.run(
+            self._extract, ytdl, query, video_id, owner=owner, timeout=timeout
+        )
+        self._remember(query, info)
+        return info
+
+    @staticmethod
+    def _extract(ytdl, query, video_id=None):
+        """Runs yt_dlp on a worker thread, going straight to the video if its id is
+        already known."""
+        if video_id is not None:
+            return ytdl.extract_info(
+                f"https://www.youtube.com/watch?v={video_id}", download=False
+            )
+        return ytdl.extract_info(f"ytsearch:{query}", download=False)["entries"][0]
+
+    def _remember(self, query, info):
+        """Caches a resolved stream, persisting the video ids in the background when a
+        new one was learned."""
+        if self.cache is not None and self.cache.put(query, info):
+            if self.cache.path is not None:
+                self._executor.submit(self.cache.save)
+
+    def invalidate(self, query):
+        """Stops serving the cached stream of a query, for example after it failed to
+        play. The next search re-extracts it from its video id.
+
+        Args:
+            query (str or Song): The song query.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(query)
+
+    def _refresh_later(self, ytdl, query, video_id):
+        """Re-extracts a cached stream in the background, at most once at a time per
+        video."""
+        if video_id in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                info = await self.run(self._extract, ytdl, query, video_id)
+                self._remember(query, info)
+            except Exception:
+                # the old URL is still served until it expires, then the song is
+                # resolved again
+                pass
+            finally:
+                self._refreshing.pop(video_id, None)
+
+        self._refreshing[video_id] = asyncio.ensure_future(refresh())
+
+    def cancel(self, owner):
+        """Abandons the pending lookup of an owner, if there is one.
+
+        The worker thread cannot be interrupted, but whoever is awaiting the lookup is
+        released immediately, with LookupCancelled.
+
+        Args:
+            owner (hashable): The owner whose lookup should be cancelled.
+
+        Returns:
+            bool: True if a lookup was cancelled, False otherwise.
+        """
+        task = self._pending.pop(owner, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        self._abandoned.add(task)
+        return True
+
+    def is_resolving(self, owner):
+        """Checks if an owner has a lookup in progress.
+
+        Args:
+            owner (hashable): The owner to check.
+
+        Returns:
+            bool: True if the owner is waiting on a lookup, False otherwise.
+        """
+        task = self._pending.get(owner)
+        return task is not None and not task.done()
+
+    def stats(self):
+        """Returns the resolver's counters.
+
+        Returns:
+            dict: The number of in-flight, completed, failed, timed out and cancelled
+                lookups, and of cache hits.
+        """
+        return {
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+            "cache_hits": self.cache_hits,
+        }
+
+    def shutdown(self):
+        """Stops the thread pool, without waiting for lookups that are still running,
+        and persists the cache."""
+        if self.cache is not None:
+            self.cache.save()
+        self._executor.shutdown(wait=False)
+
+
+def get_resolver():
+    """Returns the process-wide resolver, creating it on first use.
+
+    Returns:
+        AudioResolver: The shared resolver.
+    """
+    global _resolver
+    if _resolver is None:
+        _resolver = AudioResolver(cache=StreamCache(path=STREAM_CACHE_PATH))
+    return _resolver
+
+
+def _lookup_counts():
+    """The shared resolver's finished lookups by outcome, without creating it."""
+    if _resolver is None:
+        return {}
+    counts = _resolver.stats()
+    del counts["in_flight"]
+    return counts
+
+
+metrics.gauge(
+    "enigma_resolver_in_flight",
+    "Lookups the shared resolver has started and not finished yet.",
+    lambda: _resolver.in_flight if _resolver is not None else 0,
+)
+metrics.gauge(
+    "enigma_resolver_lookups",
+    "Lookups of the shared resolver since startup, by outcome; cache_hits counts "
+    "searches answered from the stream cache.",
+    _lookup_counts,
+    ("outcome",),
+)
@@ -0,0 +1,219 @@
+"""
+sampler.py
+
+This module draws random songs from a catalog for /poll and the other discovery
+commands. Songs are handled as arrays of catalog row positions and every draw is a
+single vectorized call, however many songs are asked for.
+
+The GenreSampler draws songs genre by genre. Its rows are grouped by genre once, so a
+draw costs O(genres) rather than a pass over the catalog, and each genre can be given
+its own quota and weight, with songs optionally weighted by a column such as "pop".
+"""
+
+import numpy as np
+
+_rng = np.random.default_rng()
+
+
+def sample_rows(rows, n, rng=None):
+    """Draws n distinct rows uniformly at random.
+
+    Args:
+        rows (ndarray): The rows to draw from, e.g. SongCatalog.unique_rows().
+        n (int): How many rows to draw. Fewer are returned if there are not enough rows.
+        rng (Generator, optional): The random generator to use.
+
+    Returns:
+        ndarray: The drawn rows, in random order.
+    """
+    return (rng or _rng).choice(rows, size=min(n, len(rows)), replace=False)
+
+
+class GenreSampler:
+    """
+    Draws catalog rows stratified by genre.
+
+    The rows are stored grouped by genre in one array, with offsets[genre] marking where
+    each genre starts, like ColumnIndex. When songs are weighted, a running total of the
+    weights in that same order lets one weighted row per genre be found with a single
+    searchsorted call.
+    """
+
+    def __init__(self, rows, genre_codes, genres, weights=None):
+        """Groups the rows by genre.
+
+        Args:
+            rows (ndarray): The rows to draw from.
+            genre_codes (ndarray): The genre of each row as an index into genres,
+                aligned with rows.
+            genres (list[str]): The genre names.
+            weights (ndarray, optional): How likely each row is to be drawn within its
+                genre, aligned with rows. Negative and missing weights count as zero.
+                Rows are equally likely if omitted.
+        """
+        order = np.argsort(genre_codes, kind="stable")
+        self.genres = list(genres)
+        self._code_of = {genre: code for code, genre in enumerate(self.genres)}
+        self._rows = np.asarray(rows)[order]
+        self._counts = np.bincount(genre_codes, minlength=len(self.genres))
+        self._offsets = np.concatenate(([0], np.cumsum(self._counts)))
+        self._cumulative = None
+        if weights is not None:
+            weights = np.nan_to_num(np.asarray(weights, dtype=np.float64)[order]).clip(
+                min=0
+            )
+            self._cumulative = np.cumsum(weights)
+
+    @classmethod
+    def from_catalog(
+        cls,
+        catalog,
+        weight_column=None,
+        artist_column="artist_name",
+        genre_column="genre",
+    ):
+        """Builds a sampler over the distinct songs of a catalog.
+
+        Args:
+            catalog (SongCatalog): The catalog.
+            weight_column (str, optional): A numeric column to weight the songs by, e.g.
+                "pop".
+            artist_column (str, optional): The name of the artist column, used to find
+                repeated songs.
+            genre_column (str, optional): The name of the genre column.
+
+        Returns:
+            GenreSampler: The sampler.
+        """
+        rows = catalog.unique_rows(artist_column)
+        index = catalog.index(genre_column)
+        weights = (
+            None
+            if weight_column is None
+            else catalog.songs[weight_column].to_numpy()[rows]
+        )
+        return cls(rows, index.codes[rows], index.keys, weights)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _genre_weights(self, genre_weights):
+        """Returns how likely each genre is to be drawn, zero for genres without
+        rows."""
+        weights = (self._counts > 0).astype(np.float64)
+        if genre_weights is not None:
+            given = np.zeros(len(self.genres))
+            for genre, weight in genre_weights.items():
+                if genre in self._code_of:
+                    given[self._code_of[genre]] = max(weight, 0)
+            weights *= given
+        return weights
+
+    def _quotas(self, quotas):
+        """Returns how many rows to draw from each genre, capped at the genre's size."""
+        if isinstance(quotas, dict):
+            wanted = np.zeros(len(self.genres), dtype=np.intp)
+            for genre, quota in quotas.items():
+                if genre in self._code_of:
+                    wanted[self._code_of[genre]] = quota
+        else:
+            wanted = np.full(len(self.genres), quotas, dtype=np.intp)
+        return np.minimum(wanted, self._counts)
+
+    def sample(self, n=None, quotas=1, genre_weights=None, rng=None):
+        """Draws rows from n random genres.
+
+        Args:
+            n (int, optional): How many genres to draw from. Defaults to every genre
+                with a quota.
+            quotas (int or dict[str, int], optional): How many distinct rows to draw per
+                genre, either the same for every genre or per genre name, where missing
+                genres get none. Defaults to one per genre.
+            genre_weights (dict[str, float], optional): How likely each genre is to be
+                among the n, by name. Missing genres are never drawn. Genres are equally
+                likely if omitted.
+            rng (Generator, optional): The random generator to use.
+
+        Returns:
+            ndarray: The drawn rows, grouped by genre, genres in random order.
+        """
+        rng = rng or _rng
+        quotas = self._quotas(quotas)
+        weights = self._genre_weights(genre_weights) * (quotas > 0)
+        available = np.flatnonzero(weights)
+        n = len(available) if n is None else min(n, len(available))
+        if n == 0:
+            return self._rows[:0]
+        genres = rng.choice(
+            available,
+            size=n,
+            replace=False,
+            p=weights[available] / weights[available].sum(),
+        )
+
+        # One row per genre is the common case, and is drawn for every genre at once
+        if (quotas[genres] == 1).all():
+            return self._pick_one(genres, rng)
+        return np.concatenate(
+            [self._pick(genre, quotas[genre], rng) for genre in genres]
+        )
+
+    def _pick_one(self, genres, rng):
+        """Draws one row from each of the given genres."""
+        starts = self._offsets[genres]
+        counts = self._counts[genres]
+        if self._cumulative is None:
+            return self._rows[
+                starts + (rng.random(len(genres)) * counts).astype(np.intp)
+            ]
+
+        # Find where a uniform draw over each genre's share of the running total of
+        # weights lands
+        cumulative = self._cumulative
+        base = np.where(starts > 0, cumulative[starts - 1], 0.0)
+        totals = cumulative[starts + counts - 1] - base
+        positions = np.searchsorted(
+            cumulative, base + rng.random(len(genres)) * totals, side="right"
+        )
+        positions = np.clip(positions, starts, starts + counts - 1)
+        unweighted = totals <= 0  # every song of the genre has weight zero
+        uniform = (rng.random(unweighted.sum()) * counts[unweighted]).astype(np.intp)
+        positions[unweighted] = starts[unweighted] + uniform
+        return self._rows[positions]
+
+    def _pick(self, genre, count, rng):
+        """Draws count distinct rows from one genre."""
+        start, end = self._offsets[genre], self._offsets[genre + 1]
+        if self._cumulative is None:
+            return rng.choice(self._rows[start:end], size=count, replace=False)
+
+        # Weighted sampling without replacement (Efraimidis-Spirakis): keep the rows
+        # with the largest log(u) / w
+        weights = np.diff(
+            self._cumulative[start:end],
+            prepend=self._cumulative[start - 1] if start else 0.0,
+        )
+        with np.errstate(divide="ignore"):
+            keys = np.log(rng.random(end - start)) / weights
+        keys[weights <= 0] = -np.inf
+        best = np.argpartition(-keys, count - 1)[:count]
+        return self._rows[start:end][best]
+
+
+def genre_sampler(catalog, weight_column=None, artist_column="artist_name"):
+    """Returns a GenreSampler over the distinct songs of a catalog, built once per
+    catalog load.
+
+    Args:
+        catalog (SongCatalog): The catalog.
+        weight_column (str, optional): A numeric column to weight the songs by, e.g.
+            "pop".
+        artist_column (str, optional): The name of the artist column in the catalog.
+
+    Returns:
+        GenreSampler: The sampler.
+    """
+    return catalog.view(
+        ("genre_sampler", weight_column, artist_column),
+        lambda songs: GenreSampler.from_catalog(catalog, weight_column, artist_column),
+    )
@@ -0,0 +1,231 @@
+"""
+sessions.py
+
+This module keeps track of the interactive sessions the bot has open, such as the
+buttons of a /poll or /recommend message, and ends the ones nobody used for too long.
+
+Sessions are registered under the id of their message, so finding the session an
+interaction belongs to is a dictionary lookup however many sessions are open. Their
+timeouts all live in one TimerWheel, advanced by a single task, rather than each session
+keeping a timer task of its own.
+
+Attributes:
+    - TICK (float): The resolution of session timeouts, in seconds.
+    - WHEEL_SLOTS (int): How many ticks the timer wheel spans before deadlines wrap
+        around it.
+    - sessions (SessionRegistry): The process-wide registry the cogs register their
+        sessions in.
+"""
+
+import asyncio
+import math
+import time
+from collections import Counter
+
+from src.metrics import metrics
+
+TICK = 1.0
+WHEEL_SLOTS = 512
+
+
+class TimerWheel:
+    """
+    A hashed timing wheel: deadlines are rounded up to a tick, and kept in the slot of
+    that tick modulo the number of slots. Scheduling and cancelling are O(1), and
+    advancing the clock only visits the slots of the ticks that passed. Deadlines
+    further away than one turn of the wheel stay in their slot until their own turn
+    comes.
+
+    Rescheduling a key does not search for its old entry; the entry is left in place and
+    skipped once it comes due, since the key's deadline no longer matches it.
+    """
+
+    def __init__(self, tick=TICK, slots=WHEEL_SLOTS, clock=time.monotonic):
+        """Initializes an empty wheel.
+
+        Args:
+            tick (float, optional): The length of a tick, in seconds.
+            slots (int, optional): The number of slots.
+            clock (callable, optional): Returns the current time, in seconds.
+        """
+        self.tick = tick
+        self.clock = clock
+        self._slots = [[] for _ in range(slots)]
+        self._deadlines = {}  # key -> the tick it expires at
+        self._current = self._tick_of(clock())  # The last tick advance() went through
+
+    def _tick_of(self, when):
+        return math.ceil(when / self.tick)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, key):
+        return key in self._deadlines
+
+    def schedule(self, key, delay):
+        """Makes a key expire after a delay, replacing any deadline it had.
+
+        Args:
+            key (hashable): The key.
+            delay (float): Seconds from now.
+        """
+        due = max(self._tick_of(self.clock() + delay), self._current + 1)
+        self._deadlines[key] = due
+        self._slots[due % len(self._slots)].append((due, key))
+
+    def cancel(self, key):
+        """Forgets the deadline of a key, if it has one.
+
+        Args:
+            key (hashable): The key.
+        """
+        self._deadlines.pop(key, None)
+
+    def advance(self, now=None):
+        """Moves the wheel up to a time and returns the keys whose deadlines passed.
+
+        Args:
+            now (float, optional): The time to move to. Defaults to the clock.
+
+        Returns:
+            list: The expired keys, which are forgotten.
+        """
+        target = self._tick_of(self.clock() if now is None else now)
+        expired = []
+        # A full turn visits every slot, so there is no need to go round more than once
+        first = max(self._current + 1, target - len(self._slots) + 1)
+        for tick in range(first, target + 1):
+            slot = self._slots[tick % len(self._slots)]
+            if not slot:
+                continue
+            pending = []
+            for due, key in slot:
+                if due > target:
+                    pending.append((due, key))  # due on a later turn of the wheel
+                elif self._deadlines.get(key) == due:
+                    del self._deadlines[key]
+                    expired.append(key)
+                # otherwise the key was rescheduled or cancelled, and the entry is
+                # dropped
+            slot[:] = pending
+        self._current = max(self._current, target)
+        return expired
+
+
+class SessionRegistry:
+    """
+    The open sessions, by message id. A session is any object with an expire() method,
+    which the registry calls once the session has gone unused for its timeout;
+    SongPicker is one.
+    """
+
+    def __init__(self, tick=TICK, clock=time.monotonic):
+        """Initializes an empty registry.
+
+        Args:
+            tick (float, optional): The resolution of the timeouts, in seconds.
+            clock (callable, optional): Returns the current time, in seconds.
+        """
+        self._sessions = {}  # message id -> (session, timeout, kind)
+        self._wheel = TimerWheel(tick, clock=clock)
+        self._task = None  # Advances the wheel while there are sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def register(self, message_id, session, timeout, kind="session"):
+        """Opens a session.
+
+        Args:
+            message_id (int): The id of the message the session belongs to.
+            session: The session, with an expire() method.
+            timeout (float | None): Seconds without activity after which the session
+                expires, or None for never.
+            kind (str, optional): What the session is, e.g. "poll", for counts().
+        """
+        self._sessions[message_id] = (session, timeout, kind)
+        if timeout is not None:
+            self._wheel.schedule(message_id, timeout)
+            self._start()
+
+    def get(self, message_id):
+        """Returns the session of a message.
+
+        Args:
+            message_id (int): The id of the message.
+
+        Returns:
+            The session, or None if the message has no open session.
+        """
+        entry = self._sessions.get(message_id)
+        return entry[0] if entry else None
+
+    def touch(self, message_id):
+        """Restarts the timeout of a session, e.g. because it was just used. Unknown
+        messages are ignored.
+
+        Args:
+            message_id (int): The id of the message.
+        """
+        entry = self._sessions.get(message_id)
+        if entry is not None and entry[1] is not None:
+            self._wheel.schedule(message_id, entry[1])
+
+    def unregister(self, message_id):
+        """Closes a session without expiring it.
+
+        Args:
+            message_id (int): The id of the message.
+        """
+        self._sessions.pop(message_id, None)
+        self._wheel.cancel(message_id)
+
+    def counts(self):
+        """Counts the open sessions of every kind, for monitoring.
+
+        Returns:
+            dict[str, int]: The number of open sessions, by kind.
+        """
+        return dict(Counter(kind for _, _, kind in self._sessions.values()))
+
+    def expire_due(self, now=None):
+        """Expires every session whose timeout passed.
+
+        Args:
+            now (float, optional): The current time. Defaults to the clock.
+
+        Returns:
+            int: How many sessions expired.
+        """
+        expired = 0
+        for message_id in self._wheel.advance(now):
+            entry = self._sessions.pop(message_id, None)
+            if entry is not None:
+                entry[0].expire()
+                expired += 1
+        return expired
+
+    def _start(self):
+        """Starts the task that advances the wheel, if it is not running and there is an
+        event loop to run it on."""
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        except RuntimeError:
+            self._task = None  # no running loop; expire_due() has to be called by hand
+
+    async def _run(self):
+        while len(self._wheel):
+            await asyncio.sleep(self._wheel.tick)
+            self.expire_due()
+
+
+sessions = SessionRegistry()
+metrics.gauge(
+    "enigma_sessions_open",
+    "Open interactive sessions, by kind.",
+    sessions.counts,
+    ("kind",),
+)
@@ -1,35 +1,174 @@
 """
 song.py
 
-This module defines the Song class, which represents a music track with its associated details, such as
-track name, artist name, and genre.
+This module defines the Song class, which represents a music track with its associated
+details, such as track name, artist name, and genre.
+
+Songs are immutable and slotted, so the many that recommendations and polls create stay
+small, and they can be compared, hashed and kept in sets. A song picked from a catalog
+can hold just its row and read its details from the catalog when they are first needed.
+
+Two songs are the same song when their keys are equal: the track name and artist
+normalized by catalog_index.song_key, the key the catalog finds songs by. So the
+recommender, the poll and the queue all agree on which songs are duplicates, whatever
+their capitalization and spacing.
 """
 
+from src.catalog_index import song_key
+
+_UNSET = object()  # Marks a detail that has not been read from the catalog yet
+
 
 class Song:
+    __slots__ = (
+        "_track_name",
+        "_artist_name",
+        "_genre",
+        "_songs",
+        "_row",
+        "_artist_column",
+        "_str",
+        "_key",
+    )
+
     def __init__(self, track_name, artist_name=None, genre=None):
         """Initializes a new Song instance.
 
-    Args:
-        track_name (str): The name of the song.
-        artist_name (str, optional): The name of the artist. Defaults to None if unknown.
-        genre (str, optional): The genre of the song. Defaults to None if unspecified.
-"""
-        self.track_name = track_name  # The title of the song
-        self.artist_name = artist_name  # The artist who performed the song
-        self.genre = genre  # The genre of the song
+        Args:
+            track_name (str): The name of the song.
+            artist_name (str, optional): The name of the artist. Defaults to None if
+                unknown.
+            genre (str, optional): The genre of the song. Defaults to None if
+                unspecified.
+        """
+        _set = object.__setattr__
+        _set(self, "_track_name", track_name)  # The title of the song
+        _set(self, "_artist_name", artist_name)  # The artist who performed the song
+        _set(self, "_genre", genre)  # The genre of the song
+        # The catalog DataFrame the details are read from, if any
+        _set(self, "_songs", None)
+        _set(self, "_row", None)  # The position of the song in that DataFrame
+        _set(self, "_artist_column", None)
+        _set(self, "_str", None)
+        _set(self, "_key", None)
+
+    @classmethod
+    def from_row(cls, songs, row, artist_column="artist_name"):
+        """Creates a song that refers to a catalog row and reads its details from it on
+        first use.
+
+        The song keeps the DataFrame it was created from, so it keeps describing the
+        same song when the catalog is reloaded.
+
+        Args:
+            songs (DataFrame): The catalog's songs, e.g. SongCatalog.songs.
+            row (int): The position of the song in songs.
+            artist_column (str, optional): The name of the artist column in the catalog.
+
+        Returns:
+            Song: The song.
+        """
+        song = cls(_UNSET, _UNSET, _UNSET)
+        object.__setattr__(song, "_songs", songs)
+        object.__setattr__(song, "_row", int(row))
+        object.__setattr__(song, "_artist_column", artist_column)
+        return song
+
+    def _resolve(self):
+        """Reads the track name, artist and genre from the catalog row, once."""
+        songs, row, _set = self._songs, self._row, object.__setattr__
+        _set(self, "_track_name", songs["track_name"].iat[row])
+        _set(self, "_artist_name", songs[self._artist_column].iat[row])
+        _set(
+            self,
+            "_genre",
+            songs["genre"].iat[row] if "genre" in songs.columns else None,
+        )
+
+    @property
+    def track_name(self):
+        """str: The title of the song."""
+        if self._track_name is _UNSET:
+            self._resolve()
+        return self._track_name
+
+    @property
+    def artist_name(self):
+        """str | None: The artist who performed the song."""
+        if self._artist_name is _UNSET:
+            self._resolve()
+        return self._artist_name
+
+    @property
+    def genre(self):
+        """str | None: The genre of the song."""
+        if self._genre is _UNSET:
+            self._resolve()
+        return self._genre
+
+    @property
+    def row(self):
+        """int | None: The catalog row the song was created from with from_row(), if
+        any."""
+        return self._row
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"Song is immutable, cannot set {name!r}")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"Song is immutable, cannot delete {name!r}")
+
+    def __reduce__(self):
+        # pickled and copied by its details, without the catalog it may refer to
+        return Song, (self.track_name, self.artist_name, self.genre)
+
+    @property
+    def key(self):
+        """str: The normalized track name and artist that identify the song (see
+        catalog_index.song_key). It is computed once per song."""
+        if self._key is None:
+            object.__setattr__(
+                self, "_key", song_key(self.track_name, self.artist_name)
+            )
+        return self._key
+
+    def __eq__(self, other):
+        """Songs are equal when their keys are, i.e. they have the same track name and
+        artist up to capitalization and spacing."""
+        if self is other:
+            return True
+        if not isinstance(other, Song):
+            return NotImplemented
+        if (
+            self._songs is not None
+            and self._songs is other._songs
+            and self._row == other._row
+        ):
+            return True
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"Song({self.track_name!r}, {self.artist_name!r}, {self.genre!r})"
 
     def __str__(self):
         """Returns a formatted string representation of the song.
 
-    If the artist name is available, the format will be '<track_name> by <artist_name>'.
-    Otherwise, it will simply return the track name.
+        If the artist name is available, the format will be '<track_name> by
+        <artist_name>'. Otherwise, it will simply return the track name. It is computed
+        once per song.
 
-    Returns:
-        str: The string representation of the song.
-"""
-        if self.artist_name is None:
-            return self.track_name  # Return just the track name if artist is unknown
-        else:
-            # Return 'track by artist' format if artist is known
-            return f"{self.track_name} by {self.artist_name}"
+        Returns:
+            str: The string representation of the song.
+        """
+        if self._str is None:
+            if self.artist_name is None:
+                # Return just the track name if artist is unknown
+                text = self.track_name
+            else:
+                # Return 'track by artist' format if artist is known
+                text = f"{self.track_name} by {self.artist_name}"
+            object.__setattr__(self, "_str", text)
+        return self._str
@@ -0,0 +1,154 @@
+"""
+song_picker.py
+
+This module defines the SongPicker class, the buttons under the /poll and /recommend
+embeds. The buttons are part of the message itself, so they arrive with the single
+request that sends the embed, instead of one request per reaction, and a click reaches
+the bot as an interaction it answers directly rather than as a reaction event.
+
+Attributes:
+    - NUMBER_EMOJIS (list): The emojis of the numbered buttons, one per song.
+"""
+
+import asyncio
+import contextlib
+
+import discord
+
+from src.sessions import sessions
+
+NUMBER_EMOJIS = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
+_BUTTONS_PER_ROW = 5
+
+
+def numbered(songs, details=True):
+    """Lists songs one per line, each after the emoji of its button.
+
+    Args:
+        songs (list[Song]): The songs.
+        details (bool, optional): Whether to add the genre of every song.
+
+    Returns:
+        str: The list, e.g. for the description of an embed.
+    """
+    return "\n".join(
+        (
+            f"{NUMBER_EMOJIS[i]} {song} ({song.genre})"
+            if details
+            else f"{NUMBER_EMOJIS[i]} {song}"
+        )
+        for i, song in enumerate(songs)
+    )
+
+
+class SongPicker(discord.ui.View):
+    """
+    A numbered button per song, plus optional control buttons, that only answer the user
+    who ran the command.
+
+    The view is meant to be reused: show() swaps in a new list of songs, and editing the
+    message with the same view updates its buttons in the request that updates the
+    embed.
+
+    Its timeout is left to the session registry (see sessions.py): the view is
+    registered under its message, every click restarts its timeout there, and the
+    registry calls expire() when it runs out. The command that sends the view does not
+    wait for it; whatever has to happen once the session is over goes in on_close.
+    """
+
+    def __init__(self, user, songs, on_pick, controls=(), timeout=None, on_close=None):
+        """Creates the buttons.
+
+        Args:
+            user (User): The only user whose clicks are answered.
+            songs (list[Song]): The songs to offer, at most len(NUMBER_EMOJIS).
+            on_pick (callable): Coroutine function called with the interaction and the
+                song when a song is picked.
+            controls (iterable[tuple[str, callable]], optional): The emoji of every
+                control button, with the coroutine function called with the interaction
+                when it is clicked.
+            timeout (float, optional): Seconds without a click after which discord.py
+                stops the view. Leave it unset when the view is registered in the
+                session registry.
+            on_close (callable, optional): Coroutine function called without arguments
+                once the view is closed, see close().
+        """
+        super().__init__(timeout=timeout)
+        self.user = user
+        self.on_close = on_close
+        self.timed_out = False  # Whether the view stopped because it went unused
+        self.message = None  # The message the buttons are under, set once it is sent
+        self._closed = False
+        self._closing = None  # The task closing the view after it expired
+        self.songs = []
+        self._number_buttons = []
+        for index, emoji in enumerate(NUMBER_EMOJIS):
+            button = discord.ui.Button(emoji=emoji, row=index // _BUTTONS_PER_ROW)
+            button.callback = self._picker(on_pick, index)
+            self._number_buttons.append(button)
+        self._control_buttons = []
+        control_row = len(NUMBER_EMOJIS) // _BUTTONS_PER_ROW
+        for emoji, on_click in controls:
+            button = discord.ui.Button(
+                emoji=emoji, style=discord.ButtonStyle.primary, row=control_row
+            )
+            button.callback = on_click
+            self._control_buttons.append(button)
+        self.show(songs)
+
+    def _picker(self, on_pick, index):
+        """Returns the callback of the button of the song at a position."""
+
+        async def callback(interaction):
+            if index < len(self.songs):
+                await on_pick(interaction, self.songs[index])
+            else:
+                await interaction.response.defer()
+
+        return callback
+
+    def show(self, songs):
+        """Offers a new list of songs, hiding the buttons that have no song.
+
+        Args:
+            songs (list[Song]): The songs to offer, at most len(NUMBER_EMOJIS).
+        """
+        self.songs = list(songs)[: len(NUMBER_EMOJIS)]
+        self.clear_items()
+        for button in self._number_buttons[: len(self.songs)] + self._control_buttons:
+            self.add_item(button)
+
+    async def close(self):
+        """Ends the session: stops the view, closes its session, removes the buttons
+        from the message unless it is gone, and calls on_close. Only the first call
+        does anything."""
+        if self._closed:
+            return
+        self._closed = True
+        self.stop()
+        if self.message is not None:
+            sessions.unregister(self.message.id)
+            with contextlib.suppress(discord.HTTPException):
+                await self.message.edit(view=None)
+        if self.on_close is not None:
+            await self.on_close()
+
+    def expire(self):
+        """Closes the view because it went unused. Called by the session registry."""
+        self.timed_out = True
+        self._closing = asyncio.ensure_future(self.close())
+
+    async def on_timeout(self):
+        self.timed_out = True
+        await self.close()
+
+    async def interaction_check(self, interaction):
+        """Lets only the user who ran the command use the buttons, telling anyone else
+        so privately."""
+        if interaction.user == self.user:
+            sessions.touch(interaction.message.id)
+            return True
+        await interaction.response.send_message(
+            f"Only {self.user.display_name} can use these buttons.", ephemeral=True
+        )
+        return False
@@ -0,0 +1,319 @@
+"""
+song_queue.py
+
+This module defines the SongQueue class, the queue of songs waiting to be played in a
+guild. It is an indexable skip
+list: every link also stores how many songs it skips, so a song can be found, inserted
+    or removed by its position in
+O(log n) expected time instead of the O(n) a Python list needs to shift its tail. Taking
+the song at the front only relinks the levels of that one song, which is O(1) expected.
+
+Attributes:
+    - MAX_LEVEL (int): The maximum height of a node, enough for about 2^MAX_LEVEL songs.
+"""
+
+import random
+from itertools import islice
+
+MAX_LEVEL = 32
+
+
+class _Node:
+    """
+    A song in the skip list. next[level] is the following node on that level and
+    width[level] is how many positions further along it is.
+    """
+
+    __slots__ = ("song", "next", "width")
+
+    def __init__(self, song, level):
+        self.song = song
+        self.next = [None] * level
+        self.width = [1] * level
+
+
+def _random_level():
+    """Draws the height of a new node: each extra level is half as likely as the
+    previous one."""
+    level = 1
+    while level < MAX_LEVEL and random.random() < 0.5:
+        level += 1
+    return level
+
+
+class SongQueue:
+    """
+    A list-like queue of songs with fast positional operations. Positions start at 0,
+    like a list.
+
+    The widths stored on the head node are offset by _shift, which grows by one every
+    time the front song is taken. That way popleft() only has to relink the levels the
+    front song was on, instead of shortening the head's link on every level.
+    """
+
+    def __init__(self, songs=()):
+        """Initializes the queue.
+
+        Args:
+            songs (iterable[Song], optional): The songs to start with, front first.
+        """
+        self._build(songs)
+
+    def _build(self, songs):
+        """Replaces the contents of the queue with the given songs in O(n)."""
+        self._head = _Node(None, MAX_LEVEL)
+        self._levels = 1  # Levels in use. Head widths above this are not maintained
+        # Subtracted from the head's stored widths, see the class docstring
+        self._shift = 0
+        self._size = 0
+        self.version = getattr(self, "version", -1) + 1  # Incremented on every change
+
+        last = [self._head] * MAX_LEVEL  # The last node linked on each level
+        last_pos = [-1] * MAX_LEVEL
+        for pos, song in enumerate(songs):
+            level = _random_level()
+            node = _Node(song, level)
+            for lv in range(level):
+                last[lv].next[lv] = node
+                last[lv].width[lv] = pos - last_pos[lv]
+                last[lv] = node
+                last_pos[lv] = pos
+            self._levels = max(self._levels, level)
+            self._size = pos + 1
+        for lv in range(self._levels):
+            last[lv].width[lv] = self._size - last_pos[lv]  # distance to the end
+
+    def _width(self, node, level):
+        """Returns how many positions a link skips, undoing the head's shift."""
+        if node is self._head:
+            return node.width[level] - self._shift
+        return node.width[level]
+
+    def _set_width(self, node, level, width):
+        """Stores how many positions a link skips, applying the head's shift."""
+        node.width[level] = width + self._shift if node is self._head else width
+
+    def _predecessors(self, index):
+        """Finds, on every level in use, the last node before the given position.
+
+        Returns:
+            tuple[list[_Node], list[int]]: The nodes and their positions (-1 for the
+            head).
+        """
+        chain = [None] * self._levels
+        positions = [0] * self._levels
+        head = node = self._head
+        pos = -1
+        for level in reversed(range(self._levels)):
+            # inlined _width(), since this loop is the hot path of every positional
+            # operation
+            width = (
+                node.width[level] - self._shift if node is head else node.width[level]
+            )
+            while node.next[level] is not None and pos + width < index:
+                pos += width
+                node = node.next[level]
+                width = node.width[level]
+            chain[level] = node
+            positions[level] = pos
+        return chain, positions
+
+    def _normalize(self, index):
+        """Converts a possibly negative position into a non-negative one, raising
+        IndexError if out of range."""
+        size = self._size
+        if index < 0:
+            index += size
+        if index < 0 or index >= size:
+            raise IndexError("song queue index out of range")
+        return index
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        node = self._head.next[0]
+        while node is not None:
+            yield node.song
+            node = node.next[0]
+
+    def iter_from(self, start):
+        """Iterates over the songs from a position onwards, finding the start in O(log
+        n).
+
+        Args:
+            start (int): The position of the first song.
+
+        Returns:
+            iterator[Song]: The songs from that position to the end of the queue.
+        """
+        if start >= self._size:
+            return
+        chain, _ = self._predecessors(max(start, 0))
+        node = chain[0].next[0]
+        while node is not None:
+            yield node.song
+            node = node.next[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._size)
+            if step == 1:
+                return list(islice(self.iter_from(start), max(stop - start, 0)))
+            return list(self)[index]
+        chain, _ = self._predecessors(self._normalize(index))
+        return chain[0].next[0].song
+
+    def __eq__(self, other):
+        if isinstance(other, (SongQueue, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"SongQueue({list(self)!r})"
+
+    def insert(self, index, song):
+        """Inserts a song so that it ends up at the given position.
+
+        Args:
+            index (int): The position of the new song. Positions past the end append it,
+                like list.insert.
+            song (Song): The song to insert.
+        """
+        if index < 0:
+            index = max(index + self._size, 0)
+        index = min(index, self._size)
+
+        level = _random_level()
+        if level > self._levels:
+            for lv in range(self._levels, level):
+                self._head.next[lv] = None
+                self._set_width(self._head, lv, self._size + 1)
+            self._levels = level
+
+        chain, positions = self._predecessors(index)
+        node = _Node(song, level)
+        for lv in range(level):
+            prev = chain[lv]
+            width = self._width(prev, lv)
+            node.next[lv] = prev.next[lv]
+            node.width[lv] = positions[lv] + width - index + 1
+            prev.next[lv] = node
+            self._set_width(prev, lv, index - positions[lv])
+        for lv in range(level, self._levels):
+            self._set_width(chain[lv], lv, self._width(chain[lv], lv) + 1)
+
+        self._size += 1
+        self.version += 1
+
+    def append(self, song):
+        """Adds a song to the back of the queue.
+
+        Args:
+            song (Song): The song to add.
+        """
+        self.insert(self._size, song)
+
+    def extend(self, songs):
+        """Adds songs to the back of the queue.
+
+        Args:
+            songs (iterable[Song]): The songs to add, in order.
+        """
+        for song in songs:
+            self.append(song)
+
+    def pop(self, index=-1):
+        """Removes the song at a position and returns it.
+
+        Args:
+            index (int, optional): The position of the song. Defaults to the last one,
+                like list.pop.
+
+        Returns:
+            Song: The removed song.
+        """
+        index = self._normalize(index)
+        if index == 0:
+            return self.popleft()
+
+        chain, _ = self._predecessors(index)
+        target = chain[0].next[0]
+        for lv in range(self._levels):
+            prev = chain[lv]
+            if prev.next[lv] is target:
+                self._set_width(prev, lv, self._width(prev, lv) + target.width[lv] - 1)
+                prev.next[lv] = target.next[lv]
+            else:
+                self._set_width(prev, lv, self._width(prev, lv) - 1)
+
+        self._size -= 1
+        self.version += 1
+        return target.song
+
+    def popleft(self):
+        """Removes the song at the front of the queue and returns it.
+
+        Returns:
+            Song: The removed song.
+        """
+        target = self._head.next[0]
+        if target is None:
+            raise IndexError("pop from empty song queue")
+
+        self._shift += 1  # every other link from the head now skips one position less
+        for lv in range(len(target.next)):
+            self._head.next[lv] = target.next[lv]
+            self._set_width(self._head, lv, target.width[lv])
+
+        self._size -= 1
+        self.version += 1
+        return target.song
+
+    def move(self, src, dest):
+        """Moves the song at one position so that it ends up at another.
+
+        Args:
+            src (int): The current position of the song.
+            dest (int): The position the song should end up at.
+
+        Returns:
+            Song: The moved song.
+        """
+        song = self.pop(src)
+        self.insert(dest, song)
+        return song
+
+    def drop_front(self, count):
+        """Discards the first songs of the queue in O(log n), regardless of how many are
+        dropped.
+
+        Args:
+            count (int): How many songs to discard.
+        """
+        count = min(max(count, 0), self._size)
+        if count == 0:
+            return
+
+        chain, positions = self._predecessors(count)
+        for lv in range(self._levels):
+            prev = chain[lv]
+            if prev is self._head:
+                width = self._width(prev, lv) - count
+            else:
+                width = positions[lv] + prev.width[lv] - count + 1
+                self._head.next[lv] = prev.next[lv]
+            self._set_width(self._head, lv, width)
+
+        self._size -= count
+        self.version += 1
+
+    def shuffle(self):
+        """Shuffles the queue in place in O(n)."""
+        songs = list(self)
+        random.shuffle(songs)
+        self._build(songs)
+
+    def clear(self):
+        """Removes every song from the queue."""
+        self._build(())
@@ -1,9 +1,11 @@
 """
-This file is responsible for all bot commands regarding songs such /poll for generating recommendations,
-/next_song for playing next song and so on
+This file is responsible for all bot commands regarding songs such /poll for generating
+recommendations, /next_song for playing next song and so on
 """
 
 import asyncio
+import threading
+import time
 
 import discord
 from discord.ext.commands import bot
@@ -13,12 +15,14 @@
 from dotenv import load_dotenv
 from discord.ext import commands
 
+from src.metrics import command_finished, command_started, stage, stage_seconds
+
+from src.prefetch import Prefetcher
+from src.queue_pages import VIEW_TIMEOUT, QueuePages, page_count, queue_embed
+from src.resolver import LookupCancelled, get_resolver
+from src.sessions import sessions
 from src.song import Song
 from src.utils import searchSong, random_25
-import yt_dlp as youtube_dl
-
-# Suppress noise from yt-dlp
-youtube_dl.utils.bug_reports_message = lambda: ""
 
 ytdl_format_options = {
     "format": "bestaudio/best",
@@ -39,7 +43,52 @@
     "options": "-vn",
 }
 
-ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+_ytdl = None
+_ytdl_lock = threading.Lock()
+
+
+def get_ytdl():
+    """
+    returns the shared yt_dlp downloader, importing and configuring yt_dlp on first use
+    instead of when this module is imported. Safe to call from several threads at once
+
+    :return: the YoutubeDL instance
+    """
+    global _ytdl
+    if _ytdl is None:
+        with _ytdl_lock:
+            if _ytdl is None:
+                import yt_dlp as youtube_dl
+
+                # Suppress noise from yt-dlp
+                youtube_dl.utils.bug_reports_message = lambda: ""
+                _ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
+    return _ytdl
+
+
+class FirstPacketTimer(discord.AudioSource):
+    """
+    Wraps an audio source and calls a function when the voice client reads its first
+    packet, i.e. once FFmpeg has started producing audio. The function runs on the voice
+    client's player thread
+    """
+
+    def __init__(self, source, on_first_packet):
+        self.source = source
+        self.on_first_packet = on_first_packet
+
+    def read(self):
+        data = self.source.read()
+        if self.on_first_packet is not None:
+            on_first_packet, self.on_first_packet = self.on_first_packet, None
+            on_first_packet()
+        return data
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
 
 
 class SongQueueCog(commands.Cog):
@@ -49,6 +98,42 @@ class SongQueueCog(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        # Resolves songs to stream URLs off the event loop
+        self.resolver = get_resolver()
+        # Resolves the next songs while one plays
+        self.prefetcher = Prefetcher(self.resolver)
+
+    async def cog_before_invoke(self, ctx):
+        """
+        runs before every command of this cog, to time it
+
+        :param ctx: the command context
+        """
+        command_started(ctx)
+
+    async def cog_after_invoke(self, ctx):
+        """
+        runs after every command of this cog, since most of them can change the head of
+        the queue, and times and logs the command
+
+        :param ctx: the command context
+        """
+        self.prefetch(ctx)
+        BotState.log_outcome(ctx, command_finished(ctx))
+
+    def prefetch(self, ctx):
+        """
+        helper function to start resolving the songs at the head of the queue while the
+        current song plays, and to drop the prefetches of songs that are no longer at
+        the head
+
+        :param ctx: the command context
+        """
+        state = BotState.for_guild(ctx.guild)
+        if state.is_in_use() and BotState.is_in_voice_channel(ctx.guild.voice_client):
+            self.prefetcher.sync(get_ytdl(), ctx.guild.id, state.song_queue)
+        else:
+            self.prefetcher.invalidate(ctx.guild.id)
 
     @commands.command(name="join", help="Joins the voice channel of the user")
     async def join(self, ctx):
@@ -117,11 +202,12 @@ async def pause(self, ctx):
         :param ctx: the command context
         :return:
         """
+        state = BotState.for_guild(ctx.guild)
         voice_client = ctx.message.guild.voice_client
         if voice_client:
-            if BotState.is_in_use():
-                if not BotState.is_paused():
-                    BotState.pause(voice_client)
+            if state.is_in_use():
+                if not state.is_paused():
+                    state.pause(voice_client)
                     await BotState.log_and_send(ctx, "Pausing music")
                 else:
                     await BotState.log_and_send(ctx, "I am already paused")
@@ -144,11 +230,12 @@ async def unpause(self, ctx):
         :param ctx: the command context
         :return:
         """
+        state = BotState.for_guild(ctx.guild)
         voice_client = ctx.message.guild.voice_client
         if voice_client:
-            if BotState.is_in_use():
-                if BotState.is_paused():
-                    BotState.unpause(voice_client)
+            if state.is_in_use():
+                if state.is_paused():
+                    state.unpause(voice_client)
                     await BotState.log_and_send(ctx, "Unpausing music")
                 else:
                     await BotState.log_and_send(ctx, "I am already unpaused")
@@ -171,10 +258,11 @@ async def queue(self, ctx, *, query):
         :param ctx: the command context
         :param query: the query (song) to queue
         """
+        state = BotState.for_guild(ctx.guild)
         song = await self.ensure_song(ctx, query)
         if song is not None:
             # remember that commands expect queue idx to start at 1
-            if await self.insert_song(ctx, len(BotState.song_queue) + 1, song):
+            if await self.insert_song(ctx, len(state.song_queue) + 1, song):
                 await BotState.log_and_send(ctx, f"Queued song: {song}")
 
     @commands.command(name="insert", help="insert a custom song")
@@ -213,9 +301,11 @@ async def insert_song(ctx, idx, song):
         :param idx: the index to add it to
         :param song: the song object
         """
+        state = BotState.for_guild(ctx.guild)
         idx = await SongQueueCog.ensure_insert_number(ctx, idx)
         if idx is not None:
-            BotState.song_queue.insert(idx, song)
+            state.song_queue.insert(idx, song)
+            BotState.persist(state)
             return True
         return False
 
@@ -227,9 +317,11 @@ async def delete_track(ctx, idx):
         :param ctx: the command context
         :param idx: the index to remove
         """
+        state = BotState.for_guild(ctx.guild)
         idx = await SongQueueCog.ensure_track_number(ctx, idx)
         if idx is not None:
-            removed_song = BotState.song_queue.pop(idx)
+            removed_song = state.song_queue.pop(idx)
+            BotState.persist(state)
             return removed_song
         return None
 
@@ -251,14 +343,16 @@ async def ensure_song(ctx, query):
     @staticmethod
     async def ensure_track_number(ctx, idx):
         """
-        helper function to ensure a valid track number, then convert it from a list-start-at-1 idx to a list-start-at-0 idx
+        helper function to ensure a valid track number, then convert it from a
+        list-start-at-1 idx to a list-start-at-0 idx
 
         :param ctx: the command context
         :param idx: the index
         """
+        state = BotState.for_guild(ctx.guild)
         try:
             safe_idx = int(idx) - 1
-            if safe_idx < 0 or safe_idx >= len(BotState.song_queue):
+            if safe_idx < 0 or safe_idx >= len(state.song_queue):
                 raise ValueError
             return safe_idx
         except ValueError:
@@ -268,14 +362,16 @@ async def ensure_track_number(ctx, idx):
     @staticmethod
     async def ensure_insert_number(ctx, idx):
         """
-        helper function to ensure a valid insertion number, then convert it from a list-start-at-1 idx to a list-start-at-0 idx
+        helper function to ensure a valid insertion number, then convert it from a
+        list-start-at-1 idx to a list-start-at-0 idx
 
         :param ctx: the command context
         :param idx: the index
         """
+        state = BotState.for_guild(ctx.guild)
         try:
             safe_idx = int(idx) - 1
-            if safe_idx < 0 or safe_idx > len(BotState.song_queue):
+            if safe_idx < 0 or safe_idx > len(state.song_queue):
                 raise ValueError
             return safe_idx
         except ValueError:
@@ -289,30 +385,67 @@ async def play_song(self, ctx, song):
         :param ctx: the command context
         :param idx: the song object to play
         """
+        state = BotState.for_guild(ctx.guild)
         voice_client = ctx.message.guild.voice_client
         if voice_client:
-            # Search for the song on YouTube
-            info = ytdl.extract_info(f"ytsearch:{song}", download=False)["entries"][0]
+            # When the previous track ended on its own, the gap until this one is heard
+            # is a song transition
+            transition_start, state.playback.ended_at = state.playback.ended_at, None
+
+            # Search for the song on YouTube without blocking the event loop
+            try:
+                with stage("resolve"):
+                    info = await self.prefetcher.resolve(
+                        get_ytdl(), song, owner=ctx.guild.id
+                    )
+            except LookupCancelled:
+                # /next skipped the song while it was loading
+                BotState.log_command(ctx, f"Stopped loading {song}")
+                return
+            except asyncio.TimeoutError:
+                await BotState.log_and_send(ctx, f"Timed out while loading **{song}**")
+                return
             url = info["url"]
 
-            if BotState.is_in_use():
-                BotState.stop(voice_client)
+            playback = state.playback
+            if state.is_in_use():
                 BotState.log_command(
-                    ctx, f"Terminating current song {BotState.current_song_playing}"
+                    ctx,
+                    f"Terminating current song {state.current_song_playing}",
+                    event="song_replaced",
                 )
+                # the stopped song must not advance the queue, since this song replaces
+                # it
+                playback.hand_off()
+                state.stop(voice_client)
 
-            while BotState.is_in_use():
-                # we must wait for the previous song to clean up
-                pass
+            # we must wait for the previous song to clean up
+            await playback.wait_idle()
 
             # Play the audio stream
+            loop = asyncio.get_running_loop()
+            generation = playback.begin()
+            ffmpeg_start = time.perf_counter()
+
+            def on_first_packet():
+                now = time.perf_counter()
+                stage_seconds.labels("ffmpeg_first_packet").observe(now - ffmpeg_start)
+                if transition_start is not None:
+                    stage_seconds.labels("song_transition").observe(
+                        now - transition_start
+                    )
+
             ctx.voice_client.play(
-                discord.FFmpegPCMAudio(url, **ffmpeg_options),
-                after=lambda error: asyncio.run_coroutine_threadsafe(
-                    self.on_play_query_end(ctx, error), self.bot.loop
+                FirstPacketTimer(
+                    discord.FFmpegPCMAudio(url, **ffmpeg_options), on_first_packet
+                ),
+                after=lambda error: loop.call_soon_threadsafe(
+                    self.on_track_end, ctx, playback, generation, song, error
                 ),
             )
-            BotState.current_song_playing = song
+            state.current_song_playing = song
+            BotState.persist(state)
+            self.prefetch(ctx)
 
             await BotState.log_and_send(ctx, f"Now playing: **{song}**")
         else:
@@ -320,25 +453,51 @@ async def play_song(self, ctx, song):
                 ctx, "I am currently not connected to a voice channel"
             )
 
-    async def on_play_query_end(self, ctx, error):
+    def on_track_end(self, ctx, playback, generation, song, error):
         """
-        function that runs once a song is terminated or ends normally, will typically play the next song
-        if one is available
+        runs on the event loop once the voice client has finished a track, and continues
+        with the queue unless the track was replaced by another song
 
         :param ctx: the command context
+        :param playback: the playback state machine the track was started on
+        :param generation: the generation of the track that ended
+        :param song: the song that ended
         :param error: any error that was thrown during playback
         """
+        if playback.end(generation):
+            asyncio.ensure_future(self.on_play_query_end(ctx, error, song))
+
+    async def on_play_query_end(self, ctx, error, song=None):
+        """
+        function that runs once a song is terminated or ends normally, will typically
+        play the next song if one is available
+
+        :param ctx: the command context
+        :param error: any error that was thrown during playback
+        :param song: the song that ended, replayed if looping
+        """
+        state = BotState.for_guild(ctx.guild)
         voice_client = ctx.guild.voice_client
+        if song is None:
+            song = state.current_song_playing
 
-        BotState.log_command(ctx, "Finished playing song")
-        BotState.stop(voice_client)
+        BotState.log_command(ctx, "Finished playing song", event="song_end")
+        if error is not None and song is not None:
+            # e.g. the stream URL was rejected, so it must not be served from the cache
+            self.resolver.invalidate(song)
+        state.stop(voice_client)
+        BotState.persist(state)
 
         if BotState.is_in_voice_channel(voice_client):
-            if BotState.is_looping():
-                await self.play_song(ctx, BotState.current_song_playing)
+            if state.is_looping() and song is not None:
+                await self.play_song(ctx, song)
+                return
             else:
-                if len(BotState.song_queue) > 0:
+                if len(state.song_queue) > 0:
                     await self.play_next_song(ctx)
+                    return
+        # nothing follows the song, so there is no transition to measure
+        state.playback.ended_at = None
 
     @commands.command(
         name="next", help="Immediately jump to the next song in the queue"
@@ -349,8 +508,11 @@ async def next(self, ctx):
 
         :param ctx: the command context
         """
-        if BotState.is_in_use():
-            BotState.stop(ctx.guild.voice_client)
+        state = BotState.for_guild(ctx.guild)
+        # a song that is still being loaded is skipped as well
+        self.resolver.cancel(ctx.guild.id)
+        if state.is_in_use():
+            state.stop(ctx.guild.voice_client)
         else:
             await self.play_next_song(ctx)
 
@@ -360,44 +522,40 @@ async def play_next_song(self, ctx):
 
         :param ctx: the command context
         """
-        if len(BotState.song_queue) == 0:
+        state = BotState.for_guild(ctx.guild)
+        if len(state.song_queue) == 0:
             await BotState.log_and_send(ctx, f"Please add a song to the queue first")
         else:
-            next_song = BotState.song_queue.pop(0)
+            next_song = state.song_queue.popleft()
+            BotState.persist(state)
             await self.play_song(ctx, next_song)
 
     @commands.command(name="view", help="Show current queue and currently playing song")
     async def view(self, ctx):
         """
-        /view will show the current queue and currently playing song
+        /view will show the currently playing song and the queue, one page at a time,
+        with buttons to flip through the pages if there is more than one
 
         :param ctx: the command context
         """
-        msg = ""
-        if BotState.is_in_use():
-            msg += f"Now playing: {BotState.current_song_playing}"
-
-            if BotState.is_paused():
-                msg += " **[PAUSED]**"
-
-            if BotState.is_looping():
-                msg += " **[LOOPING]**"
-
-            msg += "\n\n"
-        else:
-            msg += "Currently not playing anything\n\n"
-
-        if len(BotState.song_queue) == 0:
-            msg += "No songs in queue. Try /queue <query> to get started"
-        else:
-            msg += "Current Queue:\n"
-            for i, song in enumerate(BotState.song_queue, start=1):
-                msg += f"{i}. {song}\n"
-
-        await ctx.send(msg)
-
+        state = BotState.for_guild(ctx.guild)
+        if page_count(state.song_queue) == 1:
+            embed, _ = queue_embed(state)
+            with stage("discord_send"):
+                await ctx.send(embed=embed)
+            BotState.log_command(ctx, "Acknowledged")
+            return
+
+        pages = QueuePages(state)
+        with stage("discord_send"):
+            msg = await ctx.send(embed=pages.embed(), view=pages)
         BotState.log_command(ctx, "Acknowledged")
 
+        # The pages flip in place until nobody has clicked for a while, when the
+        # registry removes the buttons
+        pages.message = msg
+        sessions.register(msg.id, pages, VIEW_TIMEOUT, kind="queue")
+
     @commands.command(name="shuffle", help="To shuffle songs in queue")
     async def shuffle(self, ctx):
         """
@@ -405,10 +563,12 @@ async def shuffle(self, ctx):
 
         :param ctx: the command context
         """
-        if len(BotState.song_queue) == 0:
+        state = BotState.for_guild(ctx.guild)
+        if len(state.song_queue) == 0:
             await ctx.send(f"No songs in queue. Try /queue <query> to get started")
         else:
-            random.shuffle(BotState.song_queue)
+            state.song_queue.shuffle()
+            BotState.persist(state)
             await ctx.send(f"Shuffled! Do /view to see the current queue")
 
         BotState.log_command(ctx, "Acknowledged")
@@ -421,18 +581,23 @@ async def jumpto(self, ctx, *, idx):
         :param ctx: the command context
         :param idx: the track index to jump to
         """
+        state = BotState.for_guild(ctx.guild)
         safe_idx = await self.ensure_track_number(ctx, idx)
 
         if safe_idx is not None:
             # We discard all the songs before idx
-            BotState.song_queue = BotState.song_queue[safe_idx:]
+            state.song_queue.drop_front(safe_idx)
+            BotState.persist(state)
             await BotState.log_and_send(
                 ctx, f"Jumped to track number {idx} in the queue"
             )
 
     @commands.command(
         name="move",
-        help="Move the song at the given track number in a different position in the queue",
+        help=(
+            "Move the song at the given track number in a different position in the "
+            "queue"
+        ),
     )
     async def move(self, ctx, *, params):
         """
@@ -443,8 +608,9 @@ async def move(self, ctx, *, params):
         """
         src_idx, dest_idx = params.split(" ", maxsplit=1)
 
-        # dest_idx is ensured as a track number (0 < idx < size) and not as an insertion number (0 < idx <= size)
-        # this is because when we can only move it to a maximum index of size-1
+        # dest_idx is ensured as a track number (0 < idx < size) and not as an insertion
+        # number (0 < idx <= size) this is because when we can only move it to a maximum
+        # index of size-1
         safe_dest_idx = await self.ensure_track_number(ctx, dest_idx)
         if safe_dest_idx is not None:
             moved_song = await self.delete_track(ctx, src_idx)
@@ -492,8 +658,9 @@ async def moveback(self, ctx, *, src_idx):
         :param ctx: the command context
         :param idx: the track index to remove
         """
+        state = BotState.for_guild(ctx.guild)
         # remember that commands expect queue idx to start at 1
-        await self.move(ctx, params=f"{src_idx} {len(BotState.song_queue)}")
+        await self.move(ctx, params=f"{src_idx} {len(state.song_queue)}")
 
     @commands.command(
         name="replay", help="Will replay the currently playing song once after it ends"
@@ -504,13 +671,14 @@ async def replay(self, ctx):
 
         :param ctx: the command context
         """
-        if not BotState.is_in_use():
+        state = BotState.for_guild(ctx.guild)
+        if not state.is_in_use():
             await BotState.log_and_send(ctx, "I am currently not playing any songs")
         else:
-            if BotState.is_looping():
+            if state.is_looping():
                 await BotState.log_and_send(ctx, "I am already set to loop")
             else:
-                await self.insert_song(ctx, 1, BotState.current_song_playing)
+                await self.insert_song(ctx, 1, state.current_song_playing)
                 await BotState.log_and_send(
                     ctx, "Got it, I will add this song to the front of the queue again"
                 )
@@ -524,13 +692,14 @@ async def replaynow(self, ctx):
 
         :param ctx: the command context
         """
-        if not BotState.is_in_use():
+        state = BotState.for_guild(ctx.guild)
+        if not state.is_in_use():
             await BotState.log_and_send(ctx, "I am currently not playing any songs")
         else:
             await BotState.log_and_send(
                 ctx, "Got it, I will immediately restart this song"
             )
-            await self.insert_song(ctx, 1, BotState.current_song_playing)
+            await self.insert_song(ctx, 1, state.current_song_playing)
             await self.next(ctx)
 
     @staticmethod
@@ -0,0 +1,225 @@
+"""
+state_store.py
+
+This module defines the StateStore class, which saves a snapshot of every guild's queue,
+current song and loop flag to an SQLite database, so that a restart or crash of the bot
+does not lose them.
+
+Snapshots are not written on every change. A change only marks its guild as dirty, which
+costs a dictionary assignment, and the dirty guilds are written together in one
+transaction once the changes settle for FLUSH_DELAY seconds, or at the latest
+MAX_FLUSH_DELAY seconds after the first unsaved change, so a guild that keeps changing
+still gets saved. Snapshots that fail to be written are kept, and written again
+RETRY_DELAY seconds later, or with the next flush if that comes first. The database runs
+in WAL mode, so a write appends to the log instead of rewriting pages in place, and
+restoring every guild at startup is a single query.
+
+Attributes:
+    - STATE_DB (str): Path of the database.
+    - FLUSH_DELAY (float): Seconds a change waits for further changes before the dirty
+        guilds are written.
+    - MAX_FLUSH_DELAY (float): Seconds after the first unsaved change by which the dirty
+        guilds are written anyway.
+    - RETRY_DELAY (float): Seconds after a failed flush at which it is tried again.
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+
+from src.bot_state import GuildState
+from src.song import Song
+
+STATE_DB = "./data/state.sqlite3"
+FLUSH_DELAY = 0.5
+MAX_FLUSH_DELAY = 5.0
+RETRY_DELAY = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS guild_state (
+    guild_id INTEGER PRIMARY KEY,
+    current_song TEXT,
+    queue TEXT NOT NULL,
+    is_looping INTEGER NOT NULL,
+    saved_at REAL NOT NULL
+)
+"""
+
+
+def _encode_song(song):
+    return [song.track_name, song.artist_name, song.genre]
+
+
+def _decode_song(fields):
+    return Song(*fields)
+
+
+class StateStore:
+    """
+    Saves and restores guild states. One row holds the snapshot of one guild, with its
+    songs encoded as JSON.
+    """
+
+    def __init__(self, path=STATE_DB, delay=FLUSH_DELAY, max_delay=MAX_FLUSH_DELAY):
+        """Opens the database, creating it if needed.
+
+        Args:
+            path (str, optional): Path of the database file.
+            delay (float, optional): Seconds a change waits for further changes before
+                it is written.
+            max_delay (float, optional): Seconds after the first unsaved change by which
+                it is written anyway.
+        """
+        self.path = path
+        self.delay = delay
+        self.max_delay = max_delay
+        # autocommit mode, with explicit transactions around each flush
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL stays consistent on a crash, a flush costs no fsync
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(_SCHEMA)
+        self._dirty = {}  # Guilds with unsaved changes, guild id -> GuildState
+        self._forgotten = set()  # Guilds whose snapshot should be deleted
+        self._flush_handle = None  # The pending flush, if one is scheduled
+        # loop.time() by which the pending flush must run, set by the first unsaved
+        # change
+        self._deadline = None
+
+    def mark_dirty(self, state):
+        """Schedules a snapshot of a guild's state to be saved with the next flush.
+
+        Args:
+            state (GuildState): The state that changed.
+        """
+        self._forgotten.discard(state.guild_id)
+        self._dirty[state.guild_id] = state
+        self._schedule()
+
+    def forget(self, guild_id):
+        """Schedules the snapshot of a guild to be deleted with the next flush.
+
+        Args:
+            guild_id (int): The id of the guild.
+        """
+        self._dirty.pop(guild_id, None)
+        self._forgotten.add(guild_id)
+        self._schedule()
+
+    def _schedule(self):
+        """Moves the pending flush to the delay from now, but no later than the maximum
+        delay after the first unsaved change. Without an event loop, flushes right
+        away."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        now = loop.time()
+        if self._flush_handle is None:
+            self._deadline = now + self.max_delay
+        else:
+            self._flush_handle.cancel()
+        self._flush_handle = loop.call_at(
+            min(now + self.delay, self._deadline), self.flush
+        )
+
+    def flush(self):
+        """Writes the snapshots of every dirty guild, and deletes the forgotten ones, in
+        one transaction. If the transaction fails, they are kept, a retry is scheduled
+        RETRY_DELAY seconds later when an event loop is running, and the error is
+        raised.
+
+        The write runs on the calling thread, i.e. on the event loop when the flush was
+        scheduled. This is accepted: in WAL mode with synchronous=NORMAL a commit does
+        not fsync, and a flush only covers the guilds changed since the last one. It
+        takes well under a millisecond for a few guilds, and about 55 ms for 1000
+        guilds of 50 songs (see benchmarks/state_store_benchmark.py).
+
+        Returns:
+            int: How many guilds were written or deleted.
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+            self._deadline = None
+        dirty, self._dirty = self._dirty, {}
+        forgotten, self._forgotten = self._forgotten, set()
+        if not dirty and not forgotten:
+            return 0
+
+        now = time.time()
+        rows = [
+            (
+                guild_id,
+                (
+                    None
+                    if state.current_song_playing is None
+                    else json.dumps(_encode_song(state.current_song_playing))
+                ),
+                json.dumps([_encode_song(song) for song in state.song_queue]),
+                int(state.is_looping()),
+                now,
+            )
+            for guild_id, state in dirty.items()
+        ]
+        try:
+            with self._db:  # BEGIN ... COMMIT, or ROLLBACK on error
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO guild_state VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self._db.executemany(
+                    "DELETE FROM guild_state WHERE guild_id = ?",
+                    [(id_,) for id_ in forgotten],
+                )
+        except Exception:
+            # Put the guilds back for the next flush, unless they changed again since
+            for guild_id, state in dirty.items():
+                if guild_id not in self._forgotten:
+                    self._dirty.setdefault(guild_id, state)
+            self._forgotten.update(
+                guild_id for guild_id in forgotten if guild_id not in self._dirty
+            )
+            self._retry_later()
+            raise
+        return len(rows) + len(forgotten)
+
+    def _retry_later(self):
+        """Schedules the next flush RETRY_DELAY seconds from now, unless a change moves
+        it earlier. Without an event loop, the next change or close() flushes."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._flush_handle is None:
+            self._deadline = loop.time() + RETRY_DELAY
+            self._flush_handle = loop.call_at(self._deadline, self.flush)
+
+    def load_all(self):
+        """Restores every saved guild state with a single query.
+
+        A song that was playing cannot resume where it stopped, so it is put back at the
+        front of its queue.
+
+        Returns:
+            dict[int, GuildState]: The restored states, by guild id.
+        """
+        states = {}
+        for guild_id, current_song, queue, is_looping, _ in self._db.execute(
+            "SELECT * FROM guild_state"
+        ):
+            songs = [_decode_song(fields) for fields in json.loads(queue)]
+            if current_song is not None:
+                songs.insert(0, _decode_song(json.loads(current_song)))
+            state = GuildState(guild_id)
+            state.song_queue = songs
+            state.set_is_looping(bool(is_looping))
+            states[guild_id] = state
+        return states
+
+    def close(self):
+        """Writes what is still dirty and closes the database."""
+        self.flush()
+        self._db.close()
@@ -0,0 +1,225 @@
+"""
+stream_cache.py
+
+This module defines the StreamCache class, which remembers which YouTube video a song
+query resolved to and the stream URL yt_dlp extracted for it, so that replays, loops and
+re-queued songs can skip the search.
+
+Stream URLs handed out by googlevideo.com stop working at the timestamp in their
+"expire" query parameter, so each cached URL is only served until shortly before that
+moment. The query to video id mapping never expires and can be persisted to disk across
+restarts.
+
+Attributes:
+    - MAX_ENTRIES (int): The number of songs kept before the least recently used one is
+        evicted.
+    - REFRESH_MARGIN (float): Seconds before a URL expires at which it is considered due
+        for a refresh.
+    - DEFAULT_TTL (float): Lifetime assumed for URLs that carry no expiry timestamp.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlparse
+
+MAX_ENTRIES = 512
+REFRESH_MARGIN = 300.0
+DEFAULT_TTL = 3600.0
+
+
+def normalize_query(query):
+    """Normalizes a song query so that trivially different spellings share a cache
+    entry.
+
+    Args:
+        query (str or Song): The query to normalize.
+
+    Returns:
+        str: The query in lower case with runs of whitespace collapsed.
+    """
+    return " ".join(str(query).lower().split())
+
+
+def url_expiry(url, now=None):
+    """Reads the expiry timestamp embedded in a googlevideo stream URL.
+
+    Args:
+        url (str): The stream URL.
+        now (float, optional): The current time, used when the URL carries no expiry.
+
+    Returns:
+        float: The UNIX time at which the URL stops working.
+    """
+    expire = parse_qs(urlparse(url).query).get("expire")
+    if expire:
+        try:
+            return float(expire[0])
+        except ValueError:
+            pass
+    return (time.time() if now is None else now) + DEFAULT_TTL
+
+
+class CachedStream:
+    """
+    The cached resolution of one song query.
+    """
+
+    __slots__ = ("video_id", "url", "expires_at")
+
+    def __init__(self, video_id, url=None, expires_at=0.0):
+        """Initializes a cache entry.
+
+        Args:
+            video_id (str): The YouTube id of the video the query resolved to.
+            url (str, optional): The resolved stream URL, if one is known.
+            expires_at (float, optional): The UNIX time at which the URL stops working.
+        """
+        self.video_id = video_id
+        self.url = url
+        self.expires_at = expires_at
+
+    def is_fresh(self, now, margin=REFRESH_MARGIN):
+        """Checks if the URL can be played without refreshing it first.
+
+        Args:
+            now (float): The current time.
+            margin (float, optional): Seconds before expiry at which the URL stops
+                counting as fresh.
+
+        Returns:
+            bool: True if the URL is still valid and not due for a refresh, False
+                otherwise.
+        """
+        return self.url is not None and now < self.expires_at - margin
+
+    def is_playable(self, now):
+        """Checks if the URL has not expired yet, even if it is due for a refresh.
+
+        Args:
+            now (float): The current time.
+
+        Returns:
+            bool: True if the URL is still valid, False otherwise.
+        """
+        return self.url is not None and now < self.expires_at
+
+    def info(self):
+        """Returns the entry in the shape of the yt_dlp information it was created from.
+
+        Returns:
+            dict: The video "id" and stream "url".
+        """
+        return {"id": self.video_id, "url": self.url}
+
+
+class StreamCache:
+    """
+    A bounded, least-recently-used cache of song query resolutions.
+    """
+
+    def __init__(
+        self, max_entries=MAX_ENTRIES, refresh_margin=REFRESH_MARGIN, path=None
+    ):
+        """Initializes the cache, loading persisted video ids if a path is given and
+        exists.
+
+        Args:
+            max_entries (int, optional): The number of songs kept before the least
+                recently used is evicted.
+            refresh_margin (float, optional): Seconds before expiry at which a URL is
+                due for a refresh.
+            path (str, optional): A JSON file the query to video id mapping is persisted
+                to.
+        """
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        self.path = path
+        # Normalized query -> CachedStream, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()  # save() runs on a worker thread
+        self._save_lock = threading.Lock()  # One save writes the file at a time
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, query):
+        """Returns the entry for a query, marking it as recently used.
+
+        Args:
+            query (str or Song): The song query.
+
+        Returns:
+            CachedStream: The entry, or None if the query has never been resolved.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        return entry
+
+    def put(self, query, info, now=None):
+        """Stores the yt_dlp information a query resolved to, evicting the least
+        recently used entry if full.
+
+        Args:
+            query (str or Song): The song query.
+            info (dict): The yt_dlp information, with at least "id" and "url".
+            now (float, optional): The current time.
+
+        Returns:
+            bool: True if the query resolved to a video id that was not known before,
+                False otherwise.
+        """
+        key = normalize_query(query)
+        url = info.get("url")
+        entry = CachedStream(
+            info.get("id"), url, url_expiry(url, now) if url is not None else 0.0
+        )
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return previous is None or previous.video_id != entry.video_id
+
+    def invalidate(self, query):
+        """Drops the stream URL of a query, for example after it failed to play. The
+        video id is kept, so the query is re-extracted without searching again.
+
+        Args:
+            query (str or Song): The song query.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = CachedStream(entry.video_id)
+
+    def save(self):
+        """Writes the query to video id mapping to the cache's path. Stream URLs are not
+        persisted. Concurrent saves wait for each other, so the last one to start
+        writes the newest mapping."""
+        if self.path is None:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with self._save_lock:
+            with self._lock:
+                ids = {key: entry.video_id for key, entry in self._entries.items()}
+            with open(tmp_path, "w", encoding="utf-8") as file:
+                json.dump(ids, file)
+            os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Reads a persisted query to video id mapping, keeping the most recently saved
+        entries."""
+        with open(self.path, encoding="utf-8") as file:
+            ids = json.load(file)
+        with self._lock:
+            for key, video_id in list(ids.items())[-self.max_entries :]:
+                self._entries[key] = CachedStream(video_id)
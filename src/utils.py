@@ -2,27 +2,34 @@
 This file is responsible for all the helper functions that are used
 """
 
-from youtubesearchpython import VideosSearch
-from src.get_all import filtered_songs
+from src.catalog import get_catalog, SONGS_CSV
+from src.sampler import genre_sampler
 
 """
-This function seaches the song on youtube and returns the URL
+This function seaches the song on youtube and returns the URL. It blocks the calling
+thread; the bot itself resolves songs with AudioResolver.search on the resolver's pool
 """
 
 
 def searchSong(name_song):
+    # imported on first use: youtubesearchpython loads all of yt_dlp's YouTube
+    # extractors, which would otherwise slow down every import of the bot. Python's
+    # import lock makes this safe from the resolver's threads
+    from youtubesearchpython import VideosSearch
+
     videosSearch = VideosSearch(name_song, limit=1)
     result = videosSearch.result()
     link = result["result"][0]["link"]
     return link
 
 
-all_songs = filtered_songs()[["track_name", "artist", "genre"]]
 """
-This function returns random 25 songs for generating the poll for the user
+This function returns random 25 songs for generating the poll for the user, each from a
+different genre
 """
 
 
 def random_25():
-    random_songs = (all_songs.sample(frac=1).groupby("genre").head(1)).sample(25)
-    return random_songs
+    catalog = get_catalog(SONGS_CSV)
+    rows = genre_sampler(catalog, artist_column="artist").sample(25)
+    return catalog.columns("track_name", "artist", "genre").iloc[rows]
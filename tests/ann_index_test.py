@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.ann_index import IVFIndex
+from src.catalog import SongCatalog
+from src.recommender import (
+    FEATURE_COLUMNS,
+    feature_matrix,
+    feature_points,
+    recommend_by_features,
+)
+from src.song import Song
+
+
+def clustered_points(seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0, 10, (8, 4))
+    return (centres[rng.integers(0, 8, 800)] + rng.normal(0, 1, (800, 4))).astype(
+        np.float32
+    )
+
+
+class Tests(unittest.TestCase):
+
+    def test_candidates_contain_nearest_neighbours(self):
+        points = clustered_points()
+        index = IVFIndex.build(points, n_lists=8)
+        query = points[0] + 0.1
+
+        exact = np.argsort(((points - query) ** 2).sum(axis=1))[:10]
+        candidates = index.candidates(query, n_probe=2)
+
+        self.assertEqual(len(index), len(points))
+        self.assertTrue(set(exact.tolist()) <= set(candidates.tolist()))
+        self.assertEqual(
+            sorted(index.candidates(query, n_probe=8).tolist()),
+            list(range(len(points))),
+        )
+
+    def test_sidecar_is_reused_until_points_change(self):
+        points = clustered_points()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "songs.csv.euclidean.ivf.npz")
+
+            built = IVFIndex.load_or_build(points, path, n_lists=8)
+            loaded = IVFIndex.load_or_build(points, path, n_lists=8, seed=1)
+            rebuilt = IVFIndex.load_or_build(points[:-1], path, n_lists=8)
+
+            self.assertTrue(os.path.exists(path))
+            np.testing.assert_array_equal(loaded.order, built.order)
+            self.assertEqual(loaded.checksum, built.checksum)
+            self.assertEqual(len(rebuilt), len(points) - 1)
+            self.assertEqual(IVFIndex.load(path).checksum, rebuilt.checksum)
+
+    def test_recommendations_through_index_match_exact_search(self):
+        points = clustered_points()
+        songs = pd.DataFrame(
+            {
+                "track_name": [f"Song{i}" for i in range(len(points))],
+                "artist": [f"Artist{i}" for i in range(len(points))],
+                "genre": ["Pop"] * len(points),
+            }
+        )
+        for column, feature in enumerate(FEATURE_COLUMNS):
+            songs[feature] = points[:, column % points.shape[1]]
+        catalog = SongCatalog.from_frame(songs)
+        selected = [Song("Song0", "Artist0", "Pop")]
+
+        exact = recommend_by_features(catalog, selected, "euclidean")
+        index = IVFIndex.build(
+            feature_points(feature_matrix(catalog, "euclidean"), "euclidean"), n_lists=4
+        )
+        approximate = recommend_by_features(catalog, selected, "euclidean", index=index)
+
+        self.assertEqual(
+            [str(song) for song in approximate], [str(song) for song in exact]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.bot_state import BotState, GuildState
+
+
+class Tests(unittest.TestCase):
+
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
+    def test_for_guild_creates_state_once(self, mock_guilds):
+        guild = MagicMock(id=1)
+
+        state = BotState.for_guild(guild)
+
+        self.assertIsInstance(state, GuildState)
+        self.assertIs(BotState.for_guild(guild), state)
+        self.assertIsNot(BotState.for_guild(MagicMock(id=2)), state)
+
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
+    def test_evict_idle(self, mock_guilds):
+        idle = BotState.for_guild(MagicMock(id=1))
+        playing = BotState.for_guild(MagicMock(id=2))
+        playing.current_song_playing = "Song 1"
+        recent = BotState.for_guild(MagicMock(id=3))
+
+        idle.last_used = playing.last_used = 0.0
+        recent.last_used = 100.0
+        evicted = BotState.evict_idle(max_idle=50.0, now=120.0)
+
+        self.assertEqual(evicted, 1)
+        self.assertEqual(sorted(BotState.guilds), [2, 3])
+
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
+    def test_evict_idle_keeps_queued_songs(self, mock_guilds):
+        queued = BotState.for_guild(MagicMock(id=1))
+        queued.song_queue.append("Song 1")
+        queued.last_used = 0.0
+
+        evicted = BotState.evict_idle(max_idle=50.0, now=120.0)
+
+        self.assertEqual(evicted, 0)
+        self.assertIs(BotState.guilds[1], queued)
+
+    def test_stop_resets_state(self):
+        state = GuildState(1)
+        state.current_song_playing = "Song 1"
+        state.pause(None)
+        voice_client = MagicMock()
+
+        state.stop(voice_client)
+
+        voice_client.stop.assert_called_once()
+        self.assertFalse(state.is_in_use())
+        self.assertFalse(state.is_paused())
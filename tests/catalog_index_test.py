@@ -0,0 +1,138 @@
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from src.catalog import SongCatalog
+from src.catalog_index import ColumnIndex, song_key, song_keys
+
+
+def songs_frame(genres):
+    return pd.DataFrame(
+        {
+            "track_name": [f"Song{i}" for i in range(len(genres))],
+            "artist_name": [f"Artist{i % 3}" for i in range(len(genres))],
+            "genre": genres,
+        }
+    )
+
+
+class Tests(unittest.TestCase):
+
+    def test_rows_by_value(self):
+        index = ColumnIndex(np.array(["Pop", "Rock", "Pop", "Jazz"], dtype=object))
+
+        self.assertEqual(index.rows("Pop").tolist(), [0, 2])
+        self.assertEqual(index.rows_for(["Jazz", "Pop"]).tolist(), [0, 2, 3])
+        self.assertEqual(index.rows("Blues").tolist(), [])
+        self.assertEqual(index.first("Rock"), 1)
+        self.assertEqual(index.first_rows().tolist(), [0, 1, 3])
+
+    def test_update_matches_rebuild(self):
+        rng = np.random.default_rng(510)
+        values = rng.choice(["a", "b", "c", "d"], 200).astype(object)
+        index = ColumnIndex(values)
+
+        for size in (200, 230, 150):
+            values = values.copy() if size == len(values) else np.resize(values, size)
+            changed_rows = rng.choice(size, 10, replace=False)
+            values[changed_rows] = rng.choice(["a", "e", "f"], 10)
+
+            index.update(values)
+            rebuilt = ColumnIndex(values)
+
+            self.assertEqual(len(index), size)
+            for key in ("a", "b", "c", "d", "e", "f"):
+                self.assertEqual(index.rows(key).tolist(), rebuilt.rows(key).tolist())
+            self.assertEqual(index.first_rows().tolist(), rebuilt.first_rows().tolist())
+
+    def test_categorical_update_matches_rebuild(self):
+        index = ColumnIndex(pd.Categorical(["Pop", "Rock", "Pop", "Jazz"]))
+
+        changed = index.update(
+            pd.Categorical(["Pop", "Blues", "Pop", "Jazz", None, "Rock"])
+        )
+        rebuilt = ColumnIndex(
+            np.array(["Pop", "Blues", "Pop", "Jazz", None, "Rock"], dtype=object)
+        )
+
+        self.assertEqual(changed, 3)
+        for key in ("Pop", "Rock", "Jazz", "Blues"):
+            self.assertEqual(index.rows(key).tolist(), rebuilt.rows(key).tolist())
+        self.assertEqual(index.rows(None).tolist(), [4])
+        self.assertEqual(
+            index.update(pd.Categorical(["Pop", "Blues", "Pop", "Jazz", None, "Rock"])),
+            0,
+        )
+
+    def test_matches_compares_codes(self):
+        index = ColumnIndex(pd.Categorical(["Pop", "Rock", "Pop", "Jazz"]))
+
+        self.assertEqual(
+            index.matches(["Pop", "Blues"], np.array([3, 2, 1])).tolist(),
+            [False, True, False],
+        )
+        self.assertEqual(index.matches([], np.array([0, 1])).tolist(), [False, False])
+
+    def test_song_key_ignores_case_and_spacing(self):
+        self.assertEqual(
+            song_key("Hello  World", "ADELE "), song_key("hello world", "Adele")
+        )
+
+    def test_missing_artist_gets_one_key(self):
+        keys = song_keys(
+            pd.Series(["Hello", "Hello"]), pd.Series([np.nan, None], dtype=object)
+        )
+
+        self.assertEqual(keys.tolist(), [song_key("hello", None)] * 2)
+        self.assertEqual(song_key("Hello", float("nan")), song_key("hello", None))
+
+    def test_catalog_rows_by_genres(self):
+        catalog = SongCatalog.from_frame(
+            songs_frame(["Pop", "Rock", "Pop", "Pop", "Jazz"])
+        )
+
+        rows = catalog.rows_by_genres(
+            ["Pop", "Jazz"], exclude_artists=["Artist0"], exclude_tracks=["Song2"]
+        )
+
+        self.assertEqual(rows.tolist(), [4])
+
+    def test_catalog_stores_repeated_strings_as_categories(self):
+        catalog = SongCatalog.from_frame(songs_frame(["Pop", "Rock", "Pop"]))
+
+        self.assertIsInstance(catalog.songs["genre"].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(catalog.songs["artist_name"].dtype, pd.CategoricalDtype)
+        self.assertNotIsInstance(catalog.songs["track_name"].dtype, pd.CategoricalDtype)
+        self.assertEqual(
+            catalog.index("genre").keys, list(catalog.songs["genre"].cat.categories)
+        )
+
+    def test_catalog_dedupes_by_song_key(self):
+        songs = songs_frame(["Pop", "Rock", "Pop"])
+        songs.loc[2, ["track_name", "artist_name"]] = ["song0", "ARTIST0"]
+        catalog = SongCatalog.from_frame(songs)
+
+        self.assertEqual(catalog.unique_rows().tolist(), [0, 1])
+        self.assertEqual(catalog.row_of("SONG0", "artist0"), 0)
+        self.assertIsNone(catalog.row_of("Song9", "Artist0"))
+
+    def test_catalog_indexes_follow_reload(self):
+        catalog = SongCatalog.from_frame(
+            songs_frame(["Pop", "Rock", "Pop"]), path="songs.csv"
+        )
+        genre_index = catalog.index("genre")
+
+        with patch(
+            "pandas.read_csv", return_value=songs_frame(["Pop", "Jazz", "Pop", "Jazz"])
+        ):
+            catalog.reload()
+
+        self.assertIs(catalog.index("genre"), genre_index)
+        self.assertEqual(catalog.rows_by_genres(["Jazz"]).tolist(), [1, 3])
+        self.assertEqual(catalog.rows_by_genres(["Rock"]).tolist(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
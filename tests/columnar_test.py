@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from src.catalog import SongCatalog
+from src.columnar import columnar_path, convert, is_fresh, read_columnar, write_columnar
+
+
+def songs_frame():
+    return pd.DataFrame(
+        {
+            "track_name": ["Song1", "Sóng2", "Song3"],
+            "artist": ["Artist1", "Artist1", None],
+            "genre": ["pop", "rock", "pop"],
+            "bpm": [97, 87, 120],
+            "val": [0.5, np.nan, 0.25],
+        }
+    )
+
+
+def is_memory_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return False
+
+
+class Tests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.directory.name, "songs.csv")
+        songs_frame().to_csv(self.csv_path, index=False)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        path = os.path.join(self.directory.name, "frame.columnar")
+
+        write_columnar(songs_frame(), path)
+        songs = read_columnar(path)
+
+        self.assertEqual(list(songs.columns), list(songs_frame().columns))
+        self.assertEqual(list(songs["track_name"]), ["Song1", "Sóng2", "Song3"])
+        self.assertEqual(list(songs["artist"][:2]), ["Artist1", "Artist1"])
+        self.assertTrue(pd.isna(songs["artist"][2]))
+        self.assertTrue(is_memory_mapped(songs["bpm"].to_numpy()))
+        np.testing.assert_array_equal(songs["val"], [0.5, np.nan, 0.25])
+
+    def test_conversion_goes_stale_when_csv_changes(self):
+        self.assertFalse(is_fresh(self.csv_path))
+
+        convert(self.csv_path)
+        self.assertTrue(is_fresh(self.csv_path))
+
+        songs_frame().head(2).to_csv(self.csv_path, index=False)
+        self.assertFalse(is_fresh(self.csv_path))
+
+    def test_catalog_prefers_fresh_conversion(self):
+        convert(self.csv_path)
+        catalog = SongCatalog(self.csv_path)
+
+        with patch("pandas.read_csv") as mock_read_csv:
+            songs = catalog.songs
+
+        mock_read_csv.assert_not_called()
+        self.assertTrue(os.path.isdir(columnar_path(self.csv_path)))
+        pd.testing.assert_frame_equal(
+            songs, SongCatalog.from_frame(pd.read_csv(self.csv_path)).songs
+        )
+        self.assertEqual(catalog.index("genre").rows("pop").tolist(), [0, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
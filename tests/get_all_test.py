@@ -1,7 +1,10 @@
 from src.recommend_cog import *
 from src.get_all import *
+from src.catalog import reset_catalogs
+import time
 import unittest
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 from unittest.mock import patch
 import sys
@@ -60,6 +63,14 @@ def test_songs():
     return generate_test_songs_data()
 
 
+@pytest.fixture(autouse=True)
+def fresh_catalogs():
+    # The catalogs are cached per process, so make every test read its own data
+    reset_catalogs()
+    yield
+    reset_catalogs()
+
+
 @patch("pandas.read_csv")
 def test_get_songs_by_genre_length_less(mock_read_csv, test_songs):
     mock_read_csv.return_value = test_songs
@@ -103,6 +114,57 @@ def test_get_songs_variety(mock_read_csv, test_songs):
     ), "The selections should vary."
 
 
+@patch("pandas.read_csv")
+def test_get_songs_one_per_genre(mock_read_csv, test_songs):
+    mock_read_csv.return_value = test_songs
+
+    # There are 7 genres, so no more than 7 songs can have distinct genres
+    result = get_songs_by_genre(10, one_per_genre=True)
+
+    assert len(result) == 7
+    assert result["genre"].is_unique
+
+
+@patch("pandas.read_csv")
+def test_get_songs_by_genre_more_than_available(mock_read_csv, test_songs):
+    mock_read_csv.return_value = pd.concat([test_songs, test_songs.head(2)])
+
+    # Duplicate songs are only drawn once, and asking for too many returns them all
+    result = get_songs_by_genre(25)
+
+    assert len(result) == 10
+    assert result["track_name"].is_unique
+
+
+@patch("pandas.read_csv")
+def test_catalog_reads_csv_once(mock_read_csv, test_songs):
+    mock_read_csv.return_value = test_songs
+
+    # Repeated queries should be served from memory
+    get_all_songs()
+    get_songs_by_genre(5)
+    get_songs_by_genre(5)
+
+    assert mock_read_csv.call_count == 1, "The dataset should only be parsed once."
+
+
+@patch("pandas.read_csv")
+def test_catalog_loads_once_across_threads(mock_read_csv, test_songs):
+    def slow_read_csv(path):
+        time.sleep(0.05)  # give the other threads time to ask for the catalog too
+        return test_songs
+
+    mock_read_csv.side_effect = slow_read_csv
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: get_songs_by_genre(3), range(8)))
+
+    assert (
+        mock_read_csv.call_count == 1
+    ), "Concurrent first uses should share a single load."
+    assert all(len(result) == 3 for result in results)
+
+
 class Tests(unittest.TestCase):
 
     def test_filtered_songs(self):
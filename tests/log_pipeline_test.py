@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.bot_state import BotState
+from src.log_pipeline import (
+    LOGGER_NAME,
+    SamplingFilter,
+    parse_sample_rates,
+    start_logging,
+    stop_logging,
+)
+
+
+def make_ctx(command="queue"):
+    ctx = MagicMock(command_failed=False)
+    ctx.guild.id = 25025
+    ctx.author.name = "user"
+    ctx.command.name = command
+    return ctx
+
+
+class TestLogPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "logs", "enigma.jsonl")
+        self.logger = logging.getLogger(LOGGER_NAME)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def records(self, sample_rates=None, log=lambda: None):
+        listener = start_logging(self.path, sample_rates, console=False)
+        try:
+            with patch.object(BotState, "logger", self.logger):
+                log()
+        finally:
+            stop_logging(listener)
+        with open(self.path, encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_commands_are_written_as_json_with_fields(self):
+        def log():
+            ctx = make_ctx()
+            BotState.log_command(ctx, "Queued song: Song1")
+            BotState.log_outcome(ctx, 0.0123)
+
+        first, second = self.records(log=log)
+
+        self.assertEqual(first["message"], "ENIGMA (user /queue) Queued song: Song1")
+        self.assertEqual(
+            {key: first[key] for key in ("event", "guild", "user", "command")},
+            {"event": "command", "guild": 25025, "user": "user", "command": "queue"},
+        )
+        self.assertEqual(
+            (second["event"], second["latency_ms"], second["outcome"]),
+            ("command_end", 12.3, "ok"),
+        )
+        self.assertFalse(self.logger.handlers)  # stop_logging detached the queue
+
+    def test_frequent_events_are_sampled(self):
+        def log():
+            ctx = make_ctx("next")
+            for _ in range(8):
+                BotState.log_command(ctx, "Finished playing song", event="song_end")
+            BotState.log_command(ctx, "Skipped")
+            self.logger.warning("Resolve failed", extra={"event": "song_end"})
+
+        events = [record["event"] for record in self.records({"song_end": 0.25}, log)]
+
+        self.assertEqual(events, ["song_end", "song_end", "command", "song_end"])
+
+    def test_exceptions_keep_their_traceback(self):
+        def log():
+            try:
+                raise RuntimeError("boom")
+            except RuntimeError:
+                self.logger.exception("Command failed")
+
+        (record,) = self.records(log=log)
+
+        self.assertEqual(record["level"], "ERROR")
+        self.assertIn("RuntimeError: boom", record["exception"])
+
+    def test_sample_rate_parsing(self):
+        self.assertEqual(
+            parse_sample_rates(["song_end=0.1", "command=1"]),
+            {"song_end": 0.1, "command": 1.0},
+        )
+        with self.assertRaises(ValueError):
+            parse_sample_rates(["song_end"])
+        with self.assertRaises(ValueError):
+            SamplingFilter({"song_end": 2})
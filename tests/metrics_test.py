@@ -0,0 +1,100 @@
+import unittest
+import urllib.request
+from unittest.mock import MagicMock
+
+from src.metrics import (
+    Registry,
+    command_finished,
+    command_started,
+    metrics,
+    start_exporter,
+)
+from src.song_queue_cog import FirstPacketTimer
+
+
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = self.registry.histogram(
+            "latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0)
+        )
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.labels("resolve").observe(value)
+
+        self.assertEqual(
+            self.registry.render().splitlines(),
+            [
+                "# HELP latency_seconds Latency.",
+                "# TYPE latency_seconds histogram",
+                'latency_seconds_bucket{stage="resolve",le="0.1"} 2',
+                'latency_seconds_bucket{stage="resolve",le="1.0"} 3',
+                'latency_seconds_bucket{stage="resolve",le="+Inf"} 4',
+                'latency_seconds_sum{stage="resolve"} 3.65',
+                'latency_seconds_count{stage="resolve"} 4',
+            ],
+        )
+
+    def test_counter_and_gauge(self):
+        counter = self.registry.counter(
+            "commands_total", "Commands.", ("command", "status")
+        )
+        counter.labels("queue", "ok").inc()
+        counter.labels("queue", "ok").inc()
+        counter.labels("view", "error").inc()
+        self.registry.gauge("open", "Open sessions.", lambda: {"poll": 2}, ("kind",))
+
+        lines = self.registry.render().splitlines()
+
+        self.assertIn('commands_total{command="queue",status="ok"} 2', lines)
+        self.assertIn('commands_total{command="view",status="error"} 1', lines)
+        self.assertIn('open{kind="poll"} 2', lines)
+        with self.assertRaises(ValueError):
+            counter.labels("queue")
+
+    def test_exporter_serves_metrics(self):
+        self.registry.counter("scrapes_total", "Scrapes.").inc(3)
+        server = start_exporter(0, registry=self.registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        self.assertIn("scrapes_total 3", body.splitlines())
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_command_hooks_count_and_time_commands(self):
+        ctx = MagicMock(command_failed=False)
+        ctx.command.name = "metrics_test_command"
+
+        command_started(ctx)
+        command_finished(ctx)
+
+        rendered = metrics.render()
+        self.assertIn(
+            'enigma_commands_total{command="metrics_test_command",status="ok"} 1',
+            rendered,
+        )
+        self.assertIn(
+            'enigma_command_seconds_count{command="metrics_test_command"} 1', rendered
+        )
+
+    def test_first_packet_timer_fires_once(self):
+        source = MagicMock()
+        source.read.return_value = b"packet"
+        on_first_packet = MagicMock()
+        timer = FirstPacketTimer(source, on_first_packet)
+
+        self.assertEqual(timer.read(), b"packet")
+        timer.read()
+        timer.cleanup()
+
+        on_first_packet.assert_called_once()
+        source.cleanup.assert_called_once()
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import discord
+from discord.ext import commands
+
+from src.bot_state import BotState
+from src.playback import Playback
+from src.song import Song
+from src.song_queue_cog import SongQueueCog
+
+
+class FakeVoiceClient:
+    """
+    Mimics discord.VoiceClient: stopping a track ends its player thread a little later,
+    which then runs the track's "after" callback from that thread.
+    """
+
+    def __init__(self, stop_delay=0.05, fires_after=True):
+        self.stop_delay = stop_delay
+        self.fires_after = fires_after
+        self.after = None
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self.after is not None
+
+    def play(self, source, after):
+        if self.after is not None:
+            raise discord.ClientException("Already playing audio.")
+        self.after = after
+
+    def stop(self):
+        after, self.after = self.after, None
+        if after is not None and self.fires_after:
+            threading.Timer(self.stop_delay, after, args=(None,)).start()
+
+
+class TestPlayback(unittest.IsolatedAsyncioTestCase):
+
+    async def test_end_of_current_generation_advances(self):
+        playback = Playback()
+        generation = playback.begin()
+
+        self.assertTrue(playback.is_playing())
+        self.assertTrue(playback.end(generation))
+        self.assertFalse(playback.is_playing())
+
+    async def test_stale_generation_is_ignored(self):
+        playback = Playback()
+        old = playback.begin()
+        playback.begin()
+
+        self.assertFalse(playback.end(old))
+        self.assertTrue(playback.is_playing())
+
+    async def test_hand_off_does_not_advance(self):
+        playback = Playback()
+        generation = playback.begin()
+        playback.hand_off()
+
+        self.assertFalse(playback.end(generation))
+        self.assertTrue(await playback.wait_idle(0.01))
+
+    async def test_wait_idle_times_out(self):
+        playback = Playback()
+        generation = playback.begin()
+
+        self.assertFalse(await playback.wait_idle(0.01))
+        # the late callback of the track that did not end is ignored
+        self.assertFalse(playback.end(generation))
+
+
+@patch("src.song_queue_cog.discord.FFmpegPCMAudio", MagicMock())
+@patch("src.bot_state.BotState.log_command", MagicMock())
+@patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
+class TestSongTransition(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.bot = commands.Bot(command_prefix="/", intents=discord.Intents.all())
+        self.cog = SongQueueCog(self.bot)
+        await self.bot.add_cog(self.cog)
+        self.cog.prefetcher.resolve = AsyncMock(return_value={"url": "https://example"})
+        self.cog.on_play_query_end = AsyncMock()
+        BotState.guilds.pop(1, None)
+
+    def make_ctx(self, voice_client):
+        ctx = MagicMock()
+        ctx.guild.id = 1
+        ctx.guild.voice_client = voice_client
+        ctx.message.guild.voice_client = voice_client
+        ctx.voice_client = voice_client
+        return ctx
+
+    async def asyncTearDown(self):
+        BotState.guilds.pop(1, None)
+
+    async def test_replacing_a_song_is_fast_and_does_not_advance(
+        self, mock_log_and_send
+    ):
+        voice_client = FakeVoiceClient(stop_delay=0.05)
+        ctx = self.make_ctx(voice_client)
+        await self.cog.play_song(ctx, Song("First"))
+
+        start = time.perf_counter()
+        await self.cog.play_song(ctx, Song("Second"))
+        latency = time.perf_counter() - start
+
+        # bounded by the player's own shutdown, not by a spin loop or the stop timeout
+        self.assertLess(latency, 0.5, f"stop -> next transition took {latency:.3f}s")
+        self.assertEqual(
+            str(BotState.for_guild(ctx.guild).current_song_playing), "Second"
+        )
+        await asyncio.sleep(0.1)
+        self.cog.on_play_query_end.assert_not_called()
+
+    async def test_next_advances_queue(self, mock_log_and_send):
+        voice_client = FakeVoiceClient(stop_delay=0.01)
+        ctx = self.make_ctx(voice_client)
+        await self.cog.play_song(ctx, Song("First"))
+
+        await self.cog.next(ctx)
+        await asyncio.sleep(0.1)
+
+        self.cog.on_play_query_end.assert_called_once()
+
+    @patch("src.playback.STOP_TIMEOUT", 0.05)
+    async def test_transition_bounded_when_callback_never_fires(
+        self, mock_log_and_send
+    ):
+        voice_client = FakeVoiceClient(fires_after=False)
+        ctx = self.make_ctx(voice_client)
+        await self.cog.play_song(ctx, Song("First"))
+
+        start = time.perf_counter()
+        await self.cog.play_song(ctx, Song("Second"))
+
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(
+            str(BotState.for_guild(ctx.guild).current_song_playing), "Second"
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import MagicMock
+
+from src.prefetch import Prefetcher
+from src.resolver import AudioResolver, LookupCancelled
+from src.song import Song
+from src.stream_cache import StreamCache
+
+
+class TestPrefetcher(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.release = threading.Event()
+        self.ytdl = MagicMock()
+        self.ytdl.extract_info.side_effect = self.extract_info
+        self.resolver = AudioResolver(max_workers=2, cache=StreamCache())
+        self.prefetcher = Prefetcher(self.resolver, depth=2)
+
+    async def asyncTearDown(self):
+        self.release.set()
+        self.resolver.shutdown()
+
+    def extract_info(self, query, download):
+        self.release.wait(1.0)
+        return {"entries": [{"id": query, "url": f"https://example/{query}"}]}
+
+    async def test_sync_prefetches_head(self):
+        queue = [Song("A"), Song("B"), Song("C")]
+
+        self.prefetcher.sync(self.ytdl, "guild", queue)
+
+        self.assertEqual(self.prefetcher.pending("guild"), ["a", "b"])
+
+    async def test_sync_cancels_songs_leaving_head(self):
+        queue = [Song("A"), Song("B"), Song("C")]
+        self.prefetcher.sync(self.ytdl, "guild", queue)
+        stale = self.prefetcher._tasks["guild"]["b"]
+
+        # e.g. /move 3 1
+        self.prefetcher.sync(self.ytdl, "guild", [queue[2], queue[0], queue[1]])
+        await asyncio.sleep(0)
+
+        self.assertEqual(self.prefetcher.pending("guild"), ["a", "c"])
+        self.assertTrue(stale.cancelled())
+
+    async def test_invalidate(self):
+        self.prefetcher.sync(self.ytdl, "guild", [Song("A")])
+
+        self.prefetcher.invalidate("guild")
+
+        self.assertEqual(self.prefetcher.pending("guild"), [])
+
+    async def test_resolve_reuses_prefetch(self):
+        self.prefetcher.sync(self.ytdl, "guild", [Song("A")])
+        self.release.set()
+
+        info = await self.prefetcher.resolve(self.ytdl, Song("A"), owner="guild")
+
+        self.assertEqual(info["url"], "https://example/ytsearch:A")
+        self.assertEqual(self.ytdl.extract_info.call_count, 1)
+        self.assertEqual(self.prefetcher.hits, 1)
+        self.assertEqual(self.prefetcher.pending("guild"), [])
+
+    async def test_skip_while_prefetch_is_pending(self):
+        self.prefetcher.sync(self.ytdl, "guild", [Song("A")])
+        prefetch = self.prefetcher._tasks["guild"]["a"]
+        playing = asyncio.ensure_future(
+            self.prefetcher.resolve(self.ytdl, Song("A"), owner="guild")
+        )
+        await asyncio.sleep(0.01)
+
+        # e.g. /next while the song is still loading
+        self.assertTrue(self.resolver.is_resolving("guild"))
+        self.assertTrue(self.resolver.cancel("guild"))
+        with self.assertRaises(LookupCancelled):
+            await playing
+        self.assertEqual(self.prefetcher.hits, 0)
+
+        # the prefetch itself finishes, so its stream is still cached
+        self.release.set()
+        await prefetch
+        self.assertIsNotNone(self.resolver.cache.lookup("a"))
+
+
+if __name__ == "__main__":
+    unittest.main()
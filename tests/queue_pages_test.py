@@ -0,0 +1,124 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import discord
+
+from src.bot_state import BotState, GuildState
+from src.queue_pages import PageCache, QueuePages, page_count, queue_embed, render_page
+from src.sessions import sessions
+from src.song import Song
+from src.song_queue import SongQueue
+from src.song_queue_cog import SongQueueCog
+
+
+def make_queue(size):
+    return SongQueue(Song(f"Song{i}", "Artist") for i in range(1, size + 1))
+
+
+class TestQueuePages(unittest.IsolatedAsyncioTestCase):
+
+    def test_render_page_lists_only_that_page(self):
+        queue = make_queue(25)
+
+        self.assertEqual(page_count(queue), 3)
+        self.assertEqual(page_count(SongQueue()), 1)
+        self.assertEqual(
+            render_page(queue, 2).splitlines(),
+            [f"{i}. Song{i} by Artist" for i in range(21, 26)],
+        )
+
+    def test_long_songs_are_truncated(self):
+        state = GuildState(1)
+        state.song_queue = [Song("x" * 5000)] * 10
+        state.current_song_playing = Song("y" * 5000)
+
+        embed, _ = queue_embed(state)
+
+        self.assertLessEqual(len(embed.description), 4096)
+
+    def test_cache_is_discarded_when_queue_changes(self):
+        queue = make_queue(30)
+        cache = PageCache()
+        with patch("src.queue_pages.render_page", wraps=render_page) as render:
+            first = cache.get(queue, 1)
+            self.assertIs(cache.get(queue, 1), first)
+            self.assertEqual(render.call_count, 1)
+
+            queue.popleft()
+            self.assertTrue(cache.get(queue, 1).startswith("11. Song12"))
+            cache.get(make_queue(30), 1)
+            self.assertEqual(render.call_count, 3)
+
+    async def test_buttons_edit_message_in_place(self):
+        state = GuildState(1)
+        state.song_queue = make_queue(25)
+        pages = QueuePages(state)
+        previous, following = pages.children
+        interaction = MagicMock()
+        interaction.response.edit_message = AsyncMock()
+
+        await following.callback(interaction)
+        self.assertIn(
+            "11. Song11",
+            interaction.response.edit_message.call_args.kwargs["embed"].description,
+        )
+        self.assertIs(interaction.response.edit_message.call_args.kwargs["view"], pages)
+
+        await previous.callback(interaction)
+        await previous.callback(interaction)  # wraps around to the last page
+        self.assertEqual(pages.page, 2)
+        self.assertIn(
+            "Page 3/3",
+            interaction.response.edit_message.call_args.kwargs["embed"].footer.text,
+        )
+
+
+@patch("src.bot_state.BotState.log_command", MagicMock())
+class TestViewCommand(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.cog = SongQueueCog(MagicMock())
+        self.ctx = MagicMock()
+        self.ctx.guild.id = 24024
+        self.ctx.send = AsyncMock()
+        self.state = BotState.for_guild(self.ctx.guild)
+
+    async def asyncTearDown(self):
+        BotState.guilds.pop(24024, None)
+
+    async def test_single_page_has_no_buttons(self):
+        self.state.song_queue = make_queue(3)
+
+        await self.cog.view.callback(self.cog, self.ctx)
+
+        self.assertNotIn("view", self.ctx.send.call_args.kwargs)
+        self.assertIn("3. Song3", self.ctx.send.call_args.kwargs["embed"].description)
+
+    async def test_long_queue_gets_page_buttons(self):
+        self.state.song_queue = make_queue(1000)
+
+        # returns without waiting for clicks
+        await self.cog.view.callback(self.cog, self.ctx)
+        kwargs = self.ctx.send.call_args.kwargs
+        self.assertIsInstance(kwargs["view"], QueuePages)
+        self.assertIn("Page 1/100", kwargs["embed"].footer.text)
+
+        message = self.ctx.send.return_value
+        self.assertIs(sessions.get(message.id), kwargs["view"])
+        sessions.unregister(message.id)
+        kwargs["view"].expire()
+        await kwargs["view"]._removal
+        message.edit.assert_awaited_once_with(view=None)
+
+    async def test_deleted_message_is_left_alone(self):
+        message = MagicMock()
+        message.edit = AsyncMock(
+            side_effect=discord.NotFound(MagicMock(status=404), "Unknown Message")
+        )
+        pages = QueuePages(self.state)
+        pages.message = message
+
+        await pages.on_timeout()
+
+        self.assertTrue(pages.timed_out)
+        message.edit.assert_awaited_once_with(view=None)
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.metrics import metrics
+from src.resolver import AudioResolver, LookupCancelled
+
+
+class TestAudioResolver(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.resolver = AudioResolver(max_workers=2, timeout=1.0)
+
+    async def asyncTearDown(self):
+        self.resolver.shutdown()
+
+    async def test_run_returns_result(self):
+        result = await self.resolver.run(lambda a, b: a + b, 1, 2)
+
+        self.assertEqual(result, 3)
+        self.assertEqual(self.resolver.stats()["completed"], 1)
+        self.assertEqual(self.resolver.in_flight, 0)
+
+    async def test_run_does_not_block_event_loop(self):
+        release = threading.Event()
+        lookup = asyncio.ensure_future(self.resolver.run(release.wait, 1.0))
+
+        # The loop keeps running other work while the lookup is blocked
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.resolver.in_flight, 1)
+        release.set()
+
+        self.assertTrue(await lookup)
+        self.assertEqual(self.resolver.in_flight, 0)
+
+    async def test_run_timeout(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.resolver.run(time.sleep, 0.5, timeout=0.05)
+
+        self.assertEqual(self.resolver.stats()["timed_out"], 1)
+
+    async def test_cancel_owner(self):
+        release = threading.Event()
+        lookup = asyncio.ensure_future(
+            self.resolver.run(release.wait, 1.0, owner="guild")
+        )
+        await asyncio.sleep(0.01)
+
+        self.assertTrue(self.resolver.is_resolving("guild"))
+        self.assertTrue(self.resolver.cancel("guild"))
+        with self.assertRaises(LookupCancelled):
+            await lookup
+        release.set()
+
+        self.assertFalse(self.resolver.is_resolving("guild"))
+        self.assertEqual(self.resolver.stats()["cancelled"], 1)
+
+    async def test_cancelled_caller_is_not_a_skipped_lookup(self):
+        release = threading.Event()
+        lookup = asyncio.ensure_future(
+            self.resolver.run(release.wait, 1.0, owner="guild")
+        )
+        await asyncio.sleep(0.01)
+
+        lookup.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await lookup
+        release.set()
+
+        self.assertFalse(self.resolver.is_resolving("guild"))
+
+    async def test_new_lookup_supersedes_previous(self):
+        release = threading.Event()
+        first = asyncio.ensure_future(
+            self.resolver.run(release.wait, 1.0, owner="guild")
+        )
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(
+            self.resolver.run(lambda: "second", owner="guild")
+        )
+
+        with self.assertRaises(LookupCancelled):
+            await first
+        self.assertEqual(await second, "second")
+        release.set()
+
+    async def test_search_returns_first_entry(self):
+        ytdl = MagicMock()
+        ytdl.extract_info.return_value = {"entries": [{"url": "https://example"}]}
+
+        info = await self.resolver.search(ytdl, "Song by Artist")
+
+        ytdl.extract_info.assert_called_once_with(
+            "ytsearch:Song by Artist", download=False
+        )
+        self.assertEqual(info["url"], "https://example")
+
+    async def test_counters_are_exported(self):
+        await self.resolver.run(lambda: None)
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.resolver.run(time.sleep, 0.5, timeout=0.05)
+
+        with patch("src.resolver._resolver", self.resolver):
+            lines = metrics.render().splitlines()
+
+        self.assertIn("enigma_resolver_in_flight 0", lines)
+        self.assertIn('enigma_resolver_lookups{outcome="completed"} 1', lines)
+        self.assertIn('enigma_resolver_lookups{outcome="timed_out"} 1', lines)
+        self.assertIn('enigma_resolver_lookups{outcome="cache_hits"} 0', lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
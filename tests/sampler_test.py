@@ -0,0 +1,79 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.catalog import SongCatalog
+from src.sampler import GenreSampler, genre_sampler, sample_rows
+
+
+class Tests(unittest.TestCase):
+
+    def test_sample_rows_are_distinct(self):
+        rng = np.random.default_rng(510)
+        rows = np.arange(100, 200)
+
+        sampled = sample_rows(rows, 25, rng)
+
+        self.assertEqual(len(set(sampled.tolist())), 25)
+        self.assertTrue(set(sampled.tolist()) <= set(rows.tolist()))
+        self.assertEqual(len(sample_rows(rows, 1000, rng)), 100)
+
+    def test_one_per_genre_is_uniform_within_genre(self):
+        rng = np.random.default_rng(510)
+        genres = np.array([0, 0, 0, 1, 1, 2])
+        sampler = GenreSampler(np.arange(6), genres, ["Pop", "Rock", "Jazz"])
+
+        counts = np.zeros(6)
+        for _ in range(3000):
+            sampled = sampler.sample(3, rng=rng)
+            self.assertEqual(sorted(genres[sampled].tolist()), [0, 1, 2])
+            counts[sampled] += 1
+
+        # Each row of a genre with k rows represents it about 1/k of the time
+        np.testing.assert_allclose(
+            counts / 3000, [1 / 3, 1 / 3, 1 / 3, 1 / 2, 1 / 2, 1], atol=0.05
+        )
+
+    def test_weights_and_quotas(self):
+        rng = np.random.default_rng(510)
+        genres = np.array([0, 0, 0, 1, 1, 2])
+        weights = np.array([1, 0, 3, 0, 0, 5])
+        sampler = GenreSampler(
+            np.arange(10, 16), genres, ["Pop", "Rock", "Jazz"], weights
+        )
+
+        counts = np.zeros(6)
+        for _ in range(4000):
+            counts[sampler.sample(quotas={"Pop": 1}, rng=rng) - 10] += 1
+        np.testing.assert_allclose(counts / 4000, [0.25, 0, 0.75, 0, 0, 0], atol=0.03)
+
+        # Zero-weight songs are only drawn once the weighted ones run out
+        self.assertEqual(
+            sorted(sampler.sample(quotas={"Pop": 2}, rng=rng).tolist()), [10, 12]
+        )
+        self.assertEqual(
+            sorted(sampler.sample(quotas={"Pop": 3, "Rock": 5}, rng=rng).tolist()),
+            [10, 11, 12, 13, 14],
+        )
+        self.assertEqual(
+            sampler.sample(genre_weights={"Jazz": 1.0}, rng=rng).tolist(), [15]
+        )
+
+    def test_genre_sampler_skips_repeated_songs(self):
+        songs = pd.DataFrame(
+            {
+                "track_name": ["Song1", "song1", "Song2"],
+                "artist_name": ["Artist1", "ARTIST1", "Artist2"],
+                "genre": ["Pop", "Pop", "Rock"],
+                "pop": [10, 90, 50],
+            }
+        )
+        sampler = genre_sampler(SongCatalog.from_frame(songs), weight_column="pop")
+
+        self.assertEqual(len(sampler), 2)
+        self.assertEqual(sorted(sampler.sample(quotas=5).tolist()), [0, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
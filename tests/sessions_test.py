@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+
+from src.sessions import SessionRegistry, TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = TimerWheel(tick=1.0, slots=8, clock=self.clock)
+
+    def test_expires_at_deadline(self):
+        self.wheel.schedule("a", 2.5)
+        self.wheel.schedule("b", 5)
+
+        self.assertEqual(self.wheel.advance(2), [])
+        self.assertEqual(self.wheel.advance(3), ["a"])
+        self.assertEqual(self.wheel.advance(10), ["b"])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_reschedule_and_cancel(self):
+        self.wheel.schedule("a", 2)
+        self.wheel.schedule("b", 2)
+        self.clock.now = 1
+        self.wheel.schedule("a", 4)
+        self.wheel.cancel("b")
+
+        self.assertEqual(self.wheel.advance(3), [])
+        self.assertEqual(self.wheel.advance(5), ["a"])
+
+    def test_deadlines_beyond_one_turn(self):
+        self.wheel.schedule("far", 20)
+        self.wheel.schedule("near", 4)
+
+        self.assertEqual(self.wheel.advance(12), ["near"])
+        self.assertEqual(self.wheel.advance(19), [])
+        self.assertEqual(self.wheel.advance(100), ["far"])
+
+
+class TestSessionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.registry = SessionRegistry(tick=1.0, clock=self.clock)
+
+    def test_routes_by_message_id_and_counts(self):
+        poll, recommend = MagicMock(), MagicMock()
+        self.registry.register(1, poll, 60, kind="poll")
+        self.registry.register(2, recommend, 300, kind="recommend")
+        self.registry.register(3, MagicMock(), 60, kind="poll")
+
+        self.assertIs(self.registry.get(2), recommend)
+        self.assertIsNone(self.registry.get(4))
+        self.assertEqual(self.registry.counts(), {"poll": 2, "recommend": 1})
+
+        self.registry.unregister(3)
+        self.assertEqual(self.registry.counts(), {"poll": 1, "recommend": 1})
+
+    def test_expires_unused_sessions(self):
+        idle, busy = MagicMock(), MagicMock()
+        self.registry.register(1, idle, 60)
+        self.registry.register(2, busy, 60)
+        self.clock.now = 50
+        self.registry.touch(2)
+
+        self.assertEqual(self.registry.expire_due(61), 1)
+        idle.expire.assert_called_once()
+        busy.expire.assert_not_called()
+        self.assertEqual(self.registry.expire_due(111), 1)
+        busy.expire.assert_called_once()
+        self.assertEqual(len(self.registry), 0)
+
+
+class TestSessionRegistryTask(unittest.IsolatedAsyncioTestCase):
+
+    async def test_single_task_expires_sessions(self):
+        registry = SessionRegistry(tick=0.01)
+        sessions = [MagicMock() for _ in range(50)]
+        for message_id, session in enumerate(sessions):
+            registry.register(message_id, session, 0.02)
+
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(len(registry), 0)
+        for session in sessions:
+            session.expire.assert_called_once()
@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+import discord
+
+from src.song import Song
+from src.song_picker import SongPicker
+
+
+def interaction_from(user):
+    interaction = MagicMock(user=user)
+    interaction.response.send_message = AsyncMock()
+    interaction.response.defer = AsyncMock()
+    return interaction
+
+
+class TestSongPicker(unittest.IsolatedAsyncioTestCase):
+
+    async def test_show_offers_one_button_per_song(self):
+        songs = [Song(f"Song{i}", "Artist") for i in range(10)]
+        picker = SongPicker(
+            MagicMock(),
+            songs,
+            AsyncMock(),
+            controls=[("🆕", AsyncMock()), ("⏹️", AsyncMock())],
+        )
+        self.assertEqual(len(picker.children), 12)
+
+        picker.show(songs[:3])
+
+        self.assertEqual(
+            [str(item.emoji) for item in picker.children],
+            ["1️⃣", "2️⃣", "3️⃣", "🆕", "⏹️"],
+        )
+        self.assertEqual(picker.songs, songs[:3])
+
+    async def test_button_picks_current_song(self):
+        on_pick = AsyncMock()
+        user = MagicMock()
+        picker = SongPicker(user, [Song("Old")], on_pick)
+        picker.show([Song("New")])
+        interaction = interaction_from(user)
+
+        await picker.children[0].callback(interaction)
+
+        on_pick.assert_awaited_once_with(interaction, Song("New"))
+
+    async def test_only_command_user_can_click(self):
+        user = MagicMock()
+        picker = SongPicker(user, [Song("Song0")], AsyncMock())
+        stranger = interaction_from(MagicMock())
+
+        self.assertTrue(await picker.interaction_check(interaction_from(user)))
+        self.assertFalse(await picker.interaction_check(stranger))
+        self.assertTrue(stranger.response.send_message.call_args.kwargs["ephemeral"])
+
+    async def test_expire_stops_view_as_timed_out(self):
+        on_close = AsyncMock()
+        picker = SongPicker(
+            MagicMock(), [Song("Song0")], AsyncMock(), on_close=on_close
+        )
+
+        picker.expire()
+        await picker._closing
+
+        self.assertTrue(picker.timed_out)
+        self.assertTrue(picker.is_finished())
+        on_close.assert_awaited_once_with()
+
+    async def test_close_removes_buttons_once(self):
+        on_close = AsyncMock()
+        picker = SongPicker(
+            MagicMock(), [Song("Song0")], AsyncMock(), on_close=on_close
+        )
+        picker.message = MagicMock()
+        picker.message.edit = AsyncMock(
+            side_effect=discord.NotFound(MagicMock(status=404), "Unknown Message")
+        )
+
+        await picker.close()
+        await picker.close()
+
+        picker.message.edit.assert_awaited_once_with(view=None)
+        on_close.assert_awaited_once_with()
+        self.assertFalse(picker.timed_out)
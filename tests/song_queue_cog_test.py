@@ -1,13 +1,28 @@
+import asyncio
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import discord
 
+from src import song_queue_cog
 from src.bot_state import BotState
-from src.song_queue_cog import SongQueueCog
+from src.resolver import LookupCancelled
+from src.song_queue_cog import SongQueueCog, get_ytdl
 from discord.ext import commands
 
 
+class TestGetYtdl(unittest.TestCase):
+    @patch.object(song_queue_cog, "_ytdl", None)
+    @patch("yt_dlp.YoutubeDL")
+    def test_downloader_is_created_once_on_first_use(self, mock_youtube_dl):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            downloaders = list(executor.map(lambda _: get_ytdl(), range(32)))
+
+        mock_youtube_dl.assert_called_once_with(song_queue_cog.ytdl_format_options)
+        self.assertTrue(all(ytdl is downloaders[0] for ytdl in downloaders))
+
+
 class TestSongQueueCog(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
         # Create an actual bot instance for testing
@@ -154,7 +169,7 @@ async def test_leave_not_connected(
             mock_ctx, "I am currently not connected to a voice channel"
         )
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=False)
+    @patch("src.bot_state.GuildState.is_in_use", return_value=False)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_pause_not_playing(self, mock_log_and_send, mock_is_in_use):
         # Mock ctx with bot connected to a voice channel
@@ -168,8 +183,8 @@ async def test_pause_not_playing(self, mock_log_and_send, mock_is_in_use):
             mock_ctx, "I am currently not playing anything"
         )
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=True)
-    @patch("src.bot_state.BotState.is_paused", return_value=True)
+    @patch("src.bot_state.GuildState.is_in_use", return_value=True)
+    @patch("src.bot_state.GuildState.is_paused", return_value=True)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_pause_already_paused(
         self, mock_log_and_send, mock_is_paused, mock_is_in_use
@@ -183,9 +198,9 @@ async def test_pause_already_paused(
         # Ensure log_and_send was called indicating already paused
         mock_log_and_send.assert_called_once_with(mock_ctx, "I am already paused")
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=True)
-    @patch("src.bot_state.BotState.is_paused", return_value=False)
-    @patch("src.bot_state.BotState.pause", new_callable=AsyncMock)
+    @patch("src.bot_state.GuildState.is_in_use", return_value=True)
+    @patch("src.bot_state.GuildState.is_paused", return_value=False)
+    @patch("src.bot_state.GuildState.pause", new_callable=AsyncMock)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_pause_success(
         self, mock_log_and_send, mock_pause, mock_is_paused, mock_is_in_use
@@ -200,7 +215,7 @@ async def test_pause_success(
         mock_pause.assert_called_once_with(mock_ctx.message.guild.voice_client)
         mock_log_and_send.assert_called_once_with(mock_ctx, "Pausing music")
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=False)
+    @patch("src.bot_state.GuildState.is_in_use", return_value=False)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_unpause_not_playing(self, mock_log_and_send, mock_is_in_use):
         # Mock ctx with bot connected to a voice channel
@@ -214,8 +229,8 @@ async def test_unpause_not_playing(self, mock_log_and_send, mock_is_in_use):
             mock_ctx, "I am currently not playing anything"
         )
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=True)
-    @patch("src.bot_state.BotState.is_paused", return_value=False)
+    @patch("src.bot_state.GuildState.is_in_use", return_value=True)
+    @patch("src.bot_state.GuildState.is_paused", return_value=False)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_unpause_already_unpaused(
         self, mock_log_and_send, mock_is_paused, mock_is_in_use
@@ -229,9 +244,9 @@ async def test_unpause_already_unpaused(
         # Ensure log_and_send was called indicating already unpaused
         mock_log_and_send.assert_called_once_with(mock_ctx, "I am already unpaused")
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=True)
-    @patch("src.bot_state.BotState.is_paused", return_value=True)
-    @patch("src.bot_state.BotState.unpause", new_callable=AsyncMock)
+    @patch("src.bot_state.GuildState.is_in_use", return_value=True)
+    @patch("src.bot_state.GuildState.is_paused", return_value=True)
+    @patch("src.bot_state.GuildState.unpause", new_callable=AsyncMock)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_unpause_success(
         self, mock_log_and_send, mock_unpause, mock_is_paused, mock_is_in_use
@@ -246,12 +261,12 @@ async def test_unpause_success(
         mock_unpause.assert_called_once_with(mock_ctx.message.guild.voice_client)
         mock_log_and_send.assert_called_once_with(mock_ctx, "Unpausing music")
 
-    @patch("src.bot_state.BotState.song_queue", new_callable=list)
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
     @patch("src.song_queue_cog.SongQueueCog.ensure_song", return_value="Test Song")
     @patch("src.song_queue_cog.SongQueueCog.insert_song", return_value=True)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_insert_success(
-        self, mock_log_and_send, mock_insert_song, mock_ensure_song, mock_song_queue
+        self, mock_log_and_send, mock_insert_song, mock_ensure_song, mock_guilds
     ):
         # Mock ctx
         mock_ctx = AsyncMock()
@@ -264,12 +279,12 @@ async def test_insert_success(
             mock_ctx, "Inserted song Test Song as track number 1"
         )
 
-    @patch("src.bot_state.BotState.song_queue", new_callable=list)
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
     @patch("src.song_queue_cog.SongQueueCog.ensure_song", return_value="Test Song")
     @patch("src.song_queue_cog.SongQueueCog.insert_song", return_value=False)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_insert_failure(
-        self, mock_log_and_send, mock_insert_song, mock_ensure_song, mock_song_queue
+        self, mock_log_and_send, mock_insert_song, mock_ensure_song, mock_guilds
     ):
         # Mock ctx
         mock_ctx = AsyncMock()
@@ -280,12 +295,12 @@ async def test_insert_failure(
         mock_insert_song.assert_called_once_with(mock_ctx, "1", "Test Song")
         mock_log_and_send.assert_not_called()
 
-    @patch("src.bot_state.BotState.song_queue", new_callable=list)
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
     @patch("src.song_queue_cog.SongQueueCog.ensure_song", return_value="Test Song")
     @patch("src.song_queue_cog.SongQueueCog.insert_song", return_value=True)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_insertfront_success(
-        self, mock_log_and_send, mock_insert_song, mock_ensure_song, mock_song_queue
+        self, mock_log_and_send, mock_insert_song, mock_ensure_song, mock_guilds
     ):
         # Mock ctx
         mock_ctx = AsyncMock()
@@ -298,8 +313,8 @@ async def test_insertfront_success(
             mock_ctx, "Inserted song Test Song as track number 1"
         )
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=True)
-    @patch("src.bot_state.BotState.stop")
+    @patch("src.bot_state.GuildState.is_in_use", return_value=True)
+    @patch("src.bot_state.GuildState.stop")
     async def test_next_when_in_use(self, mock_stop, mock_is_in_use):
         # Mock ctx
         mock_ctx = AsyncMock()
@@ -310,7 +325,7 @@ async def test_next_when_in_use(self, mock_stop, mock_is_in_use):
         # Ensure the stop method was called
         mock_stop.assert_called_once_with(mock_ctx.guild.voice_client)
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=False)
+    @patch("src.bot_state.GuildState.is_in_use", return_value=False)
     @patch("src.song_queue_cog.SongQueueCog.play_next_song", new_callable=AsyncMock)
     async def test_next_when_not_in_use(self, mock_play_next_song, mock_is_in_use):
         # Mock ctx
@@ -322,15 +337,15 @@ async def test_next_when_not_in_use(self, mock_play_next_song, mock_is_in_use):
         # Ensure play_next_song was called
         mock_play_next_song.assert_called_once_with(mock_ctx)
 
-    @patch("src.bot_state.BotState.song_queue", new_callable=list)
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
     @patch("src.song_queue_cog.SongQueueCog.ensure_track_number", return_value=1)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_jumpto_success(
-        self, mock_log_and_send, mock_ensure_track_number, mock_song_queue
+        self, mock_log_and_send, mock_ensure_track_number, mock_guilds
     ):
         # Set up mock context and song queue
         mock_ctx = AsyncMock()
-        mock_song_queue.extend(
+        BotState.for_guild(mock_ctx.guild).song_queue.extend(
             ["Song 1", "Song 2", "Song 3", "Song 4"]
         )  # Add songs to the queue
 
@@ -339,7 +354,7 @@ async def test_jumpto_success(
 
         # Ensure the song queue is updated correctly
         self.assertEqual(
-            BotState.song_queue,
+            BotState.for_guild(mock_ctx.guild).song_queue,
             ["Song 2", "Song 3", "Song 4"],
             "The song queue should start from track 2.",
         )
@@ -362,7 +377,12 @@ async def test_move_success(
         mock_ctx = AsyncMock()
 
         # Mocking initial song queue state
-        BotState.song_queue = ["Song 1", "Song 2", "Song 3", "Song 4"]
+        BotState.for_guild(mock_ctx.guild).song_queue = [
+            "Song 1",
+            "Song 2",
+            "Song 3",
+            "Song 4",
+        ]
 
         # Invoke the command
         await self.cog.move(mock_ctx, params="1 3")  # Move from track 1 to track 3
@@ -383,7 +403,7 @@ async def test_remove_success(self, mock_log_and_send, mock_delete_track):
         mock_ctx = AsyncMock()
 
         # Mocking initial song queue state
-        BotState.song_queue = ["Song 1", "Song 2", "Song 3"]
+        BotState.for_guild(mock_ctx.guild).song_queue = ["Song 1", "Song 2", "Song 3"]
 
         # Invoke the command
         await self.cog.remove(mock_ctx, idx="2")  # Remove track number 2
@@ -394,10 +414,11 @@ async def test_remove_success(self, mock_log_and_send, mock_delete_track):
             mock_ctx, "Removed Song to remove (track number 2)"
         )
 
-    @patch("src.bot_state.BotState.song_queue", new_callable=list)
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
-    async def test_movefront(self, mock_log_and_send, mock_song_queue):
+    async def test_movefront(self, mock_log_and_send, mock_guilds):
         mock_ctx = AsyncMock()
+        mock_song_queue = BotState.for_guild(mock_ctx.guild).song_queue
         mock_song_queue.extend(["Song 1", "Song 2", "Song 3"])  # Initial queue
 
         await self.cog.movefront(mock_ctx, src_idx="2")  # Move "Song 2" to the front
@@ -408,10 +429,11 @@ async def test_movefront(self, mock_log_and_send, mock_song_queue):
             mock_ctx, "Moved Song 2 from track 2 to track 1"
         )
 
-    @patch("src.bot_state.BotState.song_queue", new_callable=list)
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
-    async def test_moveback(self, mock_log_and_send, mock_song_queue):
+    async def test_moveback(self, mock_log_and_send, mock_guilds):
         mock_ctx = AsyncMock()
+        mock_song_queue = BotState.for_guild(mock_ctx.guild).song_queue
         mock_song_queue.extend(["Song 1", "Song 2", "Song 3"])  # Initial queue
 
         await self.cog.moveback(mock_ctx, src_idx="1")  # Move "Song 1" to the back
@@ -422,7 +444,7 @@ async def test_moveback(self, mock_log_and_send, mock_song_queue):
             mock_ctx, "Moved Song 1 from track 1 to track 3"
         )
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=False)
+    @patch("src.bot_state.GuildState.is_in_use", return_value=False)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     async def test_replay_not_playing(self, mock_log_and_send, mock_is_in_use):
         mock_ctx = AsyncMock()
@@ -434,29 +456,71 @@ async def test_replay_not_playing(self, mock_log_and_send, mock_is_in_use):
             mock_ctx, "I am currently not playing any songs"
         )
 
-    @patch("src.bot_state.BotState.is_in_use", return_value=True)
-    @patch("src.bot_state.BotState.is_looping", return_value=False)
-    @patch("src.bot_state.BotState.current_song_playing", new_callable=AsyncMock)
+    @patch("src.bot_state.GuildState.is_in_use", return_value=True)
+    @patch("src.bot_state.GuildState.is_looping", return_value=False)
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
     @patch("src.bot_state.BotState.log_and_send", new_callable=AsyncMock)
     @patch("src.song_queue_cog.SongQueueCog.insert_song", new_callable=AsyncMock)
     async def test_replay_success(
         self,
         mock_insert_song,
         mock_log_and_send,
+        mock_guilds,
         mock_is_looping,
         mock_is_in_use,
-        mock_current_song_playing,
     ):
         mock_ctx = AsyncMock()
-        mock_current_song_playing.return_value = "Current Song"
+        BotState.for_guild(mock_ctx.guild).current_song_playing = "Current Song"
 
         await self.cog.replay(mock_ctx)
 
         # Ensure the song was added to the queue and the correct message was sent
+        mock_insert_song.assert_called_once_with(mock_ctx, 1, "Current Song")
         mock_log_and_send.assert_called_once_with(
             mock_ctx, "Got it, I will add this song to the front of the queue again"
         )
 
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
+    async def test_guilds_have_separate_queues(self, mock_guilds):
+        first_ctx = AsyncMock()
+        second_ctx = AsyncMock()
+
+        await self.cog.insert_song(first_ctx, 1, "Song 1")
+
+        self.assertEqual(BotState.for_guild(first_ctx.guild).song_queue, ["Song 1"])
+        self.assertEqual(BotState.for_guild(second_ctx.guild).song_queue, [])
+
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
+    @patch("src.bot_state.BotState.log_command")
+    async def test_skipped_lookup_stops_loading(self, mock_log_command, mock_guilds):
+        mock_ctx = MagicMock()
+        self.cog.prefetcher.resolve = AsyncMock(side_effect=LookupCancelled)
+
+        await self.cog.play_song(mock_ctx, "Song 1")
+
+        mock_log_command.assert_called_once_with(mock_ctx, "Stopped loading Song 1")
+
+    @patch("src.bot_state.BotState.guilds", new_callable=dict)
+    @patch("src.bot_state.BotState.log_command")
+    async def test_cancelled_command_is_not_swallowed(
+        self, mock_log_command, mock_guilds
+    ):
+        mock_ctx = MagicMock()
+        resolving = asyncio.Event()
+
+        async def resolve(*args, **kwargs):
+            resolving.set()
+            await asyncio.Event().wait()
+
+        self.cog.prefetcher.resolve = resolve
+        task = asyncio.create_task(self.cog.play_song(mock_ctx, "Song 1"))
+        await resolving.wait()
+        task.cancel()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        mock_log_command.assert_not_called()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,84 @@
+import random
+import unittest
+
+from src.song_queue import SongQueue
+
+
+class Tests(unittest.TestCase):
+
+    def test_list_operations(self):
+        queue = SongQueue(["Song 1", "Song 2", "Song 3"])
+
+        queue.insert(1, "Song 4")
+        queue.append("Song 5")
+
+        self.assertEqual(queue, ["Song 1", "Song 4", "Song 2", "Song 3", "Song 5"])
+        self.assertEqual(queue[1], "Song 4")
+        self.assertEqual(queue[-1], "Song 5")
+        self.assertEqual(queue[1:3], ["Song 4", "Song 2"])
+        self.assertEqual(queue.pop(2), "Song 2")
+        self.assertEqual(queue.popleft(), "Song 1")
+        self.assertEqual(queue, ["Song 4", "Song 3", "Song 5"])
+
+    def test_move_and_drop_front(self):
+        queue = SongQueue(["Song 1", "Song 2", "Song 3", "Song 4"])
+
+        queue.move(0, 2)
+        self.assertEqual(queue, ["Song 2", "Song 3", "Song 1", "Song 4"])
+
+        queue.drop_front(2)
+        self.assertEqual(queue, ["Song 1", "Song 4"])
+
+    def test_out_of_range(self):
+        queue = SongQueue(["Song 1"])
+
+        with self.assertRaises(IndexError):
+            queue[1]
+        with self.assertRaises(IndexError):
+            queue.pop(3)
+        queue.popleft()
+        with self.assertRaises(IndexError):
+            queue.popleft()
+
+    def test_version_changes_on_mutation(self):
+        queue = SongQueue(["Song 1", "Song 2"])
+        version = queue.version
+
+        queue.shuffle()
+
+        self.assertGreater(queue.version, version)
+        self.assertEqual(sorted(queue), ["Song 1", "Song 2"])
+
+    def test_matches_list_under_random_operations(self):
+        rng = random.Random(510)
+        expected = list(range(50))
+        queue = SongQueue(expected)
+
+        for song in range(50, 2050):
+            op = rng.random()
+            if op < 0.4:
+                idx = rng.randint(0, len(expected))
+                expected.insert(idx, song)
+                queue.insert(idx, song)
+            elif op < 0.6 and expected:
+                idx = rng.randrange(len(expected))
+                self.assertEqual(queue.pop(idx), expected.pop(idx))
+            elif op < 0.8 and expected:
+                self.assertEqual(queue.popleft(), expected.pop(0))
+            elif op < 0.95 and expected:
+                src, dest = rng.randrange(len(expected)), rng.randrange(len(expected))
+                expected.insert(dest, expected.pop(src))
+                queue.move(src, dest)
+            else:
+                count = rng.randint(0, 3)
+                expected = expected[count:]
+                queue.drop_front(count)
+
+            self.assertEqual(len(queue), len(expected))
+
+        self.assertEqual(queue, expected)
+        self.assertEqual([queue[i] for i in range(len(expected))], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import pickle
+import unittest
+from unittest.mock import patch
+
+import pandas as pd
+
+from src import song as song_module
+from src.song import Song
+
+
+def songs_frame():
+    return pd.DataFrame(
+        {
+            "track_name": ["Song0", "Song1"],
+            "artist": ["Artist0", "Artist1"],
+            "genre": ["Pop", "Rock"],
+        }
+    )
+
+
+class Tests(unittest.TestCase):
+
+    def test_str(self):
+        self.assertEqual(str(Song("Song0", "Artist0", "Pop")), "Song0 by Artist0")
+        self.assertEqual(str(Song("Song0")), "Song0")
+
+    def test_immutable(self):
+        song = Song("Song0", "Artist0", "Pop")
+
+        with self.assertRaises(AttributeError):
+            song.track_name = "Song1"
+        with self.assertRaises(AttributeError):
+            song.extra = 1
+
+    def test_from_row_reads_catalog_lazily(self):
+        songs = songs_frame()
+        song = Song.from_row(songs, 1, artist_column="artist")
+        songs.loc[1, "track_name"] = "Renamed"  # not read yet
+
+        self.assertEqual(song.row, 1)
+        self.assertEqual(
+            (song.track_name, song.artist_name, song.genre),
+            ("Renamed", "Artist1", "Rock"),
+        )
+
+    def test_equal_songs_dedupe_in_sets(self):
+        songs = songs_frame()
+        from_row = Song.from_row(songs, 0, artist_column="artist")
+        same = Song("Song0", "Artist0", "Jazz")
+
+        self.assertEqual(from_row, same)
+        self.assertEqual(hash(from_row), hash(same))
+        self.assertNotEqual(from_row, Song("Song0", "Artist1"))
+        self.assertEqual(
+            len({from_row, same, Song.from_row(songs, 0, artist_column="artist")}), 1
+        )
+
+    def test_pickles_by_details(self):
+        song = Song.from_row(songs_frame(), 0, artist_column="artist")
+
+        copy = pickle.loads(pickle.dumps(song))
+
+        self.assertEqual(
+            (copy.track_name, copy.artist_name, copy.genre), ("Song0", "Artist0", "Pop")
+        )
+        self.assertIsNone(copy.row)
+
+    def test_equal_up_to_case_and_spacing(self):
+        self.assertEqual(Song("Hello  World", "ADELE "), Song("hello world", "Adele"))
+        self.assertNotEqual(Song("Hello"), Song("Hello", "Adele"))
+
+    def test_membership_normalizes_each_song_once(self):
+        songs = [Song(f"Song{i}", f"Artist{i}") for i in range(100)]
+
+        with patch.object(
+            song_module, "song_key", wraps=song_module.song_key
+        ) as song_key:
+            seen = set(songs)
+            for _ in range(10):
+                for song in songs:
+                    self.assertIn(song, seen)
+                self.assertNotIn(Song("Song0", "Artist1"), seen)
+
+        self.assertEqual(song_key.call_count, 100 + 10)
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.bot_state import BotState, GuildState
+from src.song import Song
+from src.song_queue_cog import SongQueueCog
+from src.state_store import StateStore
+
+
+class TestStateStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "state.sqlite3")
+        self.store = StateStore(self.path, delay=0.01)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def test_round_trip_puts_current_song_first(self):
+        state = GuildState(7)
+        state.song_queue = [Song("B", "Artist", "Pop"), Song("C")]
+        state.current_song_playing = Song("A", "Artist", "Rock")
+        state.set_is_looping(True)
+
+        self.store.mark_dirty(state)  # no event loop: written right away
+        restored = StateStore(self.path).load_all()
+
+        self.assertEqual(list(restored), [7])
+        self.assertEqual(
+            list(restored[7].song_queue),
+            [Song("A", "Artist"), Song("B", "Artist"), Song("C")],
+        )
+        self.assertEqual(restored[7].song_queue[0].genre, "Rock")
+        self.assertIsNone(restored[7].current_song_playing)
+        self.assertTrue(restored[7].is_looping())
+
+    def test_forget_deletes_snapshot(self):
+        self.store.mark_dirty(GuildState(1))
+        self.store.mark_dirty(GuildState(2))
+
+        self.store.forget(1)
+
+        self.assertEqual(list(self.store.load_all()), [2])
+
+    async def test_changes_are_debounced_into_one_flush(self):
+        states = [GuildState(guild_id) for guild_id in range(3)]
+        with patch.object(self.store, "flush", wraps=self.store.flush) as flush:
+            for _ in range(100):
+                for state in states:
+                    state.song_queue.append(Song("Song"))
+                    self.store.mark_dirty(state)
+            self.assertEqual(self.store.load_all(), {})
+
+            await asyncio.sleep(0.05)
+
+        flush.assert_called_once()
+        restored = self.store.load_all()
+        self.assertEqual(
+            [len(restored[guild_id].song_queue) for guild_id in range(3)],
+            [100, 100, 100],
+        )
+
+    async def test_flush_waits_for_changes_to_settle(self):
+        store = StateStore(
+            os.path.join(self.directory.name, "settle.sqlite3"),
+            delay=0.05,
+            max_delay=0.15,
+        )
+        state = GuildState(1)
+        with patch.object(store, "flush", wraps=store.flush) as flush:
+            for _ in range(3):
+                store.mark_dirty(state)
+                await asyncio.sleep(0.03)
+            flush.assert_not_called()  # every change moved the flush back
+
+            for _ in range(5):
+                store.mark_dirty(state)
+                await asyncio.sleep(0.03)
+            flush.assert_called_once()  # but not past the maximum delay
+        store.close()
+
+    def test_failed_flush_keeps_snapshots(self):
+        self.store.mark_dirty(GuildState(3))
+        saved, newer = GuildState(1), GuildState(1)
+        self.store._dirty.update({1: saved, 2: GuildState(2)})
+        self.store._forgotten.add(3)
+        db = self.store._db
+
+        def locked(sql, *args):
+            if sql == "BEGIN":
+                self.store._dirty[1] = newer  # a change made while the transaction ran
+                raise sqlite3.OperationalError("database is locked")
+            return db.execute(sql, *args)
+
+        with patch.object(
+            self.store,
+            "_db",
+            MagicMock(wraps=db, execute=MagicMock(side_effect=locked)),
+        ):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.store.flush()
+
+        self.assertIs(self.store._dirty[1], newer)
+        self.assertEqual(sorted(self.store._dirty), [1, 2])
+        self.assertEqual(self.store._forgotten, {3})
+        self.store.flush()
+        self.assertEqual(sorted(self.store.load_all()), [1, 2])
+
+    @patch("src.state_store.RETRY_DELAY", 0.02)
+    async def test_failed_flush_is_retried(self):
+        db = self.store._db
+        failures = []
+
+        def locked_once(sql, *args):
+            if sql == "BEGIN" and not failures:
+                failures.append(sql)
+                raise sqlite3.OperationalError("database is locked")
+            return db.execute(sql, *args)
+
+        with patch.object(
+            self.store,
+            "_db",
+            MagicMock(wraps=db, execute=MagicMock(side_effect=locked_once)),
+        ):
+            self.store._dirty[1] = GuildState(1)
+            with self.assertRaises(sqlite3.OperationalError):
+                self.store.flush()
+            await asyncio.sleep(0.05)  # no further change comes along
+
+        self.assertEqual(failures, ["BEGIN"])
+        self.assertEqual(list(self.store.load_all()), [1])
+
+    async def test_queue_commands_persist_state(self):
+        ctx = MagicMock()
+        ctx.guild.id = 21021
+        with patch.object(BotState, "store", self.store):
+            await SongQueueCog.insert_song(ctx, 1, Song("First"))
+            await SongQueueCog.insert_song(ctx, 2, Song("Second"))
+            await SongQueueCog.delete_track(ctx, 1)
+            self.store.flush()
+
+        self.assertEqual(
+            list(self.store.load_all()[21021].song_queue), [Song("Second")]
+        )
+
+    def test_eviction_keeps_saved_queues(self):
+        queued, empty = GuildState(1), GuildState(2)
+        queued.song_queue = [Song("Song")]
+        for state in (queued, empty):
+            self.store.mark_dirty(state)
+            state.last_used = 0.0
+
+        with (
+            patch.object(BotState, "store", self.store),
+            patch.object(BotState, "guilds", {1: queued, 2: empty}),
+        ):
+            BotState.evict_idle(max_idle=50.0, now=120.0)
+            self.assertEqual(list(BotState.guilds), [1])
+
+        self.assertEqual(list(self.store.load_all()), [1])
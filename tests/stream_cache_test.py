@@ -0,0 +1,134 @@
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+from src.resolver import AudioResolver
+from src.stream_cache import StreamCache, normalize_query, url_expiry
+
+
+def stream_url(expire):
+    return f"https://rr1.googlevideo.com/videoplayback?expire={expire}&id=abc"
+
+
+class TestStreamCache(unittest.TestCase):
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  Hello   by ADELE "), "hello by adele")
+
+    def test_url_expiry(self):
+        self.assertEqual(url_expiry(stream_url(1700000000)), 1700000000.0)
+        self.assertEqual(url_expiry("https://example.com/audio", now=100.0), 3700.0)
+
+    def test_entries_honor_expiry(self):
+        cache = StreamCache(refresh_margin=60)
+        cache.put("Hello by Adele", {"id": "vid", "url": stream_url(1000)})
+        entry = cache.lookup("hello by adele")
+
+        self.assertTrue(entry.is_fresh(900, cache.refresh_margin))
+        # Within the refresh margin the URL is still playable, but due for a refresh
+        self.assertFalse(entry.is_fresh(950, cache.refresh_margin))
+        self.assertTrue(entry.is_playable(950))
+        self.assertFalse(entry.is_playable(1001))
+
+    def test_invalidate_keeps_video_id(self):
+        cache = StreamCache()
+        cache.put("a", {"id": "1", "url": stream_url(4102444800)})
+
+        cache.invalidate("a")
+
+        self.assertEqual(cache.lookup("a").video_id, "1")
+        self.assertFalse(cache.lookup("a").is_playable(0))
+
+    def test_lru_eviction(self):
+        cache = StreamCache(max_entries=2)
+        cache.put("a", {"id": "1", "url": stream_url(1000)})
+        cache.put("b", {"id": "2", "url": stream_url(1000)})
+        cache.lookup("a")  # "b" is now the least recently used
+        cache.put("c", {"id": "3", "url": stream_url(1000)})
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.lookup("b"))
+        self.assertEqual(cache.lookup("a").video_id, "1")
+
+    def test_persists_video_ids(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "streams.json")
+            cache = StreamCache(path=path)
+            cache.put("a", {"id": "1", "url": stream_url(1000)})
+            cache.save()
+
+            restored = StreamCache(path=path)
+            self.assertEqual(restored.lookup("a").video_id, "1")
+            self.assertFalse(restored.lookup("a").is_playable(0))
+
+    def test_concurrent_saves_do_not_collide(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "streams.json")
+            cache = StreamCache(path=path)
+            for i in range(50):
+                cache.put(str(i), {"id": str(i), "url": stream_url(1000)})
+
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                for future in [pool.submit(cache.save) for _ in range(32)]:
+                    future.result()
+
+            self.assertEqual(len(StreamCache(path=path)), 50)
+            self.assertEqual(os.listdir(directory), ["streams.json"])
+
+
+class TestResolverCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cache = StreamCache()
+        self.resolver = AudioResolver(max_workers=1, cache=self.cache)
+        self.ytdl = MagicMock()
+
+    async def asyncTearDown(self):
+        self.resolver.shutdown()
+
+    async def test_second_search_is_cached(self):
+        self.ytdl.extract_info.return_value = {
+            "entries": [{"id": "vid", "url": stream_url(4102444800)}]
+        }
+
+        await self.resolver.search(self.ytdl, "Song by Artist")
+        info = await self.resolver.search(self.ytdl, "song by artist")
+
+        self.assertEqual(info["id"], "vid")
+        self.ytdl.extract_info.assert_called_once()
+        self.assertEqual(self.resolver.stats()["cache_hits"], 1)
+
+    async def test_expired_stream_resolved_by_id(self):
+        self.cache.put("Song by Artist", {"id": "vid", "url": stream_url(1)})
+        self.ytdl.extract_info.return_value = {
+            "id": "vid",
+            "url": stream_url(4102444800),
+        }
+
+        await self.resolver.search(self.ytdl, "Song by Artist")
+
+        self.ytdl.extract_info.assert_called_once_with(
+            "https://www.youtube.com/watch?v=vid", download=False
+        )
+
+    async def test_failed_stream_is_extracted_again(self):
+        self.ytdl.extract_info.return_value = {
+            "entries": [{"id": "vid", "url": stream_url(4102444800)}]
+        }
+        await self.resolver.search(self.ytdl, "Song by Artist")
+        self.ytdl.extract_info.return_value = {
+            "id": "vid",
+            "url": stream_url(4102444800),
+        }
+
+        self.resolver.invalidate("Song by Artist")
+        await self.resolver.search(self.ytdl, "Song by Artist")
+
+        self.ytdl.extract_info.assert_called_with(
+            "https://www.youtube.com/watch?v=vid", download=False
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
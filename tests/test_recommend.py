@@ -2,7 +2,11 @@
 from src.get_all import get_all_songs
 from src.bot_state import BotState
 from src.recommend_cog import RecommendCog
+from src.catalog import SONGS_CSV, SongCatalog, reset_catalogs, use_catalog
+from src.recommender import FEATURE_COLUMNS, recommend_by_features, select_rows
+import asyncio
 import pytest
+import numpy as np
 import pandas as pd
 from unittest.mock import AsyncMock, patch, MagicMock
 import sys
@@ -61,6 +65,15 @@ def songs_df():
     )
 
 
+# Serve the fixture songs from the catalog instead of the dataset on disk
+@pytest.fixture(autouse=True)
+def catalog_songs(songs_df):
+    reset_catalogs()
+    with patch("pandas.read_csv", return_value=songs_df):
+        yield
+    reset_catalogs()
+
+
 # Test to check if empty recommendation list is returned when no poll song is selected
 def test_generate_recommendations_zero_songs(recommend_cog, songs_df):
     selected_songs = []
@@ -80,8 +93,9 @@ def test_generate_recommendations_one_song(mock_get_all_songs, recommend_cog, so
     recommendations = recommend_cog.generate_recommendations(selected_songs)
 
     # Check if recommendations are generated correctly
-    assert all(isinstance(song, Song)
-               for song in recommendations), "All recommendations should be Song objects"
+    assert all(
+        isinstance(song, Song) for song in recommendations
+    ), "All recommendations should be Song objects"
 
 
 # Test to ensure artist appearance limit is respected
@@ -92,7 +106,9 @@ def test_artist_limit_in_recommendations(recommend_cog, songs_df):
     artist_counts = {}
     for song in recommendations:
         artist_counts[song.artist_name] = artist_counts.get(song.artist_name, 0) + 1
-        assert artist_counts[song.artist_name] <= 2, "Artist should not appear more than twice"
+        assert (
+            artist_counts[song.artist_name] <= 2
+        ), "Artist should not appear more than twice"
 
 
 # Test to ensure that no artists from selected songs are recommended
@@ -104,7 +120,9 @@ def test_exclude_selected_artists(recommend_cog, songs_df):
     recommendations = recommend_cog.generate_recommendations(selected_songs)
     for song in recommendations:
         assert song.artist_name not in [
-            "Artist3", "Artist5"], "Selected artists should not appear in recommendations"
+            "Artist3",
+            "Artist5",
+        ], "Selected artists should not appear in recommendations"
 
 
 # Test to verify that the recommendations do not include duplicate songs
@@ -119,12 +137,15 @@ def test_recommendation_uniqueness(recommend_cog, songs_df):
 
 # Test the response when there aren't enough songs in the dataset
 @patch("src.get_all.get_all_songs")
-def test_insufficient_songs_for_recommendations(mock_get_all_songs, recommend_cog, songs_df):
+def test_insufficient_songs_for_recommendations(
+    mock_get_all_songs, recommend_cog, songs_df
+):
     mock_get_all_songs.return_value = songs_df.head(5)  # only 5 songs available
     selected_songs = [Song(track_name="Song1", artist_name="Artist1", genre="Pop")]
     recommendations = recommend_cog.generate_recommendations(selected_songs)
-    assert len(
-        recommendations) < 10, "Should return fewer recommendations due to insufficient data"
+    assert (
+        len(recommendations) < 10
+    ), "Should return fewer recommendations due to insufficient data"
 
 
 # Ensure that recommendations do not exceed the maximum limit of 10
@@ -136,7 +157,18 @@ def test_max_recommendation_limit(recommend_cog, songs_df):
 
 # Define a function to test mapping emojis to song indices
 def map_emojis_to_songs(song_list):
-    number_emojis = ["1️⃣", "2️⃣", "3️⃣", "4️⃣", "5️⃣", "6️⃣", "7️⃣", "8️⃣", "9️⃣", "🔟"]
+    number_emojis = [
+        "1️⃣",
+        "2️⃣",
+        "3️⃣",
+        "4️⃣",
+        "5️⃣",
+        "6️⃣",
+        "7️⃣",
+        "8️⃣",
+        "9️⃣",
+        "🔟",
+    ]
     return {
         emoji: song_list[index]
         for index, emoji in enumerate(number_emojis[: len(song_list)])
@@ -160,4 +192,200 @@ def test_emoji_song_mapping():
         "2️⃣": Song("Song2", "Artist2", "Rock"),
         "3️⃣": Song("Song3", "Artist3", "Jazz"),
     }
-    # assert emoji_song_map == expected_map, "Emoji to song mapping should match the expected output."
+    assert (
+        emoji_song_map == expected_map
+    ), "Emoji to song mapping should match the expected output."
+
+
+# Test that duplicate rows are skipped without counting towards the artist limit
+def test_select_rows_skips_duplicates_and_caps_artists():
+    songs = pd.DataFrame(
+        {
+            "track_name": ["A", "A", "B", "C", "D", "E"],
+            "artist_name": ["X", "X", "X", "X", "Y", "Y"],
+            "genre": ["Pop"] * 6,
+        }
+    )
+    picked = select_rows(songs, np.arange(6), limit=10, artist_limit=2)
+    assert list(picked) == [0, 2, 4, 5]
+
+
+# Test that, given the catalog's song codes, songs differing only in capitalization and
+# spacing are duplicates
+def test_select_rows_dedupes_normalized_songs():
+    songs = pd.DataFrame(
+        {
+            "track_name": ["Song A", "song  a", "Song B"],
+            "artist_name": ["X", "x ", "X"],
+            "genre": ["Pop"] * 3,
+        }
+    )
+    song_codes = SongCatalog.from_frame(songs).song_index().codes
+    assert list(select_rows(songs, np.arange(3), song_codes=song_codes)) == [0, 2]
+
+
+def click_interaction(user):
+    interaction = MagicMock(user=user)
+    interaction.response.send_message = AsyncMock()
+    interaction.response.edit_message = AsyncMock()
+    interaction.response.defer = AsyncMock()
+    return interaction
+
+
+async def sent_view(ctx):
+    """Waits for the command under test to send its message, and returns the view sent
+    with it."""
+    while not any("view" in call.kwargs for call in ctx.send.call_args_list):
+        await asyncio.sleep(0)
+    return next(
+        call.kwargs["view"] for call in ctx.send.call_args_list if "view" in call.kwargs
+    )
+
+
+# Test that clicking the same number twice selects the song once, and that the poll is
+# sent in one message
+def test_poll_ignores_repeated_clicks(recommend_cog):
+    ctx = MagicMock()
+    ctx.send = AsyncMock()
+    ctx.guild = MagicMock(id=18018)
+
+    async def run():
+        # the command returns once the poll is sent, without waiting for clicks
+        await recommend_cog.poll.callback(recommend_cog, ctx)
+        view = await sent_view(ctx)
+        first = view.children[0]
+        await first.callback(click_interaction(ctx.author))
+        await first.callback(click_interaction(ctx.author))
+        await view.close()
+        return view
+
+    view = asyncio.run(run())
+
+    assert len(BotState.for_guild(ctx.guild).song_queue) == 1
+    assert ctx.send.call_args_list[0].kwargs["view"] is view
+    assert ctx.send.call_args_list[-1].kwargs["embed"].title == "Selected Songs"
+    ctx.send.return_value.edit.assert_awaited_once_with(view=None)
+    ctx.send.return_value.add_reaction.assert_not_called()
+
+
+# Test that a poll nobody answers reports it once its session expires
+def test_poll_reports_no_selection_on_expiry(recommend_cog):
+    ctx = MagicMock()
+    ctx.send = AsyncMock()
+    ctx.guild = MagicMock(id=22022)
+
+    async def run():
+        await recommend_cog.poll.callback(recommend_cog, ctx)
+        view = await sent_view(ctx)
+        view.expire()
+        await view._closing
+        return view
+
+    view = asyncio.run(run())
+
+    assert view.timed_out
+    ctx.send.assert_awaited_with("No songs were selected.")
+
+
+# Test that new recommendations are shown in the same message with the same view
+def test_recommend_reuses_view_on_refresh(recommend_cog):
+    ctx = MagicMock()
+    ctx.send = AsyncMock()
+    ctx.guild = MagicMock(id=19019)
+    BotState.for_guild(ctx.guild).song_queue = [Song("Song1", "Artist1", "Pop")]
+    recommend_cog.generate_recommendations = MagicMock(
+        side_effect=[
+            [Song("Song4", "Artist4", "Pop")],
+            [Song("Song2", "Artist2", "Rock")],
+        ]
+    )
+
+    async def run():
+        recommend = asyncio.create_task(
+            recommend_cog.recommend.callback(recommend_cog, ctx)
+        )
+        view = await sent_view(ctx)
+        shown = list(view.songs)
+        interaction = click_interaction(ctx.author)
+        await view.children[-2].callback(interaction)  # 🆕
+        await view.children[-1].callback(click_interaction(ctx.author))  # ⏹️
+        await recommend
+        return view, shown, interaction
+
+    view, shown, interaction = asyncio.run(run())
+
+    assert interaction.response.edit_message.call_args.kwargs["view"] is view
+    assert not set(view.songs) & set(shown)
+    ctx.send.return_value.clear_reactions.assert_not_called()
+
+
+# Test that only the requested number of rows is picked, in candidate order
+def test_select_rows_limit():
+    songs = pd.DataFrame(
+        {
+            "track_name": [f"Song{i}" for i in range(100)],
+            "artist_name": [f"Artist{i}" for i in range(100)],
+            "genre": ["Pop"] * 100,
+        }
+    )
+    picked = select_rows(songs, np.arange(99, -1, -1), limit=10)
+    assert list(picked) == list(range(99, 89, -1))
+
+
+# A songs.csv-shaped catalog where song i sits at distance i from song 0 on every
+# feature
+@pytest.fixture
+def feature_catalog():
+    songs = pd.DataFrame(
+        {
+            "track_name": [f"Song{i}" for i in range(30)],
+            "artist": [f"Artist{i // 3}" for i in range(30)],
+            "genre": ["Pop"] * 30,
+        }
+    )
+    for offset, feature in enumerate(FEATURE_COLUMNS):
+        songs[feature] = np.arange(30) * (offset + 1)
+    catalog = SongCatalog.from_frame(songs)
+    use_catalog(catalog, SONGS_CSV)
+    return catalog
+
+
+# Test that the songs closest to the selection are recommended first, two per artist at
+# most
+@pytest.mark.parametrize("metric", ["euclidean", "cosine"])
+def test_feature_recommendations_rank_closest(feature_catalog, metric):
+    recommendations = recommend_by_features(
+        feature_catalog, [Song("Song0", "Artist0", "Pop")], metric
+    )
+    if metric == "euclidean":
+        assert [song.track_name for song in recommendations][:4] == [
+            "Song3",
+            "Song4",
+            "Song6",
+            "Song7",
+        ]
+    artists = [song.artist_name for song in recommendations]
+    assert "Artist0" not in artists
+    assert max(artists.count(artist) for artist in artists) <= 2
+    assert len(recommendations) == 10
+
+
+# Test that /recommend euclidean skips songs it recommended before
+def test_feature_recommendations_exclude_shown_songs(recommend_cog, feature_catalog):
+    selected = [Song("Song0", "Artist0", "Pop")]
+    first = recommend_cog.generate_recommendations(selected, "euclidean")
+    second = recommend_cog.generate_recommendations(
+        selected, "euclidean", exclude_songs=first
+    )
+
+    assert {song.track_name for song in first}.isdisjoint(
+        song.track_name for song in second
+    )
+
+
+# Test that selections missing from songs.csv fall back to genre matching
+def test_feature_recommendations_fall_back_to_genre(recommend_cog, feature_catalog):
+    selected = [Song("Song1", "Artist1", "Pop")]  # only in the genre catalog
+    recommendations = recommend_cog.generate_recommendations(selected, "cosine")
+
+    assert [song.genre for song in recommendations] == ["Pop"]